@@ -0,0 +1,167 @@
+import argparse
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+
+from dotenv import load_dotenv
+
+from services.log import setup_logging
+from services.sharding import split_shards
+
+log = logging.getLogger("luma.launcher")
+
+GATEWAY_URL = "https://discord.com/api/v10/gateway/bot"
+
+# Discord allows one IDENTIFY per max_concurrency shards every 5 seconds
+IDENTIFY_INTERVAL = 5
+
+BOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Luma rate limits are for the whole account, so each process gets its share
+SHARED_RATE_LIMITS = ("LUMA_RATE_LIMIT_CREATE", "LUMA_RATE_BURST_CREATE",
+                      "LUMA_RATE_LIMIT_STATUS", "LUMA_RATE_BURST_STATUS")
+RATE_LIMIT_DEFAULTS = {"LUMA_RATE_LIMIT_CREATE": 1, "LUMA_RATE_BURST_CREATE": 5,
+                       "LUMA_RATE_LIMIT_STATUS": 10, "LUMA_RATE_BURST_STATUS": 20}
+
+
+def recommended_shards(token: str) -> tuple:
+    """Shard count Discord recommends for the bot and how many shards may identify at once"""
+    request = urllib.request.Request(GATEWAY_URL, headers={
+        "Authorization": f"Bot {token}",
+        "User-Agent": "luma-discord-bot launcher"
+    })
+    with urllib.request.urlopen(request, timeout=30) as response:
+        data = json.load(response)
+    return data["shards"], data.get("session_start_limit", {}).get("max_concurrency", 1)
+
+
+def process_env(index: int, processes: int, shard_count: int, shard_ids: list) -> dict:
+    """Environment for one bot process: its shards, its own ports and its share of shared limits"""
+    env = dict(os.environ)
+    env["LUMA_SHARD_COUNT"] = str(shard_count)
+    env["LUMA_SHARD_IDS"] = ",".join(map(str, shard_ids))
+    # One process registering the commands is enough
+    if index > 0:
+        env["LUMA_SYNC_COMMANDS"] = "0"
+
+    for name in SHARED_RATE_LIMITS:
+        value = float(env.get(name, RATE_LIMIT_DEFAULTS[name]))
+        if value > 0:
+            share = value / processes
+            env[name] = str(max(1, int(share)) if name.startswith("LUMA_RATE_BURST") else share)
+
+    if env.get("LUMA_METRICS_PORT"):
+        env["LUMA_METRICS_PORT"] = str(int(env["LUMA_METRICS_PORT"]) + index)
+    if env.get("LUMA_CALLBACK_PUBLIC_URL"):
+        port = int(env.get("LUMA_CALLBACK_PORT", 8080)) + index
+        env["LUMA_CALLBACK_PORT"] = str(port)
+        env["LUMA_CALLBACK_PUBLIC_URL"] = env["LUMA_CALLBACK_PUBLIC_URL"].replace("{port}", str(port))
+    if "LUMA_IMAGE_WORKERS" not in env:
+        env["LUMA_IMAGE_WORKERS"] = str(max(1, min(4, (os.cpu_count() or 1) // processes)))
+    return env
+
+
+class ShardProcess:
+    """One bot process running a group of shards, restarted with backoff if it exits"""
+
+    def __init__(self, index: int, shard_ids: list, env: dict):
+        self.index = index
+        self.shard_ids = shard_ids
+        self.env = env
+        self.process = None
+        self.started_at = 0
+        self.restart_at = 0
+        self.backoff = 5
+
+    def start(self):
+        self.process = subprocess.Popen([sys.executable, os.path.join(BOT_DIR, "lumadisc.py")], env=self.env, cwd=BOT_DIR)
+        self.started_at = time.monotonic()
+        log.info("Started process", extra={"process_index": self.index, "shard_ids": self.shard_ids, "pid": self.process.pid})
+
+    def check(self, now: float):
+        """Restart the process if it has exited and its backoff has passed"""
+        if self.process is None:
+            if now >= self.restart_at:
+                self.start()
+            return
+        code = self.process.poll()
+        if code is None:
+            return
+        # A process that ran for a while gets a quick restart; one that keeps crashing backs off
+        self.backoff = 5 if now - self.started_at > 300 else min(self.backoff * 2, 300)
+        log.warning("Process exited, restarting", extra={
+            "process_index": self.index, "exit_code": code, "restart_in": self.backoff
+        })
+        self.process = None
+        self.restart_at = now + self.backoff
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+
+    def wait(self, timeout: float):
+        if self.process is None:
+            return
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the bot as several processes, each connecting a group of shards")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1,
+                        help="Bot processes to run (default: CPU count)")
+    parser.add_argument("--shards", type=int, help="Total shard count (default: Discord's recommendation)")
+    args = parser.parse_args()
+
+    load_dotenv()
+    setup_logging()
+    if not os.getenv("LUMA_JOB_STORE_PATH", "jobs.db"):
+        log.warning("LUMA_JOB_STORE_PATH is empty; results pending when a process restarts will be lost")
+
+    shard_count, max_concurrency = args.shards, 1
+    if shard_count is None:
+        shard_count, max_concurrency = recommended_shards(os.getenv("DISCORD_TOKEN"))
+    groups = split_shards(shard_count, args.processes)
+    log.info("Launching", extra={"shard_count": shard_count, "processes": len(groups)})
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    workers = []
+    for index, shard_ids in enumerate(groups):
+        worker = ShardProcess(index, shard_ids, process_env(index, len(groups), shard_count, shard_ids))
+        # Start each group once the previous one has had time to identify its shards
+        worker.restart_at = time.monotonic() + sum(
+            IDENTIFY_INTERVAL * -(-len(group) // max_concurrency) for group in groups[:index]
+        )
+        workers.append(worker)
+
+    while not stopping:
+        now = time.monotonic()
+        for worker in workers:
+            worker.check(now)
+        time.sleep(1)
+
+    log.info("Stopping processes")
+    for worker in workers:
+        worker.stop()
+    for worker in workers:
+        worker.wait(30)
+
+
+if __name__ == "__main__":
+    main()
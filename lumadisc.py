@@ -4,13 +4,27 @@ from discord import app_commands
 import os
 from dotenv import load_dotenv
 from services.luma_service import LumaService
-import requests
+from services.log import setup_logging, bind_interaction
+from services.metrics import COMMAND_SECONDS, SCHEDULER_JOBS, MetricsServer
+from services.tracing import setup_tracing, span, tracer
+from services.job_scheduler import JobScheduler
+from services.job_store import JobStore
+from services.job_queue import JobQueue, QueuedLuma
+from services.sharding import ShardConfig, parse_shard_ids
+from services.settings import parse_id_map
+from services.command_sync import SyncState, sync_commands
+from services.generation_runner import GenerationRunner, JobSpec, send_followup, send_response
+import argparse
+import functools
 import asyncio
+import logging
 
 # Load environment variables
 load_dotenv()
 DISCORD_TOKEN = os.getenv('DISCORD_TOKEN')
 
+log = logging.getLogger("luma.bot")
+
 # Bot setup with required intents
 intents = discord.Intents.default()
 intents.message_content = True
@@ -30,35 +44,166 @@ CAMERA_MOTION_CHOICES = [
     app_commands.Choice(name="Dolly Out", value="camera dolly out, "),
 ]
 
-class Bot(commands.Bot):
+# Hash of the last synced command tree; an empty path syncs on every start
+sync_state = None
+if os.getenv('LUMA_SYNC_STATE_PATH', 'command_sync.json'):
+    sync_state = SyncState(os.getenv('LUMA_SYNC_STATE_PATH', 'command_sync.json'))
+# Sync to this guild only, where changes show up at once (for testing)
+SYNC_GUILD = int(os.getenv('LUMA_SYNC_GUILD', 0)) or None
+
+# Gateway sharding; the launcher gives each process its own shard IDs
+shards = ShardConfig(
+    auto=os.getenv('LUMA_AUTO_SHARD', '0') not in ('0', 'false', 'no'),
+    shard_count=int(os.getenv('LUMA_SHARD_COUNT', 0)) or None,
+    shard_ids=parse_shard_ids(os.getenv('LUMA_SHARD_IDS', ''))
+)
+
+class Bot(commands.AutoShardedBot if shards.auto else commands.Bot):
     def __init__(self):
-        super().__init__(command_prefix='/', intents=intents)
+        options = shards.bot_options() if shards.auto else {}
+        super().__init__(command_prefix='/', intents=intents, **options)
+        self.sync_only = False
         
     async def setup_hook(self):
+        if self.sync_only:
+            # Logged in over HTTP just to sync commands; start nothing
+            return
+        # Open the shared Luma HTTP session before any command can run
+        await luma.start()
+        tracer.start()
+        if job_store is not None:
+            job_store.start()
+            await runner.resume()
+        if metrics_server is not None:
+            await metrics_server.start()
+
+        if os.getenv('LUMA_SYNC_COMMANDS', '1') in ('0', 'false', 'no'):
+            return
         try:
-            synced = await self.tree.sync()
-            print(f"Synced {len(synced)} command(s)")
+            # Only when the commands changed since the last sync
+            await sync_commands(self.tree, sync_state, guild_id=SYNC_GUILD)
         except Exception as e:
-            print(f"Failed to sync commands: {e}")
+            log.error("Failed to sync commands: %s", e)
+
+    async def close(self):
+        if metrics_server is not None:
+            await metrics_server.stop()
+        # Close the store first so jobs interrupted by shutdown stay pending
+        if job_store is not None:
+            await job_store.close()
+        await luma.close()
+        await tracer.stop()
+        await super().close()
 
 bot = Bot()
 
-# Service instances
-luma = LumaService()
+# Service instances; with a queue path, generations run in worker.py processes instead of here
+if os.getenv('LUMA_QUEUE_PATH'):
+    luma = QueuedLuma(
+        JobQueue(os.getenv('LUMA_QUEUE_PATH')),
+        timeout=float(os.getenv('LUMA_QUEUE_TIMEOUT', 600)),
+        schedule_path=os.getenv('LUMA_POLL_SCHEDULE_PATH', 'poll_schedule.json')
+    )
+else:
+    luma = LumaService()
+luma.bind_metrics()
+
+# Optional Prometheus endpoint; unset LUMA_METRICS_PORT disables it
+metrics_server = None
+if os.getenv('LUMA_METRICS_PORT'):
+    metrics_server = MetricsServer(
+        host=os.getenv('LUMA_METRICS_HOST', '127.0.0.1'),
+        port=int(os.getenv('LUMA_METRICS_PORT'))
+    )
+
+def traced_command(handler):
+    """Run a slash command handler inside a root span for its trace"""
+    @functools.wraps(handler)
+    async def wrapper(interaction: discord.Interaction, *args, **kwargs):
+        bind_interaction(interaction.id)
+        with span(
+            f"/{interaction.command.name}",
+            command=interaction.command.name,
+            guild_id=interaction.guild_id,
+            user_id=interaction.user.id
+        ):
+            return await handler(interaction, *args, **kwargs)
+    return wrapper
+
+# Fair sharing of generation capacity between users and guilds
+scheduler = JobScheduler(
+    max_global=int(os.getenv('LUMA_MAX_JOBS', 8)),
+    max_per_guild=int(os.getenv('LUMA_MAX_JOBS_PER_GUILD', 4)),
+    max_per_user=int(os.getenv('LUMA_MAX_JOBS_PER_USER', 2)),
+    weights=parse_id_map(os.getenv('LUMA_USER_WEIGHTS', ''))
+)
+SCHEDULER_JOBS.set_function(lambda: {
+    ("running",): scheduler.stats()["running"],
+    ("queued",): scheduler.stats()["queued"]
+})
+
+# Generations awaiting delivery survive restarts here; an empty path disables it
+job_store = None
+if os.getenv('LUMA_JOB_STORE_PATH', 'jobs.db'):
+    job_store = JobStore(
+        os.getenv('LUMA_JOB_STORE_PATH', 'jobs.db'),
+        flush_interval=float(os.getenv('LUMA_JOB_STORE_FLUSH_INTERVAL', 0.5))
+    )
+
+# Every generation command runs through here, from queueing to delivery
+runner = GenerationRunner(
+    bot, luma, scheduler, job_store,
+    edit_interval=float(os.getenv('LUMA_PROGRESS_EDIT_INTERVAL', 5)),
+    shards=shards
+)
+
+# Progress message text for image and video generations
+IMAGE_DETAILS = (
+    "Aspect: {aspect}\n"
+    "Model: {model}\n\n"
+    "Please wait while your image is being generated..."
+)
+VIDEO_DETAILS = (
+    "Aspect: {aspect}\n"
+    "This might take several minutes..."
+)
 
 @bot.event
 async def on_ready():
-    print(f'{bot.user} has connected to Discord!')
+    log.info("%s has connected to Discord!", bot.user, extra={"shards": shards.describe()})
     
-    # Print all registered commands
+    # Log all registered commands
     commands = [cmd.name for cmd in bot.tree.get_commands()]
-    print(f'Registered commands: {commands}')
+    log.info("Registered commands", extra={"commands": commands})
+
+@bot.event
+async def on_shard_ready(shard_id):
+    log.info("Shard %d is ready", shard_id)
+
+@bot.event
+async def on_guild_channel_delete(channel):
+    await runner.cancel_abandoned(channel_id=channel.id)
+
+@bot.event
+async def on_thread_delete(thread):
+    await runner.cancel_abandoned(channel_id=thread.id)
+
+@bot.event
+async def on_guild_remove(guild):
+    await runner.cancel_abandoned(guild_id=guild.id)
+
+@bot.event
+async def on_app_command_completion(interaction: discord.Interaction, command):
+    # Measured from when Discord created the interaction, so queueing counts too
+    elapsed = (discord.utils.utcnow() - interaction.created_at).total_seconds()
+    COMMAND_SECONDS.observe(elapsed, command=command.name)
 
 @bot.tree.command(name="luma")
 @app_commands.describe(
     aspect="Choose the aspect ratio for your image",
     model="Choose the model to use",
-    prompt="What would you like to generate?"
+    prompt="What would you like to generate?",
+    fresh="Create a new generation even if an identical one was made recently"
 )
 @app_commands.choices(aspect=[
     app_commands.Choice(name="square", value="1:1"),
@@ -70,67 +215,29 @@ async def on_ready():
     app_commands.Choice(name="photon-1 (default, higher quality)", value="photon-1"),
     app_commands.Choice(name="photon-flash-1 (faster)", value="photon-flash-1"),
 ])
-async def luma_generate(interaction: discord.Interaction, aspect: str, model: str, prompt: str):
+@traced_command
+async def luma_generate(interaction: discord.Interaction, aspect: str, model: str, prompt: str,
+                        fresh: bool = False):
     """Generate an image using Luma Dream Machine"""
-    try:
-        await interaction.response.send_message(f"🎨 Generating {aspect} image using {model} with prompt: {prompt}")
-        
-        # Start the generation
-        result = await luma.create_capture("image", prompt, aspect, model)
-        
-        if not result.get("success"):
-            await interaction.followup.send(f"❌ Generation failed: {result.get('error', 'Unknown error')}")
-            return
-            
-        generation_id = result.get("id")
-        elapsed_time = 0
-        
-        # Send initial status message
-        await interaction.followup.send(
-            f"⏳ Generation started (ID: `{generation_id}`)\n"
-            f"Status: {result.get('state', 'queued')}\n"
-            f"Aspect: {aspect}\n"
-            f"Model: {model}\n\n"
-            f"Please wait while your image is being generated..."
-        )
-        
-        while True:
-            final_result = await luma.wait_for_generation(generation_id)
-            
-            if not final_result.get("success"):
-                await interaction.followup.send(
-                    f"❌ Generation failed: {final_result.get('error', 'Unknown error')}\n"
-                    f"You can check status manually with `/luma_status {generation_id}`"
-                )
-                break
-                
-            if final_result.get("progress_update"):
-                elapsed_time = final_result.get("elapsed_time", 0)
-                await interaction.followup.send(
-                    f"⏳ Still generating... ({elapsed_time} seconds elapsed)\n"
-                    f"Status: {final_result.get('status', 'processing')}"
-                )
-                continue
-                
-            if final_result.get("image_url"):
-                await interaction.followup.send(
-                    f"✅ Generation complete! ({elapsed_time} seconds)\n"
-                    f"🖼️ Image: {final_result['image_url']}"
-                )
-                break
-            
-    except Exception as e:
-        await interaction.followup.send(f"❌ Error: {str(e)}")
+    await runner.run(interaction, JobSpec(
+        "create_capture",
+        {"capture_type": "image", "prompt": prompt, "aspect_ratio": aspect, "model": model},
+        preview=f"🎨 Generating {aspect} image using {model} with prompt: {prompt}",
+        details=IMAGE_DETAILS.format(aspect=aspect, model=model),
+        fresh=fresh
+    ))
 
 @bot.tree.command(name="luma_status")
 @app_commands.describe(generation_id="The ID of the generation to check")
+@traced_command
 async def luma_status(interaction: discord.Interaction, generation_id: str):
     """Check Luma generation status"""
     try:
+        bind_interaction(interaction.id)
         result = await luma.get_capture_status(generation_id)
         
         if not result.get("success"):
-            await interaction.response.send_message(
+            await send_response(interaction, 
                 f"❌ Error checking status: {result.get('error', 'Unknown error')}"
             )
             return
@@ -145,10 +252,49 @@ async def luma_status(interaction: discord.Interaction, generation_id: str):
         if image_url:
             status_message += f"\n🖼️ Image: {image_url}"
         
-        await interaction.response.send_message(status_message)
+        await send_response(interaction, status_message)
+            
+    except Exception as e:
+        await send_response(interaction, f"❌ Error checking status: {str(e)}")
+
+@bot.tree.command(name="luma_cancel")
+@app_commands.describe(generation_id="The ID of the generation to cancel")
+@traced_command
+async def luma_cancel(interaction: discord.Interaction, generation_id: str):
+    """Cancel a generation that is still running"""
+    try:
+        watchers = runner.watchers(generation_id)
+        if not watchers:
+            await send_response(interaction, 
+                f"❌ Generation `{generation_id}` is not running, or was not started by this bot",
+                ephemeral=True
+            )
+            return
+            
+        # Only whoever is waiting on it, or a moderator of the server it runs in, may cancel
+        moderator = interaction.permissions.manage_messages and all(
+            watcher["guild_id"] == interaction.guild_id for watcher in watchers
+        )
+        if not moderator and any(watcher["user_id"] != interaction.user.id for watcher in watchers):
+            await send_response(interaction, 
+                f"❌ Generation `{generation_id}` was requested by someone else and can't be cancelled",
+                ephemeral=True
+            )
+            return
+            
+        result = await runner.cancel(generation_id)
+        if not result.get("success"):
+            # Local waits are over either way; Luma may still finish it
+            await send_response(interaction, 
+                f"⚠️ Stopped waiting on `{generation_id}`, but Luma did not cancel it: "
+                f"{result.get('error', 'Unknown error')}"
+            )
+            return
+            
+        await send_response(interaction, f"🛑 Generation `{generation_id}` cancelled")
             
     except Exception as e:
-        await interaction.response.send_message(f"❌ Error checking status: {str(e)}")
+        await send_response(interaction, f"❌ Error cancelling generation: {str(e)}")
 
 @bot.tree.command(name="luma_ref")
 @app_commands.describe(
@@ -162,7 +308,8 @@ async def luma_status(interaction: discord.Interaction, generation_id: str):
     image_url3="Third reference image URL (optional)",
     weight3="Weight for third image (0.1 to 1.0, default: 0.85)",
     image_url4="Fourth reference image URL (optional)",
-    weight4="Weight for fourth image (0.1 to 1.0, default: 0.85)"
+    weight4="Weight for fourth image (0.1 to 1.0, default: 0.85)",
+    fresh="Create a new generation even if an identical one was made recently"
 )
 @app_commands.choices(aspect=[
     app_commands.Choice(name="square", value="1:1"),
@@ -174,6 +321,7 @@ async def luma_status(interaction: discord.Interaction, generation_id: str):
     app_commands.Choice(name="photon-1 (default, higher quality)", value="photon-1"),
     app_commands.Choice(name="photon-flash-1 (faster)", value="photon-flash-1"),
 ])
+@traced_command
 async def luma_ref(
     interaction: discord.Interaction, 
     aspect: str, 
@@ -186,90 +334,43 @@ async def luma_ref(
     image_url3: str = None,
     weight3: float = 0.85,
     image_url4: str = None,
-    weight4: float = 0.85
+    weight4: float = 0.85,
+    fresh: bool = False
 ):
     """Generate an image using up to 4 reference images"""
-    try:
-        # Validate weights
-        for weight in [weight1, weight2, weight3, weight4]:
-            if weight and not 0.1 <= weight <= 1.0:
-                await interaction.response.send_message("❌ All weights must be between 0.1 and 1.0")
-                return
-        
-        # Build image references list
-        image_refs = [{"url": image_url1, "weight": weight1}]
-        
-        if image_url2:
-            image_refs.append({"url": image_url2, "weight": weight2})
-        if image_url3:
-            image_refs.append({"url": image_url3, "weight": weight3})
-        if image_url4:
-            image_refs.append({"url": image_url4, "weight": weight4})
-            
-        # Build reference images preview
-        ref_preview = "\n".join([
-            f"�� Reference {i+1}: {ref['url']} (Weight: {ref['weight']})"
-            for i, ref in enumerate(image_refs)
-        ])
-            
-        await interaction.response.send_message(
+    # Validate weights
+    for weight in [weight1, weight2, weight3, weight4]:
+        if weight and not 0.1 <= weight <= 1.0:
+            await send_response(interaction, "❌ All weights must be between 0.1 and 1.0")
+            return
+    
+    # Build image references list
+    image_refs = [{"url": image_url1, "weight": weight1}]
+    
+    if image_url2:
+        image_refs.append({"url": image_url2, "weight": weight2})
+    if image_url3:
+        image_refs.append({"url": image_url3, "weight": weight3})
+    if image_url4:
+        image_refs.append({"url": image_url4, "weight": weight4})
+        
+    # Build reference images preview
+    ref_preview = "\n".join([
+        f"�� Reference {i+1}: {ref['url']} (Weight: {ref['weight']})"
+        for i, ref in enumerate(image_refs)
+    ])
+    
+    await runner.run(interaction, JobSpec(
+        "create_capture_with_ref",
+        {"prompt": prompt, "aspect_ratio": aspect, "model": model, "image_refs": image_refs},
+        preview=(
             f"🎨 Generating {aspect} image using {model}\n"
             f"✏️ Prompt: {prompt}\n\n"
             f"Reference Images:\n{ref_preview}"
-        )
-        
-        # Start the generation with references
-        result = await luma.create_capture_with_ref(
-            prompt=prompt,
-            aspect_ratio=aspect,
-            model=model,
-            image_refs=image_refs
-        )
-        
-        if not result.get("success"):
-            await interaction.followup.send(f"❌ Generation failed: {result.get('error', 'Unknown error')}")
-            return
-            
-        generation_id = result.get("id")
-        elapsed_time = 0
-        
-        # Send initial status message
-        await interaction.followup.send(
-            f"⏳ Generation started (ID: `{generation_id}`)\n"
-            f"Status: {result.get('state', 'queued')}\n"
-            f"Aspect: {aspect}\n"
-            f"Model: {model}\n\n"
-            f"Please wait while your image is being generated..."
-        )
-        
-        while True:
-            final_result = await luma.wait_for_generation(generation_id)
-            
-            if not final_result.get("success"):
-                await interaction.followup.send(
-                    f"❌ Generation failed: {final_result.get('error', 'Unknown error')}\n"
-                    f"You can check status manually with `/luma_status {generation_id}`"
-                )
-                break
-                
-            if final_result.get("progress_update"):
-                elapsed_time = final_result.get("elapsed_time", 0)
-                await interaction.followup.send(
-                    f"⏳ Still generating... ({elapsed_time} seconds elapsed)\n"
-                    f"Status: {final_result.get('status', 'processing')}"
-                )
-                continue
-                
-            if final_result.get("image_url"):
-                await interaction.followup.send(
-                    f"✅ Generation complete! ({elapsed_time} seconds)\n"
-                    f"🖼️ Image: {final_result['image_url']}"
-                )
-                break
-            
-    except Exception as e:
-        print(f"Error in luma_ref: {str(e)}")  # Debug log
-        await interaction.followup.send(f"❌ Error: {str(e)}")
+        ),
+        details=IMAGE_DETAILS.format(aspect=aspect, model=model),
+        fresh=fresh
+    ))
 
 @bot.tree.command(name="luma_style")
 @app_commands.describe(
@@ -277,7 +378,8 @@ async def luma_ref(
     model="Choose the model to use",
     prompt="What would you like to generate",
     style_url="Style reference image URL",
-    weight="Style influence (0.1 to 1.0, default: 0.85)"
+    weight="Style influence (0.1 to 1.0, default: 0.85)",
+    fresh="Create a new generation even if an identical one was made recently"
 )
 @app_commands.choices(aspect=[
     app_commands.Choice(name="square", value="1:1"),
@@ -289,83 +391,39 @@ async def luma_ref(
     app_commands.Choice(name="photon-1 (default, higher quality)", value="photon-1"),
     app_commands.Choice(name="photon-flash-1 (faster)", value="photon-flash-1"),
 ])
+@traced_command
 async def luma_style(
     interaction: discord.Interaction, 
     aspect: str, 
     model: str, 
     prompt: str,
     style_url: str,
-    weight: float = 0.85
+    weight: float = 0.85,
+    fresh: bool = False
 ):
     """Generate an image using a style reference image"""
-    try:
-        # Validate weight
-        if not 0.1 <= weight <= 1.0:
-            await interaction.response.send_message("❌ Weight must be between 0.1 and 1.0")
-            return
-        
-        # Build style reference
-        style_ref = [{"url": style_url, "weight": weight}]
-            
-        await interaction.response.send_message(
+    # Validate weight
+    if not 0.1 <= weight <= 1.0:
+        await send_response(interaction, "❌ Weight must be between 0.1 and 1.0")
+        return
+    
+    await runner.run(interaction, JobSpec(
+        "create_capture_with_style",
+        {
+            "prompt": prompt,
+            "aspect_ratio": aspect,
+            "model": model,
+            "style_refs": [{"url": style_url, "weight": weight}]
+        },
+        preview=(
             f"🎨 Generating {aspect} image using {model}\n"
             f"✏️ Prompt: {prompt}\n"
             f"🎨 Style: {style_url}\n"
             f"⚖️ Weight: {weight}"
-        )
-        
-        # Start the generation with style reference
-        result = await luma.create_capture_with_style(
-            prompt=prompt,
-            aspect_ratio=aspect,
-            model=model,
-            style_refs=style_ref
-        )
-        
-        if not result.get("success"):
-            await interaction.followup.send(f"❌ Generation failed: {result.get('error', 'Unknown error')}")
-            return
-            
-        generation_id = result.get("id")
-        elapsed_time = 0
-        
-        # Send initial status message
-        await interaction.followup.send(
-            f"⏳ Generation started (ID: `{generation_id}`)\n"
-            f"Status: {result.get('state', 'queued')}\n"
-            f"Aspect: {aspect}\n"
-            f"Model: {model}\n\n"
-            f"Please wait while your image is being generated..."
-        )
-        
-        while True:
-            final_result = await luma.wait_for_generation(generation_id)
-            
-            if not final_result.get("success"):
-                await interaction.followup.send(
-                    f"❌ Generation failed: {final_result.get('error', 'Unknown error')}\n"
-                    f"You can check status manually with `/luma_status {generation_id}`"
-                )
-                break
-                
-            if final_result.get("progress_update"):
-                elapsed_time = final_result.get("elapsed_time", 0)
-                await interaction.followup.send(
-                    f"⏳ Still generating... ({elapsed_time} seconds elapsed)\n"
-                    f"Status: {final_result.get('status', 'processing')}"
-                )
-                continue
-                
-            if final_result.get("image_url"):
-                await interaction.followup.send(
-                    f"✅ Generation complete! ({elapsed_time} seconds)\n"
-                    f"🖼️ Image: {final_result['image_url']}"
-                )
-                break
-            
-    except Exception as e:
-        print(f"Error in luma_style: {str(e)}")  # Debug log
-        await interaction.followup.send(f"❌ Error: {str(e)}")
+        ),
+        details=IMAGE_DETAILS.format(aspect=aspect, model=model),
+        fresh=fresh
+    ))
 
 @bot.tree.command(name="luma_char")
 @app_commands.describe(
@@ -375,7 +433,8 @@ async def luma_style(
     image_url1="First character reference image (required)",
     image_url2="Second character reference image (optional)",
     image_url3="Third character reference image (optional)",
-    image_url4="Fourth character reference image (optional)"
+    image_url4="Fourth character reference image (optional)",
+    fresh="Create a new generation even if an identical one was made recently"
 )
 @app_commands.choices(aspect=[
     app_commands.Choice(name="square", value="1:1"),
@@ -387,6 +446,7 @@ async def luma_style(
     app_commands.Choice(name="photon-1 (default, higher quality)", value="photon-1"),
     app_commands.Choice(name="photon-flash-1 (faster)", value="photon-flash-1"),
 ])
+@traced_command
 async def luma_char(
     interaction: discord.Interaction, 
     aspect: str, 
@@ -395,175 +455,89 @@ async def luma_char(
     image_url1: str,
     image_url2: str = None,
     image_url3: str = None,
-    image_url4: str = None
+    image_url4: str = None,
+    fresh: bool = False
 ):
     """Generate an image using character reference images"""
-    try:
-        # Build character references list
-        char_images = [image_url1]
-        if image_url2:
-            char_images.append(image_url2)
-        if image_url3:
-            char_images.append(image_url3)
-        if image_url4:
-            char_images.append(image_url4)
-            
-        # Build character preview
-        char_preview = "\n".join([
-            f"👤 Reference {i+1}: {url}"
-            for i, url in enumerate(char_images)
-        ])
-            
-        await interaction.response.send_message(
+    # Build character references list
+    char_images = [image_url1]
+    if image_url2:
+        char_images.append(image_url2)
+    if image_url3:
+        char_images.append(image_url3)
+    if image_url4:
+        char_images.append(image_url4)
+        
+    # Build character preview
+    char_preview = "\n".join([
+        f"👤 Reference {i+1}: {url}"
+        for i, url in enumerate(char_images)
+    ])
+    
+    await runner.run(interaction, JobSpec(
+        "create_capture_with_char",
+        {"prompt": prompt, "aspect_ratio": aspect, "model": model, "char_images": char_images},
+        preview=(
             f"🎨 Generating {aspect} image using {model}\n"
             f"✏️ Prompt: {prompt}\n\n"
             f"Character References:\n{char_preview}"
-        )
-        
-        # Start the generation with character reference
-        result = await luma.create_capture_with_char(
-            prompt=prompt,
-            aspect_ratio=aspect,
-            model=model,
-            char_images=char_images
-        )
-        
-        if not result.get("success"):
-            await interaction.followup.send(f"❌ Generation failed: {result.get('error', 'Unknown error')}")
-            return
-            
-        generation_id = result.get("id")
-        elapsed_time = 0
-        
-        # Send initial status message
-        await interaction.followup.send(
-            f"⏳ Generation started (ID: `{generation_id}`)\n"
-            f"Status: {result.get('state', 'queued')}\n"
-            f"Aspect: {aspect}\n"
-            f"Model: {model}\n\n"
-            f"Please wait while your image is being generated..."
-        )
-        
-        while True:
-            final_result = await luma.wait_for_generation(generation_id)
-            
-            if not final_result.get("success"):
-                await interaction.followup.send(
-                    f"❌ Generation failed: {final_result.get('error', 'Unknown error')}\n"
-                    f"You can check status manually with `/luma_status {generation_id}`"
-                )
-                break
-                
-            if final_result.get("progress_update"):
-                elapsed_time = final_result.get("elapsed_time", 0)
-                await interaction.followup.send(
-                    f"⏳ Still generating... ({elapsed_time} seconds elapsed)\n"
-                    f"Status: {final_result.get('status', 'processing')}"
-                )
-                continue
-                
-            if final_result.get("image_url"):
-                await interaction.followup.send(
-                    f"✅ Generation complete! ({elapsed_time} seconds)\n"
-                    f"🖼️ Image: {final_result['image_url']}"
-                )
-                break
-            
-    except Exception as e:
-        print(f"Error in luma_char: {str(e)}")  # Debug log
-        await interaction.followup.send(f"❌ Error: {str(e)}")
+        ),
+        details=IMAGE_DETAILS.format(aspect=aspect, model=model),
+        fresh=fresh
+    ))
 
 @bot.tree.command(name="luma_mod")
 @app_commands.describe(
     model="Choose the model to use",
     prompt="Describe the changes you want to make",
     image_url="URL of the image to modify",
-    weight="Image influence (0.1 to 1.0, default: 0.45, use 0.1 or less for color changes)"
+    weight="Image influence (0.1 to 1.0, default: 0.45, use 0.1 or less for color changes)",
+    fresh="Create a new generation even if an identical one was made recently"
 )
 @app_commands.choices(model=[
     app_commands.Choice(name="photon-1 (default, higher quality)", value="photon-1"),
     app_commands.Choice(name="photon-flash-1 (faster)", value="photon-flash-1"),
 ])
+@traced_command
 async def luma_mod(
     interaction: discord.Interaction,
     model: str,
     prompt: str,
     image_url: str,
-    weight: float = 0.45
+    weight: float = 0.45,
+    fresh: bool = False
 ):
     """Modify an existing image using AI"""
-    try:
-        # Validate weight
-        if not 0.0 <= weight <= 1.0:
-            await interaction.response.send_message("❌ Weight must be between 0.0 and 1.0")
-            return
-            
-        await interaction.response.send_message(
+    # Validate weight
+    if not 0.0 <= weight <= 1.0:
+        await send_response(interaction, "❌ Weight must be between 0.0 and 1.0")
+        return
+    
+    await runner.run(interaction, JobSpec(
+        "create_capture_with_mod",
+        {"prompt": prompt, "model": model, "image_url": image_url, "weight": weight},
+        title="Modification",
+        preview=(
             f"🎨 Modifying image using {model}\n"
             f"✏️ Changes: {prompt}\n"
             f"🖼️ Image: {image_url}\n"
             f"⚖️ Weight: {weight}\n\n"
             f"💡 Tip: For color changes, use weight of 0.1 or less"
-        )
-        
-        # Start the modification
-        result = await luma.create_capture_with_mod(
-            prompt=prompt,
-            model=model,
-            image_url=image_url,
-            weight=weight
-        )
-        
-        if not result.get("success"):
-            await interaction.followup.send(f"❌ Modification failed: {result.get('error', 'Unknown error')}")
-            return
-            
-        generation_id = result.get("id")
-        elapsed_time = 0
-        
-        # Send initial status message
-        await interaction.followup.send(
-            f"⏳ Modification started (ID: `{generation_id}`)\n"
-            f"Status: {result.get('state', 'queued')}\n"
+        ),
+        details=(
             f"Model: {model}\n\n"
             f"Please wait while your image is being modified..."
-        )
-        
-        while True:
-            final_result = await luma.wait_for_generation(generation_id)
-            
-            if not final_result.get("success"):
-                await interaction.followup.send(
-                    f"❌ Modification failed: {final_result.get('error', 'Unknown error')}\n"
-                    f"You can check status manually with `/luma_status {generation_id}`"
-                )
-                break
-                
-            if final_result.get("progress_update"):
-                elapsed_time = final_result.get("elapsed_time", 0)
-                await interaction.followup.send(
-                    f"⏳ Still modifying... ({elapsed_time} seconds elapsed)\n"
-                    f"Status: {final_result.get('status', 'processing')}"
-                )
-                continue
-                
-            if final_result.get("image_url"):
-                await interaction.followup.send(
-                    f"✅ Modification complete! ({elapsed_time} seconds)\n"
-                    f"🖼️ Image: {final_result['image_url']}"
-                )
-                break
-            
-    except Exception as e:
-        print(f"Error in luma_mod: {str(e)}")  # Debug log
-        await interaction.followup.send(f"❌ Error: {str(e)}")
+        ),
+        fresh=fresh
+    ))
 
 @bot.tree.command(name="luma_t2v")
 @app_commands.describe(
     prompt="What video would you like to generate",
     aspect="Choose the aspect ratio for your video",
     loop="Should the video loop seamlessly?",
-    camera="Add camera motion to your video"
+    camera="Add camera motion to your video",
+    fresh="Create a new generation even if an identical one was made recently"
 )
 @app_commands.choices(aspect=[
     app_commands.Choice(name="square", value="1:1"),
@@ -576,73 +550,32 @@ async def luma_mod(
     app_commands.Choice(name="no", value=0),
 ])
 @app_commands.choices(camera=CAMERA_MOTION_CHOICES)
+@traced_command
 async def luma_t2v(
     interaction: discord.Interaction,
     prompt: str,
     aspect: str = "16:9",
     loop: int = 0,
-    camera: str = ""
+    camera: str = "",
+    fresh: bool = False
 ):
     """Generate a video from text using AI"""
-    try:
-        # Combine camera motion with prompt
-        full_prompt = camera + prompt
-        
-        await interaction.response.send_message(
+    # Combine camera motion with prompt
+    full_prompt = camera + prompt
+    
+    await runner.run(interaction, JobSpec(
+        "create_video",
+        {"prompt": full_prompt, "aspect_ratio": aspect, "loop": bool(loop)},
+        job_type="t2v",
+        title="Video generation",
+        preview=(
             f"🎬 Generating {aspect} video\n"
             f"✏️ Prompt: {full_prompt}\n"
             f"🔄 Loop: {'Yes' if loop else 'No'}"
-        )
-        
-        result = await luma.create_video(
-            prompt=full_prompt,
-            aspect_ratio=aspect,
-            loop=bool(loop)
-        )
-        
-        if not result.get("success"):
-            await interaction.followup.send(f"❌ Generation failed: {result.get('error', 'Unknown error')}")
-            return
-            
-        generation_id = result.get("id")
-        elapsed_time = 0
-        
-        # Send initial status message
-        await interaction.followup.send(
-            f"⏳ Video generation started (ID: `{generation_id}`)\n"
-            f"Status: {result.get('state', 'queued')}\n"
-            f"Aspect: {aspect}\n"
-            f"This might take several minutes..."
-        )
-        
-        while True:
-            final_result = await luma.wait_for_video_generation(generation_id)
-            
-            if not final_result.get("success"):
-                await interaction.followup.send(
-                    f"❌ Generation failed: {final_result.get('error', 'Unknown error')}\n"
-                    f"You can check status manually with `/luma_status {generation_id}`"
-                )
-                break
-                
-            if final_result.get("progress_update"):
-                elapsed_time = final_result.get("elapsed_time", 0)
-                await interaction.followup.send(
-                    f"⏳ Still generating... ({elapsed_time} seconds elapsed)\n"
-                    f"Status: {final_result.get('status', 'processing')}"
-                )
-                continue
-                
-            if final_result.get("video_url"):
-                await interaction.followup.send(
-                    f"✅ Video generation complete! ({elapsed_time} seconds)\n"
-                    f"🎥 Video: {final_result['video_url']}"
-                )
-                break
-            
-    except Exception as e:
-        print(f"Error in luma_t2v: {str(e)}")  # Debug log
-        await interaction.followup.send(f"❌ Error: {str(e)}")
+        ),
+        details=VIDEO_DETAILS.format(aspect=aspect),
+        fresh=fresh
+    ))
 
 @bot.tree.command(name="luma_i2v")
 @app_commands.describe(
@@ -653,7 +586,8 @@ async def luma_t2v(
     frame_type2="Frame type for second image (if using two images)",
     aspect="Choose the aspect ratio for your video",
     loop="Should the video loop seamlessly?",
-    camera="Add camera motion to your video"
+    camera="Add camera motion to your video",
+    fresh="Create a new generation even if an identical one was made recently"
 )
 @app_commands.choices(aspect=[
     app_commands.Choice(name="square", value="1:1"),
@@ -672,6 +606,7 @@ async def luma_t2v(
     app_commands.Choice(name="no", value=0),
 ])
 @app_commands.choices(camera=CAMERA_MOTION_CHOICES)
+@traced_command
 async def luma_i2v(
     interaction: discord.Interaction,
     prompt: str,
@@ -681,87 +616,47 @@ async def luma_i2v(
     frame_type2: str = None,
     aspect: str = "16:9",
     loop: int = 0,
-    camera: str = ""
+    camera: str = "",
+    fresh: bool = False
 ):
     """Generate a video from one or two images using AI"""
-    try:
-        # Combine camera motion with prompt
-        full_prompt = camera + prompt
-        
-        # Build preview message based on number of images
-        if image_url2:
-            preview = (
-                f"🎬 Generating {aspect} video with start and end frames\n"
-                f"✏️ Prompt: {full_prompt}\n"
-                f"🖼️ Start Frame: {image_url1}\n"
-                f"🖼️ End Frame: {image_url2}\n"
-                f"🔄 Loop: {'Yes' if loop else 'No'}"
-            )
-        else:
-            preview = (
-                f"🎬 Generating {aspect} video with start frame\n"
-                f"✏️ Prompt: {full_prompt}\n"
-                f"🖼️ Frame: {image_url1}\n"
-                f"🔄 Loop: {'Yes' if loop else 'No'}"
-            )
-            
-        await interaction.response.send_message(preview)
-        
-        # Start the generation
-        result = await luma.create_image_video(
-            prompt=full_prompt,
-            image_url1=image_url1,
-            frame_type1=frame_type1,
-            image_url2=image_url2,
-            frame_type2=frame_type2,
-            aspect_ratio=aspect,
-            loop=bool(loop),
-            camera_motion=camera
+    # Combine camera motion with prompt
+    full_prompt = camera + prompt
+    
+    # Build preview message based on number of images
+    if image_url2:
+        preview = (
+            f"🎬 Generating {aspect} video with start and end frames\n"
+            f"✏️ Prompt: {full_prompt}\n"
+            f"🖼️ Start Frame: {image_url1}\n"
+            f"🖼️ End Frame: {image_url2}\n"
+            f"🔄 Loop: {'Yes' if loop else 'No'}"
         )
-        
-        if not result.get("success"):
-            await interaction.followup.send(f"❌ Generation failed: {result.get('error', 'Unknown error')}")
-            return
-            
-        generation_id = result.get("id")
-        elapsed_time = 0
-        
-        # Send initial status message
-        await interaction.followup.send(
-            f"⏳ Video generation started (ID: `{generation_id}`)\n"
-            f"Status: {result.get('state', 'queued')}\n"
-            f"Aspect: {aspect}\n"
-            f"This might take several minutes..."
+    else:
+        preview = (
+            f"🎬 Generating {aspect} video with start frame\n"
+            f"✏️ Prompt: {full_prompt}\n"
+            f"🖼️ Frame: {image_url1}\n"
+            f"🔄 Loop: {'Yes' if loop else 'No'}"
         )
         
-        while True:
-            final_result = await luma.wait_for_video_generation(generation_id)
-            
-            if not final_result.get("success"):
-                await interaction.followup.send(
-                    f"❌ Generation failed: {final_result.get('error', 'Unknown error')}\n"
-                    f"You can check status manually with `/luma_status {generation_id}`"
-                )
-                break
-                
-            if final_result.get("progress_update"):
-                elapsed_time = final_result.get("elapsed_time", 0)
-                await interaction.followup.send(
-                    f"⏳ Still generating... ({elapsed_time} seconds elapsed)\n"
-                    f"Status: {final_result.get('status', 'processing')}"
-                )
-                continue
-                
-            if final_result.get("video_url"):
-                await interaction.followup.send(
-                    f"✅ Video generation complete! ({elapsed_time} seconds)\n"
-                    f"🎥 Video: {final_result['video_url']}"
-                )
-                break
-            
-    except Exception as e:
-        print(f"Error in luma_i2v: {str(e)}")  # Debug log
-        await interaction.followup.send(f"❌ Error: {str(e)}")
+    await runner.run(interaction, JobSpec(
+        "create_image_video",
+        {
+            "prompt": full_prompt,
+            "image_url1": image_url1,
+            "frame_type1": frame_type1,
+            "image_url2": image_url2,
+            "frame_type2": frame_type2,
+            "aspect_ratio": aspect,
+            "loop": bool(loop)
+        },
+        job_type="i2v",
+        title="Video generation",
+        preview=preview,
+        details=VIDEO_DETAILS.format(aspect=aspect),
+        fresh=fresh
+    ))
 
 @bot.tree.command(name="luma_xtnd")
 @app_commands.describe(
@@ -770,7 +665,8 @@ async def luma_i2v(
     video_id1="ID of the video to extend (from previous generation)",
     video_id2="Second video ID (only needed for interpolation mode)",
     image_url="Image URL (only needed for modes with frame images)",
-    camera="Add camera motion to your video"
+    camera="Add camera motion to your video",
+    fresh="Create a new generation even if an identical one was made recently"
 )
 @app_commands.choices(mode=[
     app_commands.Choice(name="Forward Extension", value="extend"),
@@ -780,6 +676,7 @@ async def luma_i2v(
     app_commands.Choice(name="Interpolate Between Videos", value="interpolate")
 ])
 @app_commands.choices(camera=CAMERA_MOTION_CHOICES)
+@traced_command
 async def luma_xtnd(
     interaction: discord.Interaction,
     mode: str,
@@ -787,114 +684,57 @@ async def luma_xtnd(
     video_id1: str,
     video_id2: str = None,
     image_url: str = None,
-    camera: str = ""
+    camera: str = "",
+    fresh: bool = False
 ):
     """Extend a previously generated video"""
-    try:
-        # Combine camera motion with prompt
-        full_prompt = camera + prompt
-        
-        # Validate parameters based on mode
-        if mode == "interpolate" and not video_id2:
-            await interaction.response.send_message("❌ Interpolation requires two video IDs!")
-            return
-            
-        if mode in ["extend_end", "reverse_start"] and not image_url:
-            await interaction.response.send_message("❌ This mode requires an image URL!")
-            return
-            
-        # Build preview message based on mode
-        preview = f"🎬 Extending video with {mode} mode\n✏️ Prompt: {full_prompt}\n"
-        
-        if mode == "extend":
-            preview += f"📝 Extending forward from video: `{video_id1}`"
-        elif mode == "reverse":
-            preview += f"📝 Extending backward from video: `{video_id1}`"
-        elif mode == "extend_end":
-            preview += f"📝 Extending video `{video_id1}` to end frame\n🖼️ End frame: {image_url}"
-        elif mode == "reverse_start":
-            preview += f"📝 Extending backward from video `{video_id1}` with start frame\n🖼️ Start frame: {image_url}"
-        else:  # interpolate
-            preview += f"📝 Interpolating between videos:\n💫 Start: `{video_id1}`\n💫 End: `{video_id2}`"
-            
-        await interaction.response.send_message(
-            f"{preview}\n\n⚠️ Checking video status..."
-        )
-        
-        # Check if video(s) are completed
-        status = await luma.get_video_status(video_id1)
-        if not status.get("success") or status.get("status") != "completed":
-            await interaction.followup.send(
-                "❌ First video must be completed before extending!\n"
-                f"Current status: {status.get('status', 'unknown')}\n"
-                "💡 Use `/luma_status {video_id1}` to check status"
-            )
-            return
-            
-        if video_id2:
-            status2 = await luma.get_video_status(video_id2)
-            if not status2.get("success") or status2.get("status") != "completed":
-                await interaction.followup.send(
-                    "❌ Second video must be completed before interpolating!\n"
-                    f"Current status: {status2.get('status', 'unknown')}\n"
-                    "💡 Use `/luma_status {video_id2}` to check status"
-                )
-                return
-        
-        # Start the extension
-        result = await luma.extend_video(
-            prompt=full_prompt,
-            mode=mode,
-            video_id1=video_id1,
-            video_id2=video_id2,
-            image_url=image_url,
-            camera_motion=camera
-        )
-        
-        if not result.get("success"):
-            await interaction.followup.send(f"❌ Extension failed: {result.get('error', 'Unknown error')}")
-            return
-            
-        generation_id = result.get("id")
-        elapsed_time = 0
+    # Combine camera motion with prompt
+    full_prompt = camera + prompt
+    
+    # Validate parameters based on mode
+    if mode == "interpolate" and not video_id2:
+        await send_response(interaction, "❌ Interpolation requires two video IDs!")
+        return
         
-        # Send initial status message
-        await interaction.followup.send(
-            f"⏳ Video extension started (ID: `{generation_id}`)\n"
-            f"Status: {result.get('state', 'queued')}\n"
-            f"This might take several minutes..."
-        )
+    if mode in ["extend_end", "reverse_start"] and not image_url:
+        await send_response(interaction, "❌ This mode requires an image URL!")
+        return
         
-        while True:
-            final_result = await luma.wait_for_video_generation(generation_id)
-            
-            if not final_result.get("success"):
-                await interaction.followup.send(
-                    f"❌ Extension failed: {final_result.get('error', 'Unknown error')}\n"
-                    f"You can check status manually with `/luma_status {generation_id}`"
-                )
-                break
-                
-            if final_result.get("progress_update"):
-                elapsed_time = final_result.get("elapsed_time", 0)
-                await interaction.followup.send(
-                    f"⏳ Still extending... ({elapsed_time} seconds elapsed)\n"
-                    f"Status: {final_result.get('status', 'processing')}"
-                )
-                continue
-                
-            if final_result.get("video_url"):
-                await interaction.followup.send(
-                    f"✅ Video extension complete! ({elapsed_time} seconds)\n"
-                    f"🎥 Video: {final_result['video_url']}\n"
-                    f"📝 Generation ID: `{generation_id}`\n"
-                    f"💡 Use this ID with /luma_xtnd to extend this video further!"
-                )
-                break
-            
-    except Exception as e:
-        print(f"Error in luma_xtnd: {str(e)}")  # Debug log
-        await interaction.followup.send(f"❌ Error: {str(e)}")
+    # Build preview message based on mode
+    preview = f"🎬 Extending video with {mode} mode\n✏️ Prompt: {full_prompt}\n"
+    
+    if mode == "extend":
+        preview += f"📝 Extending forward from video: `{video_id1}`"
+    elif mode == "reverse":
+        preview += f"📝 Extending backward from video: `{video_id1}`"
+    elif mode == "extend_end":
+        preview += f"📝 Extending video `{video_id1}` to end frame\n🖼️ End frame: {image_url}"
+    elif mode == "reverse_start":
+        preview += f"📝 Extending backward from video `{video_id1}` with start frame\n🖼️ Start frame: {image_url}"
+    else:  # interpolate
+        preview += f"📝 Interpolating between videos:\n💫 Start: `{video_id1}`\n💫 End: `{video_id2}`"
+    
+    # Both videos must be completed before extending
+    requires_completed = [[video_id1, "❌ First video must be completed before extending!"]]
+    if video_id2:
+        requires_completed.append([video_id2, "❌ Second video must be completed before interpolating!"])
+        
+    await runner.run(interaction, JobSpec(
+        "extend_video",
+        {
+            "prompt": full_prompt,
+            "mode": mode,
+            "video_id1": video_id1,
+            "video_id2": video_id2,
+            "image_url": image_url
+        },
+        job_type="extend",
+        title="Video extension",
+        preview=f"{preview}\n\n⚠️ Checking video status...",
+        details="This might take several minutes...",
+        requires_completed=requires_completed,
+        fresh=fresh
+    ))
 
 @bot.tree.command(name="luma_help")
 @app_commands.describe(
@@ -906,6 +746,7 @@ async def luma_xtnd(
     app_commands.Choice(name="Video Extension", value="extend"),
     app_commands.Choice(name="General Info", value="info")
 ])
+@traced_command
 async def luma_help(
     interaction: discord.Interaction,
     section: str = None
@@ -922,6 +763,7 @@ This bot provides access to Luma AI's image and video generation capabilities.
 • Use `/luma_t2v` for basic video generation
 • All generation commands will provide a Generation ID
 • Generation IDs are needed for status checks and video extensions
+• Use `/luma_cancel` with a Generation ID to stop a generation you started
 
 **Tips:**
 • Higher weights in image references mean closer to reference image
@@ -1014,25 +856,51 @@ Example: `/luma_xtnd mode:Forward Extension prompt:continue the action video_id1
 
     try:
         if section == "image":
-            await interaction.response.send_message(image_commands)
+            await send_response(interaction, image_commands)
         elif section == "video":
-            await interaction.response.send_message(video_commands)
+            await send_response(interaction, video_commands)
         elif section == "extend":
-            await interaction.response.send_message(video_extension)
+            await send_response(interaction, video_extension)
         elif section == "info":
-            await interaction.response.send_message(general_info)
+            await send_response(interaction, general_info)
         else:
             # Send all sections with a small delay between each
-            await interaction.response.send_message(general_info)
+            await send_response(interaction, general_info)
             await asyncio.sleep(1)
-            await interaction.followup.send(image_commands)
+            await send_followup(interaction, image_commands)
             await asyncio.sleep(1)
-            await interaction.followup.send(video_commands)
+            await send_followup(interaction, video_commands)
             await asyncio.sleep(1)
-            await interaction.followup.send(video_extension)
+            await send_followup(interaction, video_extension)
             
     except Exception as e:
-        await interaction.response.send_message(f"❌ Error displaying help: {str(e)}")
+        await send_response(interaction, f"❌ Error displaying help: {str(e)}")
+
+async def sync_only(guild_id: int = None, force: bool = False):
+    """Log in over HTTP, without connecting to the gateway, and sync the commands"""
+    bot.sync_only = True
+    async with bot:
+        await bot.login(DISCORD_TOKEN)
+        synced = await sync_commands(bot.tree, sync_state, guild_id=guild_id, force=force)
+    if synced is None:
+        print("Commands unchanged since the last sync (use --force to sync anyway)")
+    else:
+        print(f"Synced {len(synced)} command(s): {[command.name for command in synced]}")
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description="Luma Dream Machine Discord bot")
+    parser.add_argument("--sync-only", action="store_true", help="Sync the slash commands and exit")
+    parser.add_argument("--force", action="store_true", help="With --sync-only, sync even if nothing changed")
+    parser.add_argument("--guild", type=int, default=SYNC_GUILD,
+                        help="With --sync-only, sync to this guild only (default: LUMA_SYNC_GUILD)")
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    if args.sync_only:
+        asyncio.run(sync_only(args.guild, args.force))
+        return
+    setup_tracing()
+    bot.run(DISCORD_TOKEN, log_handler=None)
 
 if __name__ == "__main__":
-    bot.run(DISCORD_TOKEN) 
\ No newline at end of file
+    main() 
\ No newline at end of file
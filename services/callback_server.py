@@ -0,0 +1,130 @@
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import secrets
+
+import aiohttp
+from aiohttp import web
+
+log = logging.getLogger("luma.callbacks")
+
+
+class CallbackServer:
+    """Small aiohttp endpoint that receives Luma generation callbacks
+
+    Luma POSTs the generation object to the callback_url given at creation
+    time whenever its state changes. The URL carries a token derived from
+    a local secret, so only requests to URLs this server handed out are
+    accepted. Valid payloads are passed to on_callback.
+    """
+
+    def __init__(self, on_callback, public_url: str, secret: str = None,
+                 host: str = "0.0.0.0", port: int = 8080, path: str = "/luma/callback"):
+        self.on_callback = on_callback  # (generation dict) -> None
+        self.public_url = public_url.rstrip("/")
+        self.secret = secret or secrets.token_hex(32)
+        self.host = host
+        self.port = port
+        self.path = path.rstrip("/")
+        self.token = hmac.new(self.secret.encode(), b"luma-callback", hashlib.sha256).hexdigest()
+        self.received = 0
+        self.rejected = 0
+        self._runner = None
+
+    @property
+    def callback_url(self) -> str:
+        """URL to send as callback_url when creating a generation"""
+        return f"{self.public_url}{self.path}/{self.token}"
+
+    def verify(self, token: str) -> bool:
+        return hmac.compare_digest(token, self.token)
+
+    async def start(self):
+        """Start listening for callbacks"""
+        if self._runner is not None:
+            return
+
+        app = web.Application()
+        app.router.add_post(f"{self.path}/{{token}}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        log.info("Callback receiver listening", extra={"host": self.host, "port": self.port, "path": self.path})
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        if not self.verify(request.match_info["token"]):
+            self.rejected += 1
+            log.warning("Rejected callback with invalid token", extra={"remote": request.remote})
+            return web.json_response({"error": "invalid token"}, status=403)
+
+        try:
+            data = await request.json()
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            self.rejected += 1
+            return web.json_response({"error": "invalid JSON"}, status=400)
+
+        if not isinstance(data, dict) or not data.get("id") or not data.get("state"):
+            self.rejected += 1
+            return web.json_response({"error": "missing id or state"}, status=400)
+
+        self.received += 1
+        log.debug("Callback received", extra={"generation_id": data["id"], "state": data["state"]})
+        self.on_callback(data)
+        return web.json_response({"ok": True})
+
+
+def make_generation(generation_id: str, state: str, image_url: str = None,
+                    video_url: str = None, failure_reason: str = None) -> dict:
+    """Build a generation object shaped like the ones Luma sends"""
+    assets = {}
+    if image_url:
+        assets["image"] = image_url
+    if video_url:
+        assets["video"] = video_url
+
+    return {
+        "id": generation_id,
+        "state": state,
+        "failure_reason": failure_reason,
+        "assets": assets or None
+    }
+
+
+async def send_callback(callback_url: str, generation: dict) -> int:
+    """Stand-in for Luma: POST a generation object to a callback URL and return the status code"""
+    async with aiohttp.ClientSession() as session:
+        async with session.post(callback_url, json=generation) as response:
+            return response.status
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send a fake Luma generation callback")
+    parser.add_argument("callback_url", help="Full callback URL, including the token")
+    parser.add_argument("generation_id")
+    parser.add_argument("state", choices=["queued", "dreaming", "completed", "failed"])
+    parser.add_argument("--image-url")
+    parser.add_argument("--video-url")
+    parser.add_argument("--failure-reason")
+    args = parser.parse_args()
+
+    generation = make_generation(
+        args.generation_id,
+        args.state,
+        image_url=args.image_url,
+        video_url=args.video_url,
+        failure_reason=args.failure_reason
+    )
+    status = asyncio.run(send_callback(args.callback_url, generation))
+    print(f"Callback returned HTTP {status}")
+
+
+if __name__ == "__main__":
+    main()
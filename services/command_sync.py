@@ -0,0 +1,80 @@
+import hashlib
+import json
+import logging
+import os
+
+import discord
+from discord import app_commands
+
+log = logging.getLogger("luma.sync")
+
+
+def _payload(command, tree: app_commands.CommandTree) -> dict:
+    """A command's sync payload; discord.py before 2.4 builds it without the tree"""
+    try:
+        return command.to_dict(tree)
+    except TypeError:
+        return command.to_dict()
+
+
+def tree_hash(tree: app_commands.CommandTree, guild: discord.abc.Snowflake = None) -> str:
+    """SHA-256 of the commands as Discord receives them: names, options, choices and permissions"""
+    commands = sorted(
+        (_payload(command, tree) for command in tree.get_commands(guild=guild)),
+        key=lambda command: (command.get("type", 1), command["name"])
+    )
+    return hashlib.sha256(json.dumps(commands, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+class SyncState:
+    """The command tree hash last synced, per application and scope, kept in a JSON file"""
+
+    def __init__(self, path: str = "command_sync.json"):
+        self.path = path
+        self._hashes = {}
+        if os.path.exists(path):
+            try:
+                with open(path) as file:
+                    self._hashes = json.load(file)
+            except (OSError, ValueError) as e:
+                log.warning("Ignoring unreadable sync state: %s", e)
+
+    @staticmethod
+    def _key(application_id: int, guild_id: int = None) -> str:
+        return f"{application_id}:{guild_id or 'global'}"
+
+    def get(self, application_id: int, guild_id: int = None) -> str:
+        return self._hashes.get(self._key(application_id, guild_id))
+
+    def put(self, application_id: int, guild_id: int, digest: str):
+        self._hashes[self._key(application_id, guild_id)] = digest
+        # Write a new file and swap it in, so a crash never leaves half a file
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w") as file:
+            json.dump(self._hashes, file, indent=2, sort_keys=True)
+        os.replace(temporary, self.path)
+
+
+async def sync_commands(tree: app_commands.CommandTree, state: SyncState = None, guild_id: int = None,
+                        force: bool = False) -> list:
+    """Sync the tree to Discord if it changed since the last sync; returns the synced commands or None
+
+    With guild_id the global commands are copied to that guild and synced
+    there, which takes effect at once and suits testing. Without a state
+    every call syncs.
+    """
+    guild = discord.Object(guild_id) if guild_id else None
+    if guild is not None:
+        tree.copy_global_to(guild=guild)
+    digest = tree_hash(tree, guild)
+    application_id = tree.client.application_id
+
+    if not force and state is not None and state.get(application_id, guild_id) == digest:
+        log.info("Commands unchanged, skipping sync", extra={"guild_id": guild_id, "hash": digest[:12]})
+        return None
+
+    synced = await tree.sync(guild=guild)
+    if state is not None:
+        state.put(application_id, guild_id, digest)
+    log.info("Synced %d command(s)", len(synced), extra={"guild_id": guild_id, "hash": digest[:12]})
+    return synced
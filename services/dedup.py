@@ -0,0 +1,117 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+
+log = logging.getLogger("luma.dedup")
+
+
+def request_key(endpoint: str, payload: dict, guild_id: int = None) -> str:
+    """SHA-256 of the guild, endpoint and payload in canonical JSON form
+
+    The guild is part of the key so generations are only reused within
+    the server they were made in, under that server's TTL.
+    """
+    payload = {key: value for key, value in payload.items() if key != "callback_url"}
+    canonical = json.dumps(
+        {"guild_id": guild_id, "endpoint": endpoint, "payload": payload},
+        sort_keys=True, separators=(",", ":"), ensure_ascii=False
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class GenerationDedup:
+    """Reuses generations created for identical requests
+
+    A request whose key matches a generation created less than ttl
+    seconds ago gets that generation's creation result back instead of
+    creating another one; whoever waits on it then sees the shared
+    generation's progress or its finished result. Identical requests
+    made while the first is still being submitted wait for it. The ttl
+    can differ per guild, and a ttl of 0 turns reuse off.
+    """
+
+    def __init__(self, ttl: float = 0, guild_ttls: dict = None, max_entries: int = 1000):
+        self.ttl = ttl
+        self.guild_ttls = dict(guild_ttls or {})
+        self.max_entries = max_entries
+        self.inflight_hits = 0
+        self.recent_hits = 0
+
+        self._entries = OrderedDict()  # key -> (created_at, creation result)
+        self._keys_by_generation = {}
+        self._creating = {}  # key -> future of the submission in progress
+
+    def ttl_for(self, guild_id=None) -> float:
+        return self.guild_ttls.get(guild_id, self.ttl)
+
+    def _get(self, key: str, ttl: float) -> dict:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        created_at, result = entry
+        if time.time() - created_at > ttl:
+            return None
+        self._entries.move_to_end(key)
+        return result
+
+    def _put(self, key: str, result: dict):
+        self._entries[key] = (time.time(), result)
+        self._entries.move_to_end(key)
+        self._keys_by_generation[result["id"]] = key
+        while len(self._entries) > self.max_entries:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._keys_by_generation.pop(evicted["id"], None)
+
+    def discard_generation(self, generation_id: str):
+        """Stop reusing a generation, e.g. because it failed"""
+        key = self._keys_by_generation.pop(generation_id, None)
+        if key is not None:
+            self._entries.pop(key, None)
+
+    async def run(self, key: str, ttl: float, create) -> dict:
+        """Return a reusable creation result for key, or call create() to make one"""
+        if ttl <= 0:
+            return await create()
+
+        result = self._get(key, ttl)
+        if result is not None:
+            self.recent_hits += 1
+            log.info("Reusing recent generation", extra={"generation_id": result["id"]})
+            return dict(result, deduplicated=True)
+
+        creating = self._creating.get(key)
+        if creating is not None:
+            await asyncio.wait([creating])
+            if not creating.cancelled():
+                self.inflight_hits += 1
+                result = creating.result()
+                if result.get("success"):
+                    return dict(result, deduplicated=True)
+                return result
+            # The first submission was abandoned; make our own
+
+        creating = asyncio.get_running_loop().create_future()
+        self._creating[key] = creating
+        try:
+            result = await create()
+        except BaseException:
+            creating.cancel()
+            raise
+        finally:
+            if self._creating.get(key) is creating:
+                del self._creating[key]
+
+        if result.get("success") and result.get("id"):
+            self._put(key, result)
+        creating.set_result(result)
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "inflight_hits": self.inflight_hits,
+            "recent_hits": self.recent_hits,
+            "entries": len(self._entries)
+        }
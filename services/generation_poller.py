@@ -0,0 +1,359 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import time
+from collections import OrderedDict
+from services.poll_schedule import AdaptiveSchedule
+from services.log import generation_id_var, interaction_id_var
+from services.tracing import current_span, current_span_var, record_span
+
+log = logging.getLogger("luma.poller")
+
+
+class PollJob:
+    """A pending generation tracked by the GenerationPoller"""
+
+    def __init__(self, generation_id: str, kind: str, started_at: float, deadline: float,
+                 job_type: str = None, model: str = None):
+        self.generation_id = generation_id
+        self.kind = kind  # "image" or "video"
+        self.job_type = job_type or ("image" if kind == "image" else "t2v")
+        self.model = model
+        self.started_at = started_at
+        self.deadline = deadline
+        self.pending_seen_at = started_at  # last status showing it still running
+        self.completed_seen_at = None  # first status showing it completed
+        self.attempts = 0
+        self.failures = 0  # consecutive failed status checks
+        self.overrun_polls = 0
+        self.latest = None  # last successful status result
+        self.trace_parent = current_span()  # span of the handler that started watching
+        self.interaction_id = interaction_id_var.get()
+        self.started_ns = time.time_ns()
+        self.future = asyncio.get_running_loop().create_future()
+        self._changed = asyncio.Event()
+
+    @property
+    def elapsed_time(self) -> int:
+        return int(asyncio.get_running_loop().time() - self.started_at)
+
+    def _notify(self):
+        # Wake every waiter, then arm a fresh event for the next change
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _resolve(self, result: dict):
+        if not self.future.done():
+            result["elapsed_time"] = self.elapsed_time
+            result["polls"] = self.attempts
+            self.future.set_result(result)
+        self._notify()
+
+    async def wait(self, progress_interval: float = 30):
+        """Wait for the final result, returning a progress update every progress_interval seconds"""
+        loop = asyncio.get_running_loop()
+        elapsed = loop.time() - self.started_at
+        timeout = progress_interval - (elapsed % progress_interval)
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(self.future), timeout)
+        except asyncio.TimeoutError:
+            result = dict(self.latest or {"success": True, "status": "queued"})
+            result["progress_update"] = True
+            result["elapsed_time"] = self.elapsed_time
+            return result
+
+    async def updates(self):
+        """Yield each new status result, ending with the final result"""
+        last_state = None
+        while True:
+            if self.future.done():
+                yield self.future.result()
+                return
+
+            state = (self.latest or {}).get("status")
+            if state is not None and state != last_state:
+                last_state = state
+                yield dict(self.latest, elapsed_time=self.elapsed_time)
+
+            await self._changed.wait()
+
+
+class GenerationPoller:
+    """Polls every pending generation from a single deadline heap
+
+    Each job is scheduled for its next status check on one heap. A single
+    scheduler task pops due jobs and checks them with bounded concurrency,
+    so status traffic grows with pending jobs / interval and never exceeds
+    max_concurrency requests in flight. The delay between checks of a job
+    comes from an AdaptiveSchedule; interval is the shortest delay used.
+
+    Results pushed from elsewhere (e.g. generation callbacks) resolve jobs
+    immediately. While pushes are expected, set safety_net_interval so
+    polling only catches callbacks that never arrive.
+    """
+
+    def __init__(self, fetch_status, interval: float = 2, max_concurrency: int = 8, max_failures: int = 5,
+                 schedule: AdaptiveSchedule = None):
+        self.fetch_status = fetch_status  # async (generation_id, kind) -> status dict
+        self.interval = interval
+        self.max_concurrency = max_concurrency
+        self.max_failures = max_failures
+        self.schedule = schedule or AdaptiveSchedule(min_delay=interval)
+        self.safety_net_interval = 0
+        self._unclaimed = OrderedDict()  # pushed results that arrived before watch()
+
+        self._jobs = {}
+        self._heap = []
+        self._sequence = itertools.count()
+        self._semaphore = None
+        self._wakeup = None
+        self._task = None
+        self._inflight = set()
+
+    @property
+    def pending(self) -> int:
+        return len(self._jobs)
+
+    def start(self):
+        """Start the scheduler task on the running loop"""
+        if self._task is not None and not self._task.done():
+            return
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._wakeup = asyncio.Event()
+        # Run in an empty context so the first caller's log correlation IDs don't leak in
+        loop = asyncio.get_running_loop()
+        self._task = contextvars.Context().run(loop.create_task, self._run())
+
+    async def stop(self):
+        """Stop polling and fail every pending job"""
+        tasks = list(self._inflight)
+        if self._task is not None:
+            tasks.append(self._task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+
+        for job in list(self._jobs.values()):
+            # Not a failure of the generation; whoever waits should leave it pending
+            job._resolve({"success": False, "stopped": True, "error": "Poller stopped"})
+        self._jobs.clear()
+        self._heap.clear()
+
+    def watch(self, generation_id: str, kind: str, timeout: float,
+              job_type: str = None, model: str = None) -> PollJob:
+        """Track a generation, reusing the existing job if it is already pending"""
+        job = self._jobs.get(generation_id)
+        if job is not None:
+            return job
+
+        self.start()
+        now = asyncio.get_running_loop().time()
+        job = PollJob(generation_id, kind, now, now + timeout, job_type=job_type, model=model)
+        self._jobs[generation_id] = job
+        self._schedule(job, now + self._next_delay(job, None, 0))
+
+        early = self._unclaimed.pop(generation_id, None)
+        if early is not None:
+            self._handle_result(job, early, reschedule=False)
+        return job
+
+    def get(self, generation_id: str) -> PollJob:
+        return self._jobs.get(generation_id)
+
+    def cancel(self, generation_id: str) -> bool:
+        """Stop polling a generation, resolving its waiters as cancelled"""
+        job = self._jobs.get(generation_id)
+        if job is None:
+            return False
+        self._finish(job, {
+            "success": False,
+            "cancelled": True,
+            "status": "cancelled",
+            "error": "Generation cancelled"
+        })
+        return True
+
+    def push(self, generation_id: str, result: dict) -> bool:
+        """Apply a status result obtained without polling; returns False if the job is unknown"""
+        job = self._jobs.get(generation_id)
+        if job is None:
+            # Keep it briefly in case the generation is watched right after creation
+            self._unclaimed[generation_id] = result
+            while len(self._unclaimed) > 1000:
+                self._unclaimed.popitem(last=False)
+            return False
+        self._handle_result(job, result, reschedule=False)
+        return True
+
+    def _next_delay(self, job: PollJob, state: str, elapsed: float) -> float:
+        return max(self.schedule.next_delay(job, state, elapsed), self.safety_net_interval)
+
+    def stats(self) -> dict:
+        """Pending job count plus polls-per-job from the schedule"""
+        return dict(self.schedule.stats(), pending=self.pending)
+
+    def pending_by_type(self) -> dict:
+        """Pending job count per job type"""
+        counts = {}
+        for job in self._jobs.values():
+            counts[job.job_type] = counts.get(job.job_type, 0) + 1
+        return counts
+
+    def _schedule(self, job: PollJob, when: float):
+        heapq.heappush(self._heap, (when, next(self._sequence), job.generation_id))
+        self._wakeup.set()
+
+    def _finish(self, job: PollJob, result: dict):
+        log.debug(
+            "Generation finished",
+            extra={
+                "generation_id": job.generation_id,
+                "success": result.get("success"),
+                "polls": job.attempts,
+                "error": result.get("error")
+            }
+        )
+        record_span(
+            "generation.wait",
+            job.started_ns,
+            parent=job.trace_parent,
+            error=None if result.get("success") else result.get("error"),
+            generation_id=job.generation_id,
+            job_type=job.job_type,
+            model=job.model,
+            polls=job.attempts
+        )
+        self._jobs.pop(job.generation_id, None)
+        job._resolve(result)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            due, _, generation_id = self._heap[0]
+            now = loop.time()
+            if due > now:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), due - now)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._heap)
+            job = self._jobs.get(generation_id)
+            if job is None:
+                continue
+
+            if now > job.deadline:
+                self._finish(job, {
+                    "success": False,
+                    "error": f"Timeout waiting for {job.kind} generation"
+                })
+                continue
+
+            await self._semaphore.acquire()
+            task = loop.create_task(self._poll(job))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _poll(self, job: PollJob):
+        # Status check spans and logs belong to the handler waiting on the job
+        current_span_var.set(job.trace_parent)
+        interaction_id_var.set(job.interaction_id)
+        generation_id_var.set(job.generation_id)
+        try:
+            result = await self.fetch_status(job.generation_id, job.kind)
+        except Exception as e:
+            result = {"success": False, "error": f"Failed to get status: {str(e)}"}
+        finally:
+            self._semaphore.release()
+
+        if self._jobs.get(job.generation_id) is not job:
+            # Cancelled while the check was in flight
+            return
+        job.attempts += 1
+        self._handle_result(job, result)
+
+    @staticmethod
+    def _completion_time(job: PollJob, now: float, pushed: bool) -> float:
+        """Seconds from watching a job to its completion, as best known
+
+        A pushed result arrives as the generation completes. A poll only
+        shows that it completed at some point since the previous check, so
+        the midpoint is taken; counting the whole gap would teach the
+        schedule ever longer times.
+        """
+        seen = job.completed_seen_at
+        if seen is None:
+            if pushed:
+                return now - job.started_at
+            seen = now
+        return (job.pending_seen_at + seen) / 2 - job.started_at
+
+    def _handle_result(self, job: PollJob, result: dict, reschedule: bool = True):
+        now = asyncio.get_running_loop().time()
+        details = result.get("details")
+        state = result.get("status")
+        if state is None and isinstance(details, dict):
+            state = details.get("state")
+
+        if not result.get("success"):
+            # A failed generation is final; transport errors are retried
+            if state == "failed":
+                self._finish(job, {
+                    "success": False,
+                    "error": result.get("error", "Generation failed"),
+                    "details": details
+                })
+                return
+
+            if not reschedule:
+                return
+
+            job.failures += 1
+            if job.failures >= self.max_failures:
+                self._finish(job, result)
+                return
+
+            self._schedule(job, now + self.interval)
+            return
+
+        if reschedule:
+            job.failures = 0
+        url_key = "image_url" if job.kind == "image" else "video_url"
+
+        if state == "completed" and result.get(url_key):
+            self.schedule.record_completion(job, self._completion_time(job, now, pushed=not reschedule))
+            self._finish(job, result)
+            return
+        if state == "failed":
+            self._finish(job, {
+                "success": False,
+                "error": "Generation failed",
+                "details": details
+            })
+            return
+
+        if state == "completed":
+            # Finished, but the assets are not attached yet
+            if job.completed_seen_at is None:
+                job.completed_seen_at = now
+        else:
+            job.pending_seen_at = now
+
+        changed = job.latest is None or job.latest.get("status") != state
+        job.latest = result
+        if changed:
+            job._notify()
+
+        if reschedule:
+            self._schedule(job, now + self._next_delay(job, state, now - job.started_at))
@@ -0,0 +1,387 @@
+import asyncio
+import logging
+import time
+
+import discord
+
+from services.log import bind_generation, log_context
+from services.metrics import DISCORD_SEND_SECONDS, QUEUE_WAIT_SECONDS
+from services.progress import ProgressReporter
+from services.tracing import span
+
+log = logging.getLogger("luma.runner")
+
+# How long a generation is waited on before giving up, by kind
+TIMEOUTS = {"image": 600, "video": 1200}
+
+REUSE_NOTICE = (
+    "♻️ An identical request was made recently, so you'll get the same generation. "
+    "Set `fresh` to True to create a new one."
+)
+
+
+async def send_response(interaction: discord.Interaction, *args, **kwargs):
+    """Send the initial interaction response, timing the Discord call"""
+    with span("discord.response"), DISCORD_SEND_SECONDS.time(kind="response"):
+        return await interaction.response.send_message(*args, **kwargs)
+
+
+async def send_followup(interaction: discord.Interaction, *args, **kwargs):
+    """Send a followup message, timing the Discord call"""
+    with span("discord.followup"), DISCORD_SEND_SECONDS.time(kind="followup"):
+        return await interaction.followup.send(*args, **kwargs)
+
+
+def token_expired(error: Exception) -> bool:
+    """Whether Discord rejected an interaction call because its 15 minute token has expired"""
+    return isinstance(error, discord.HTTPException) and (error.status == 401 or error.code == 50027)
+
+
+async def edit_message(message: discord.WebhookMessage, content: str):
+    """Edit a followup message, timing the Discord call"""
+    with span("discord.edit"), DISCORD_SEND_SECONDS.time(kind="edit"):
+        return await message.edit(content=content)
+
+
+class JobSpec:
+    """What a generation command asks for, independent of how it is run
+
+    method names the LumaService create method and params holds its
+    keyword arguments, so a spec is plain data that can be stored and
+    run later. The text fields only shape the messages the user sees.
+    """
+
+    def __init__(self, method: str, params: dict, job_type: str = "image", title: str = "Generation",
+                 preview: str = "", details: str = "", fresh: bool = False,
+                 requires_completed: list = None):
+        self.method = method
+        self.params = params
+        self.job_type = job_type  # image, t2v, i2v or extend
+        self.title = title  # e.g. "Modification", as in "Modification started"
+        self.preview = preview  # first response, shown while queued
+        self.details = details  # progress message text below the generation ID
+        self.fresh = fresh
+        # [generation_id, message] pairs; each video must be completed before creating
+        self.requires_completed = list(requires_completed or [])
+
+    @property
+    def kind(self) -> str:
+        return "image" if self.job_type == "image" else "video"
+
+    @property
+    def model(self) -> str:
+        return self.params.get("model")
+
+
+class GenerationRunner:
+    """Runs generation commands from the first response to the delivered result
+
+    A job takes a scheduler slot, creates the generation, records it in
+    the job store, keeps one progress message up to date while the
+    shared poller waits for it, posts the result and gives the slot back.
+    Generations left pending by a restart are delivered by resume().
+
+    A cancelled generation ends its waits at once, which frees the poll
+    slot, the scheduler slot and the task. Generations whose channel is
+    gone are cancelled too, unless someone else is still waiting on them.
+    """
+
+    def __init__(self, client: discord.Client, luma, scheduler, job_store=None, edit_interval: float = 5,
+                 shards=None):
+        self.client = client
+        self.luma = luma
+        self.scheduler = scheduler
+        self.job_store = job_store
+        self.edit_interval = edit_interval
+        self.shards = shards  # ShardConfig; None owns every guild
+        self._resumed = set()
+        self._active = {}  # generation_id -> [who is waiting on it and where]
+
+    async def acknowledge(self, interaction: discord.Interaction, job_type: str, content: str):
+        """Queue the job with the scheduler, respond with its queue position and wait for a slot
+
+        The returned ticket holds the slot until released when the job ends.
+        """
+        ticket = self.scheduler.submit(interaction.user.id, interaction.guild_id, job_type)
+        try:
+            if ticket.position:
+                content += f"\n\n🕒 You are #{ticket.position} in the queue; generation starts when a slot frees up."
+            await send_response(interaction, content)
+            with span("scheduler.wait", position=ticket.position):
+                waited = await ticket.wait()
+            QUEUE_WAIT_SECONDS.observe(waited, job_type=job_type)
+        except BaseException:
+            ticket.release()
+            raise
+        return ticket
+
+    def track(self, interaction: discord.Interaction, generation_id: str, spec: JobSpec, state: str = None):
+        """Bind the generation to this task's logs and record it so a restart can resume it"""
+        bind_generation(generation_id)
+        if self.job_store is not None:
+            self.job_store.record(
+                generation_id,
+                kind=spec.kind,
+                job_type=spec.job_type,
+                model=spec.model,
+                interaction_id=interaction.id,
+                channel_id=interaction.channel_id,
+                guild_id=interaction.guild_id,
+                user_id=interaction.user.id,
+                state=state
+            )
+
+    def finish(self, generation_id: str, result: dict, interaction_id: int = None):
+        """Mark the generation's result as delivered to interaction_id"""
+        if self.job_store is not None:
+            state = result.get("status") or ("completed" if result.get("success") else "failed")
+            self.job_store.complete(generation_id, state, interaction_id)
+
+    async def wait(self, generation_id: str, kind: str, job_type: str, model: str = None,
+                   timeout: float = None, on_progress=None) -> dict:
+        """Wait for the final result, passing each progress update to on_progress"""
+        timeout = timeout or TIMEOUTS[kind]
+        while True:
+            if kind == "video":
+                result = await self.luma.wait_for_video_generation(
+                    generation_id, max_attempts=int(timeout / 2), job_type=job_type
+                )
+            else:
+                result = await self.luma.wait_for_generation(
+                    generation_id, max_attempts=int(timeout / 2), model=model
+                )
+            if not result.get("progress_update"):
+                return result
+            if self.job_store is not None:
+                self.job_store.update(generation_id, result.get("status"))
+            if on_progress is not None:
+                await on_progress(result)
+
+    def _watch(self, generation_id: str, user_id: int, channel_id: int, guild_id: int) -> dict:
+        watcher = {"user_id": user_id, "channel_id": channel_id, "guild_id": guild_id}
+        self._active.setdefault(generation_id, []).append(watcher)
+        return watcher
+
+    def _unwatch(self, generation_id: str, watcher: dict):
+        watchers = self._active.get(generation_id, [])
+        if watcher in watchers:
+            watchers.remove(watcher)
+        if not watchers:
+            self._active.pop(generation_id, None)
+
+    def watchers(self, generation_id: str) -> list:
+        """Who is waiting on a generation, as user_id, channel_id and guild_id dicts"""
+        return list(self._active.get(generation_id, []))
+
+    async def cancel(self, generation_id: str) -> dict:
+        """Cancel a generation, ending every wait on it"""
+        return await self.luma.cancel_generation(generation_id)
+
+    async def cancel_abandoned(self, channel_id: int = None, guild_id: int = None):
+        """Cancel generations whose every result would go to a deleted channel or a guild the bot left"""
+        for generation_id, watchers in list(self._active.items()):
+            gone = [
+                watcher for watcher in watchers
+                if (channel_id is not None and watcher["channel_id"] == channel_id)
+                or (guild_id is not None and watcher["guild_id"] == guild_id)
+            ]
+            if gone and len(gone) == len(watchers):
+                log.info("Cancelling abandoned generation", extra={"generation_id": generation_id})
+                await self.cancel(generation_id)
+
+    async def send_to_channel(self, channel_id: int, content: str) -> discord.Message:
+        """Post a message in a channel, outside any interaction"""
+        channel = self.client.get_channel(channel_id) or await self.client.fetch_channel(channel_id)
+        with DISCORD_SEND_SECONDS.time(kind="channel"):
+            return await channel.send(content)
+
+    def replier(self, interaction: discord.Interaction):
+        """A function sending followups to the interaction, or to its channel once the token has expired
+
+        Interaction tokens last 15 minutes, which a long queue wait plus
+        generation can outlast; messages then go to the channel with a
+        mention of the user instead.
+        """
+        expired = False
+
+        async def reply(content: str):
+            nonlocal expired
+            if not expired:
+                try:
+                    return await send_followup(interaction, content)
+                except discord.HTTPException as e:
+                    if not token_expired(e):
+                        raise
+                    expired = True
+                    log.info("Interaction token expired, posting in the channel instead")
+            return await self.send_to_channel(interaction.channel_id, f"<@{interaction.user.id}> {content}")
+
+        return reply
+
+    async def _check_completed(self, reply, spec: JobSpec) -> bool:
+        for generation_id, message in spec.requires_completed:
+            status = await self.luma.get_video_status(generation_id)
+            if not status.get("success") or status.get("status") != "completed":
+                await reply(
+                    f"{message}\n"
+                    f"Current status: {status.get('status', 'unknown')}\n"
+                    f"💡 Use `/luma_status {generation_id}` to check status"
+                )
+                return False
+        return True
+
+    async def run(self, interaction: discord.Interaction, spec: JobSpec):
+        """Run a generation command to completion, reporting to the interaction"""
+        ticket = None
+        generation_id = None
+        watcher = None
+        final_result = None
+        reply = self.replier(interaction)
+        try:
+            ticket = await self.acknowledge(interaction, spec.job_type, spec.preview)
+            if not await self._check_completed(reply, spec):
+                return
+
+            create = getattr(self.luma, spec.method)
+            result = await create(**spec.params, guild_id=interaction.guild_id, fresh=spec.fresh)
+            if not result.get("success"):
+                await reply(f"❌ {spec.title} failed: {result.get('error', 'Unknown error')}")
+                return
+
+            generation_id = result.get("id")
+            self.track(interaction, generation_id, spec, state=result.get("state"))
+            watcher = self._watch(generation_id, interaction.user.id, interaction.channel_id, interaction.guild_id)
+            if result.get("deduplicated"):
+                await reply(REUSE_NOTICE)
+
+            # Live progress message, edited in place until the result is posted
+            progress = ProgressReporter(
+                reply,
+                edit_message,
+                f"⏳ {spec.title} started (ID: `{generation_id}`)\n{spec.details}",
+                eta_seconds=self.luma.expected_duration(spec.job_type, spec.model),
+                min_interval=self.edit_interval,
+                # Followups can't be edited once the token expires; reply then posts in the channel
+                repost_on=token_expired
+            )
+            await progress.start(result.get("state") or "queued")
+
+            final_result = await self.wait(
+                generation_id, spec.kind, spec.job_type, spec.model,
+                on_progress=lambda update: progress.update(update.get("status", "processing"))
+            )
+            if final_result.get("stopped"):
+                # The bot is shutting down; the job stays pending and is delivered after the restart
+                log.info("Shutting down before the result arrived", extra={"generation_id": generation_id})
+                return
+            if final_result.get("cancelled"):
+                # Whoever cancelled it already got a confirmation
+                await progress.finish("cancelled")
+            elif final_result.get("success"):
+                await progress.finish("completed")
+                elapsed_time = final_result.get("elapsed_time", 0)
+                if spec.kind == "video":
+                    content = (
+                        f"✅ {spec.title} complete! ({elapsed_time} seconds)\n"
+                        f"🎥 Video: {final_result['video_url']}\n"
+                        f"📝 Generation ID: `{generation_id}`\n"
+                        f"💡 Use this ID with /luma_xtnd to extend this video further!"
+                    )
+                else:
+                    content = (
+                        f"✅ {spec.title} complete! ({elapsed_time} seconds)\n"
+                        f"🖼️ Image: {final_result['image_url']}"
+                    )
+                await reply(content)
+            else:
+                await progress.finish("failed")
+                await reply(
+                    f"❌ {spec.title} failed: {final_result.get('error', 'Unknown error')}\n"
+                    f"You can check status manually with `/luma_status {generation_id}`"
+                )
+            self.finish(generation_id, final_result, interaction.id)
+
+        except (discord.NotFound, discord.Forbidden) as e:
+            # The channel or interaction is gone, so nobody would see the result
+            log.warning("Cannot reach the interaction: %s", e)
+            if watcher is not None:
+                self._unwatch(generation_id, watcher)
+                watcher = None
+            if generation_id is not None and final_result is None and not self._active.get(generation_id):
+                await self.cancel(generation_id)
+                self.finish(generation_id, {"success": False, "status": "cancelled"}, interaction.id)
+            elif final_result is not None:
+                # The result is in but cannot be posted; a restart would fail the same way
+                self.finish(generation_id, final_result, interaction.id)
+        except Exception as e:
+            log.exception("Command failed", extra={"command": interaction.command.name})
+            try:
+                await reply(f"❌ Error: {str(e)}")
+            except Exception as report_error:
+                log.warning("Cannot report the error: %s", report_error)
+        finally:
+            if watcher is not None:
+                self._unwatch(generation_id, watcher)
+            if ticket is not None:
+                ticket.release()
+
+    async def resume(self):
+        """Start delivering generations that were still pending when the bot last stopped
+
+        Processes sharing the job store each take the jobs from guilds on
+        their own shards, so every result is delivered exactly once.
+        """
+        pending = await self.job_store.pending_jobs()
+        if self.shards is not None:
+            pending = [job for job in pending if self.shards.owns(job["guild_id"])]
+        if pending:
+            log.info("Resuming pending generations", extra={"count": len(pending)})
+        for job in pending:
+            task = asyncio.create_task(self._deliver_resumed(job))
+            self._resumed.add(task)
+            task.add_done_callback(self._resumed.discard)
+
+    async def _deliver_resumed(self, job: dict):
+        """Wait for a generation started before a restart and post its result in the original channel"""
+        generation_id = job["generation_id"]
+        watcher = self._watch(generation_id, job["user_id"], job["channel_id"], job["guild_id"])
+        with log_context(interaction_id=job["interaction_id"], generation_id=generation_id):
+            try:
+                # Give it whatever remains of the usual timeout, but at least two minutes
+                age = time.time() - job["created_at"]
+                timeout = max(120, TIMEOUTS.get(job["kind"], 1200) - age)
+                result = await self.wait(generation_id, job["kind"], job["job_type"], job["model"], timeout)
+
+                if result.get("stopped") or self.job_store.closed:
+                    # Shutting down again; deliver after the next start
+                    return
+
+                if result.get("cancelled"):
+                    self.finish(generation_id, result, job["interaction_id"])
+                    return
+
+                if result.get("success"):
+                    url = result.get("video_url") or result.get("image_url")
+                    icon = "🎥 Video" if job["kind"] == "video" else "🖼️ Image"
+                    content = (
+                        f"<@{job['user_id']}> ✅ Your generation `{generation_id}` finished while the bot was restarting!\n"
+                        f"{icon}: {url}"
+                    )
+                else:
+                    content = (
+                        f"<@{job['user_id']}> ❌ Your generation `{generation_id}` failed: "
+                        f"{result.get('error', 'Unknown error')}"
+                    )
+
+                await self.send_to_channel(job["channel_id"], content)
+                self.finish(generation_id, result, job["interaction_id"])
+                log.info("Delivered resumed generation", extra={"success": result.get("success")})
+
+            except (discord.NotFound, discord.Forbidden) as e:
+                # The channel is gone or closed to the bot; nothing more can be done
+                log.warning("Cannot deliver resumed generation: %s", e)
+                self.finish(generation_id, {"success": False}, job["interaction_id"])
+            except Exception:
+                log.exception("Resumed delivery failed")
+            finally:
+                self._unwatch(generation_id, watcher)
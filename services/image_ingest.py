@@ -0,0 +1,143 @@
+import hashlib
+import os
+import tempfile
+
+import aiohttp
+
+CHUNK_SIZE = 64 * 1024
+ACCEPTED_CONTENT_TYPES = ("application/octet-stream", "binary/octet-stream")
+
+
+def sniff_image_type(head: bytes) -> str:
+    """Return the image MIME type from the first bytes of a file, or None"""
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head.startswith(b"BM"):
+        return "image/bmp"
+    if head.startswith((b"II*\x00", b"MM\x00*")):
+        return "image/tiff"
+    if head[4:8] == b"ftyp" and head[8:12] in (b"avif", b"avis"):
+        return "image/avif"
+    if head[4:8] == b"ftyp" and head[8:12] in (b"heic", b"heix", b"mif1", b"msf1"):
+        return "image/heic"
+    return None
+
+
+class ImageSpool:
+    """Image bytes held in memory up to threshold, then in a temporary file
+
+    The SHA-256 and size are computed while writing, so the body never has
+    to be read back in full.
+    """
+
+    def __init__(self, threshold: int = 1024 * 1024, suffix: str = ""):
+        self.threshold = threshold
+        self.suffix = suffix
+        self.size = 0
+        self.content_type = None
+        self.path = None
+        self._buffer = bytearray()
+        self._file = None
+        self._hash = hashlib.sha256()
+
+    @property
+    def sha256(self) -> str:
+        return self._hash.hexdigest()
+
+    @property
+    def in_memory(self) -> bool:
+        return self._file is None
+
+    def write(self, chunk: bytes):
+        self._hash.update(chunk)
+        self.size += len(chunk)
+
+        if self._file is None and len(self._buffer) + len(chunk) > self.threshold:
+            # Roll over to disk; the named file lets other processes read it
+            fd, self.path = tempfile.mkstemp(suffix=self.suffix)
+            self._file = os.fdopen(fd, "w+b")
+            self._file.write(self._buffer)
+            self._buffer = bytearray()
+
+        if self._file is None:
+            self._buffer.extend(chunk)
+        else:
+            self._file.write(chunk)
+
+    def payload(self):
+        """Body to upload: bytes when small, otherwise the file rewound to the start"""
+        if self._file is None:
+            return bytes(self._buffer)
+        self._file.flush()
+        self._file.seek(0)
+        return self._file
+
+    def close(self):
+        """Release the buffer and delete the temporary file"""
+        self._buffer = bytearray()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self.path is not None:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+async def read_image(response: aiohttp.ClientResponse, max_bytes: int,
+                     spool_threshold: int = 1024 * 1024) -> dict:
+    """Stream an image response into an ImageSpool, enforcing a byte cap and image type"""
+    declared_type = response.content_type
+    if declared_type and not declared_type.startswith("image/") and declared_type not in ACCEPTED_CONTENT_TYPES:
+        return {"success": False, "error": f"URL is not an image ({declared_type})"}
+
+    if response.content_length is not None and response.content_length > max_bytes:
+        return {
+            "success": False,
+            "error": f"Image is too large ({response.content_length} bytes, max {max_bytes})"
+        }
+
+    spool = ImageSpool(spool_threshold)
+    try:
+        head = b""
+        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+            if spool.size + len(chunk) > max_bytes:
+                spool.close()
+                return {"success": False, "error": f"Image is too large (max {max_bytes} bytes)"}
+
+            # Check the file signature as soon as enough bytes have arrived
+            if spool.content_type is None and len(head) < 16:
+                head += chunk[:16 - len(head)]
+                if len(head) >= 16:
+                    spool.content_type = sniff_image_type(head)
+                    if spool.content_type is None:
+                        spool.close()
+                        return {"success": False, "error": "URL is not a supported image"}
+
+            spool.write(chunk)
+
+        if spool.content_type is None:
+            spool.content_type = sniff_image_type(head)
+            if spool.content_type is None:
+                spool.close()
+                return {"success": False, "error": "URL is not a supported image"}
+
+        return {"success": True, "spool": spool}
+
+    except BaseException:
+        spool.close()
+        raise
@@ -0,0 +1,74 @@
+import io
+import os
+
+from PIL import Image, ImageOps
+
+# Longest edge and encoding per reference type. Luma only needs enough
+# detail to condition on, so larger images are downsized before upload.
+PROFILES = {
+    "image_ref": {"max_edge": 1536, "format": "JPEG", "quality": 90},
+    "style_ref": {"max_edge": 1024, "format": "JPEG", "quality": 85},
+    "character_ref": {"max_edge": 1536, "format": "JPEG", "quality": 92},
+    "modify_image_ref": {"max_edge": 2048, "format": "JPEG", "quality": 92},
+    "keyframe": {"max_edge": 2048, "format": "JPEG", "quality": 92},
+}
+
+CONTENT_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+# Already-compressed images under this size and within the edge limit are left alone
+PASSTHROUGH_BYTES = 512 * 1024
+
+
+def preprocess_image(source, max_edge: int, image_format: str = "JPEG", quality: int = 90) -> dict:
+    """Downsize and re-encode an image; runs in a worker process
+
+    source is the image as bytes or a file path. Returns the encoded
+    bytes, or changed=False when the original is already small enough.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        size = len(source)
+        image = Image.open(io.BytesIO(source))
+    else:
+        size = os.path.getsize(source)
+        image = Image.open(source)
+
+    with image:
+        original_format = image.format
+        original_size = image.size
+        if (max(original_size) <= max_edge and size <= PASSTHROUGH_BYTES
+                and original_format in ("JPEG", "WEBP")):
+            return {"changed": False, "width": original_size[0], "height": original_size[1]}
+
+        # Let the JPEG decoder scale down while decoding
+        if original_format == "JPEG":
+            image.draft("RGB", (max_edge, max_edge))
+
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+        # JPEG has no alpha channel, so keep transparency as WebP
+        has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+        if has_alpha and image_format == "JPEG":
+            image_format = "WEBP"
+        if image_format == "JPEG" and image.mode != "RGB":
+            image = image.convert("RGB")
+        elif image_format == "WEBP" and image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if has_alpha else "RGB")
+
+        output = io.BytesIO()
+        image.save(output, image_format, quality=quality, optimize=True)
+
+    data = output.getvalue()
+    if len(data) >= size and max(original_size) <= max_edge:
+        # Re-encoding did not help; keep the original
+        return {"changed": False, "width": original_size[0], "height": original_size[1]}
+
+    return {
+        "changed": True,
+        "data": data,
+        "content_type": CONTENT_TYPES[image_format],
+        "width": image.size[0],
+        "height": image.size[1],
+        "original_bytes": size,
+        "bytes": len(data)
+    }
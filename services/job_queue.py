@@ -0,0 +1,440 @@
+import asyncio
+import contextvars
+import inspect
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from services.luma_service import LumaService
+from services.metrics import JOBS_IN_FLIGHT, POLLS_PER_JOB
+from services.poll_schedule import AdaptiveSchedule
+
+log = logging.getLogger("luma.queue")
+
+# LumaService methods the bot process may run in a worker
+CREATE_METHODS = {
+    "create_capture", "create_capture_with_ref", "create_capture_with_style", "create_capture_with_char",
+    "create_capture_with_mod", "create_video", "create_image_video", "extend_video"
+}
+WAIT_METHODS = {"wait_for_generation", "wait_for_video_generation"}
+# Job type of a wait whose call doesn't name one
+WAIT_JOB_TYPES = {"wait_for_generation": "image", "wait_for_video_generation": "t2v"}
+STATUS_METHODS = {"get_capture_status", "get_video_status"}
+REMOTE_METHODS = CREATE_METHODS | WAIT_METHODS | STATUS_METHODS | {"cancel_generation"}
+
+# Safe to run again when the worker running them disappears
+RETRYABLE_METHODS = WAIT_METHODS | STATUS_METHODS
+
+# Lower runs first: cancels free capacity, and creates are what users are waiting to see start
+PRIORITIES = {"cancel_generation": 0, **{method: 2 for method in WAIT_METHODS}}
+
+CANCELLED = {"success": False, "cancelled": True, "status": "cancelled", "error": "Generation cancelled"}
+
+
+class JobQueue:
+    """Durable SQLite queue of LumaService calls shared by bot and worker processes
+
+    The bot submits a task per call; a worker claims it, runs it and
+    replaces it with a result row that the bot reads back in order.
+    Workers renew a lease on the tasks they hold, and tasks of a worker
+    whose lease runs out are retried if they are safe to repeat, or
+    answered with an error otherwise.
+    """
+
+    def __init__(self, path: str = "queue.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        # One thread keeps this process's queries in the order they were made
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="job-queue")
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS tasks ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " method TEXT NOT NULL,"
+            " params TEXT NOT NULL,"
+            " priority INTEGER NOT NULL,"
+            " state TEXT NOT NULL DEFAULT 'queued',"
+            " worker TEXT,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " created_at REAL NOT NULL,"
+            " heartbeat_at REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS tasks_queued ON tasks (state, priority, id)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " task_id INTEGER NOT NULL,"
+            " result TEXT NOT NULL,"
+            " created_at REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    async def _run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    def _submit(self, method: str, params: str, priority: int) -> int:
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO tasks (method, params, priority, created_at) VALUES (?, ?, ?, ?)",
+                (method, params, priority, time.time())
+            )
+            self._db.commit()
+            return cursor.lastrowid
+
+    async def submit(self, method: str, params: dict) -> int:
+        """Queue a call and return its task ID"""
+        return await self._run(self._submit, method, json.dumps(params), PRIORITIES.get(method, 1))
+
+    def _claim(self, worker: str, limit: int) -> list:
+        now = time.time()
+        with self._lock:
+            rows = self._db.execute(
+                "UPDATE tasks SET state = 'running', worker = ?, attempts = attempts + 1, heartbeat_at = ? "
+                "WHERE id IN (SELECT id FROM tasks WHERE state = 'queued' ORDER BY priority, id LIMIT ?) "
+                "RETURNING id, method, params",
+                (worker, now, limit)
+            ).fetchall()
+            self._db.commit()
+        return [(task_id, method, json.loads(params)) for task_id, method, params in rows]
+
+    async def claim(self, worker: str, limit: int = 1) -> list:
+        """Take up to limit queued tasks as (task_id, method, params), highest priority first"""
+        return await self._run(self._claim, worker, limit)
+
+    def _complete(self, task_id: int, result: str):
+        with self._lock:
+            self._db.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+            self._db.execute(
+                "INSERT INTO results (task_id, result, created_at) VALUES (?, ?, ?)",
+                (task_id, result, time.time())
+            )
+            self._db.commit()
+
+    async def complete(self, task_id: int, result: dict):
+        """Replace a task with its result"""
+        await self._run(self._complete, task_id, json.dumps(result, default=str))
+
+    def _results_after(self, seq: int) -> list:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT seq, task_id, result FROM results WHERE seq > ? ORDER BY seq", (seq,)
+            ).fetchall()
+        return [(row_seq, task_id, json.loads(result)) for row_seq, task_id, result in rows]
+
+    async def results_after(self, seq: int) -> list:
+        """Results written after seq, as (seq, task_id, result)"""
+        return await self._run(self._results_after, seq)
+
+    def _last_seq(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(MAX(seq), 0) FROM results").fetchone()[0]
+
+    async def last_seq(self) -> int:
+        return await self._run(self._last_seq)
+
+    def _discard(self, task_ids: list):
+        with self._lock:
+            for start in range(0, len(task_ids), 500):
+                chunk = task_ids[start:start + 500]
+                marks = ", ".join("?" * len(chunk))
+                self._db.execute(f"DELETE FROM results WHERE task_id IN ({marks})", chunk)
+                self._db.execute(f"DELETE FROM tasks WHERE state = 'queued' AND id IN ({marks})", chunk)
+            self._db.commit()
+
+    async def discard(self, task_ids: list):
+        """Drop the results of these tasks, and the tasks themselves if no worker has claimed them"""
+        await self._run(self._discard, list(task_ids))
+
+    def _heartbeat(self, worker: str):
+        with self._lock:
+            self._db.execute(
+                "UPDATE tasks SET heartbeat_at = ? WHERE worker = ? AND state = 'running'", (time.time(), worker)
+            )
+            self._db.commit()
+
+    async def heartbeat(self, worker: str):
+        """Renew the lease on every task the worker is running"""
+        await self._run(self._heartbeat, worker)
+
+    def _recover(self, lease: float, retention: float, worker: str = None) -> tuple:
+        now = time.time()
+        with self._lock:
+            if worker is None:
+                rows = self._db.execute(
+                    "SELECT id, method FROM tasks WHERE state = 'running' AND heartbeat_at < ?", (now - lease,)
+                ).fetchall()
+            else:
+                rows = self._db.execute(
+                    "SELECT id, method FROM tasks WHERE state = 'running' AND worker = ?", (worker,)
+                ).fetchall()
+
+            requeued = failed = 0
+            for task_id, method in rows:
+                if method in RETRYABLE_METHODS:
+                    self._db.execute(
+                        "UPDATE tasks SET state = 'queued', worker = NULL WHERE id = ?", (task_id,)
+                    )
+                    requeued += 1
+                else:
+                    # It may already have reached Luma, so running it again could create a duplicate
+                    self._db.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+                    self._db.execute(
+                        "INSERT INTO results (task_id, result, created_at) VALUES (?, ?, ?)",
+                        (task_id, json.dumps({"success": False, "error": "The generation worker stopped"}), now)
+                    )
+                    failed += 1
+
+            # Results nobody collected, e.g. of a bot process that stopped
+            self._db.execute("DELETE FROM results WHERE created_at < ?", (now - retention,))
+            self._db.commit()
+        return requeued, failed
+
+    async def recover(self, lease: float, retention: float = 3600) -> tuple:
+        """Retry or fail tasks whose worker stopped renewing its lease; returns (requeued, failed)"""
+        return await self._run(self._recover, lease, retention)
+
+    async def release(self, worker: str) -> tuple:
+        """Give back every task a stopping worker still holds"""
+        return await self._run(self._recover, 0, 3600, worker)
+
+    def _stats(self) -> dict:
+        with self._lock:
+            rows = self._db.execute("SELECT state, COUNT(*) FROM tasks GROUP BY state").fetchall()
+            results = self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        return dict({"queued": 0, "running": 0}, **dict(rows), results=results)
+
+    async def stats(self) -> dict:
+        """Queued and running tasks, and results not yet collected"""
+        return await self._run(self._stats)
+
+    async def close(self):
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            self._db.close()
+
+
+class QueuedLuma:
+    """Stands in for LumaService in the bot process, running its calls in workers
+
+    Each call to a method in REMOTE_METHODS is queued and answered by
+    whichever worker claims it, with the same result LumaService would
+    return. Waits return progress updates as usual, so the bot polls
+    nothing itself. Cancelling ends the bot's waits on a generation at
+    once, like the poller does, before the worker deletes it upstream.
+    """
+
+    def __init__(self, queue: JobQueue, poll_interval: float = 0.1, timeout: float = 600,
+                 schedule_path: str = None):
+        self.queue = queue
+        self.poll_interval = poll_interval
+        self.timeout = timeout  # seconds a call may wait for a worker to answer
+        # Completion times saved by the workers' poll schedules, for ETAs
+        self.schedule = AdaptiveSchedule(path=schedule_path)
+        self._futures = {}  # task_id -> future for the call's result
+        self._waits = {}  # generation_id -> task IDs of waits on it
+        self._wait_types = {}  # generation_id -> job type
+        self.completed_jobs = 0
+        self.completed_polls = 0
+        self._last_seq = 0
+        self._task = None
+
+    async def start(self):
+        """Start reading results, skipping any written before this process started"""
+        if self._task is not None:
+            return
+        self._last_seq = await self.queue.last_seq()
+        loop = asyncio.get_running_loop()
+        self._task = contextvars.Context().run(loop.create_task, self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for future in self._futures.values():
+            if not future.done():
+                future.set_result({"success": False, "stopped": True, "error": "Bot is shutting down"})
+        await self.queue.close()
+
+    def __getattr__(self, name: str):
+        if name in REMOTE_METHODS:
+            signature = inspect.signature(getattr(LumaService, name))
+
+            async def call(*args, **kwargs):
+                # Name every argument so the worker can call the method with keywords
+                params = signature.bind(self, *args, **kwargs).arguments
+                params.pop("self")
+                return await self._call(name, dict(params))
+            return call
+        raise AttributeError(name)
+
+    async def _call(self, method: str, params: dict) -> dict:
+        task_id = await self.queue.submit(method, params)
+        future = asyncio.get_running_loop().create_future()
+        self._futures[task_id] = future
+        generation_id = params.get("generation_id") if method in WAIT_METHODS else None
+        if generation_id is not None:
+            self._waits.setdefault(generation_id, set()).add(task_id)
+            self._wait_types[generation_id] = params.get("job_type") or WAIT_JOB_TYPES[method]
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), self.timeout)
+            if result.get("success") and "polls" in result and len(self._waits.get(generation_id, ())) == 1:
+                # Count each generation once, when its last waiter has the result
+                self.completed_jobs += 1
+                self.completed_polls += result["polls"]
+            return result
+        except asyncio.TimeoutError:
+            log.warning("No worker answered", extra={"method": method, "task_id": task_id})
+            await self.queue.discard([task_id])
+            return {"success": False, "error": "Timed out waiting for a generation worker"}
+        finally:
+            self._futures.pop(task_id, None)
+            if generation_id is not None:
+                waits = self._waits.get(generation_id, set())
+                waits.discard(task_id)
+                if not waits:
+                    self._waits.pop(generation_id, None)
+                    self._wait_types.pop(generation_id, None)
+
+    async def cancel_generation(self, generation_id: str) -> dict:
+        """End local waits on a generation, then have a worker stop and delete it"""
+        for task_id in self._waits.get(generation_id, ()):
+            future = self._futures.get(task_id)
+            if future is not None and not future.done():
+                future.set_result(dict(CANCELLED))
+        return await self._call("cancel_generation", {"generation_id": generation_id})
+
+    def pending_by_type(self) -> dict:
+        """Generations this process is waiting on, per job type"""
+        counts = {}
+        for job_type in self._wait_types.values():
+            counts[job_type] = counts.get(job_type, 0) + 1
+        return counts
+
+    def bind_metrics(self):
+        """Report the generations waited on here and the polls workers made for them"""
+        JOBS_IN_FLIGHT.set_function(
+            lambda: {(job_type,): count for job_type, count in self.pending_by_type().items()}
+        )
+        POLLS_PER_JOB.set_function(
+            lambda: self.completed_polls / self.completed_jobs if self.completed_jobs else 0.0
+        )
+
+    def expected_duration(self, job_type: str, model: str = None) -> float:
+        """Typical seconds from creation to completion, as last saved by the workers"""
+        low, high = self.schedule.expected_window(job_type, model)
+        return (low + high) / 2
+
+    async def _run(self):
+        while True:
+            try:
+                rows = await self.queue.results_after(self._last_seq)
+                mine = []
+                for seq, task_id, result in rows:
+                    self._last_seq = seq
+                    future = self._futures.get(task_id)
+                    if future is None:
+                        # Another bot process's call
+                        continue
+                    mine.append(task_id)
+                    if not future.done():
+                        future.set_result(result)
+                if mine:
+                    await self.queue.discard(mine)
+                if rows:
+                    continue
+            except Exception:
+                log.exception("Reading queue results failed")
+            await asyncio.sleep(self.poll_interval)
+
+
+class QueueWorker:
+    """Runs queued LumaService calls, many at a time
+
+    Claims tasks while it has fewer than concurrency running, renews its
+    lease on them every lease / 3 seconds and recovers tasks from
+    workers whose lease has lapsed. Waits spend most of their time idle
+    in the shared poller, so concurrency can be far above the CPU count.
+    """
+
+    def __init__(self, queue: JobQueue, luma, concurrency: int = 200, poll_interval: float = 0.1,
+                 lease: float = 60):
+        self.queue = queue
+        self.luma = luma
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self.completed = 0
+        self._running = {}  # task -> method
+        self._stopping = None
+
+    async def run(self, grace: float = 30):
+        """Run tasks until stop() is called, then give back the ones still running"""
+        self._stopping = asyncio.Event()
+        maintenance = asyncio.create_task(self._maintain())
+        log.info("Worker started", extra={"worker": self.name, "concurrency": self.concurrency})
+        try:
+            while not self._stopping.is_set():
+                free = self.concurrency - len(self._running)
+                tasks = await self.queue.claim(self.name, free) if free > 0 else []
+                for task_id, method, params in tasks:
+                    task = asyncio.create_task(self._execute(task_id, method, params))
+                    self._running[task] = method
+                    task.add_done_callback(lambda task: self._running.pop(task, None))
+                if len(tasks) < free or free <= 0:
+                    try:
+                        await asyncio.wait_for(self._stopping.wait(), self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            # Waits are handed to another worker; other calls get grace seconds to finish
+            running = list(self._running)
+            for task, method in list(self._running.items()):
+                if method in RETRYABLE_METHODS:
+                    task.cancel()
+            if running:
+                await asyncio.wait(running, timeout=grace)
+            maintenance.cancel()
+            for task in running:
+                task.cancel()
+            await asyncio.gather(maintenance, *running, return_exceptions=True)
+            requeued, failed = await self.queue.release(self.name)
+            log.info("Worker stopped", extra={"worker": self.name, "requeued": requeued, "failed": failed})
+
+    def stop(self):
+        if self._stopping is not None:
+            self._stopping.set()
+
+    async def _execute(self, task_id: int, method: str, params: dict):
+        if method not in REMOTE_METHODS:
+            result = {"success": False, "error": f"Unknown method: {method}"}
+        else:
+            try:
+                result = await getattr(self.luma, method)(**params)
+            except Exception as e:
+                log.exception("Queued call failed", extra={"method": method, "task_id": task_id})
+                result = {"success": False, "error": f"Unexpected error: {str(e)}"}
+        await self.queue.complete(task_id, result)
+        self.completed += 1
+
+    async def _maintain(self):
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                await self.queue.heartbeat(self.name)
+                requeued, failed = await self.queue.recover(self.lease)
+                if requeued or failed:
+                    log.warning("Recovered tasks from a stopped worker", extra={"requeued": requeued, "failed": failed})
+            except Exception:
+                log.exception("Queue maintenance failed")
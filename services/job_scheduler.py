@@ -0,0 +1,157 @@
+import asyncio
+import bisect
+import itertools
+import logging
+
+log = logging.getLogger("luma.scheduler")
+
+# Relative cost of a job when sharing capacity; videos take several times longer than images
+JOB_COSTS = {"image": 1, "t2v": 3, "i2v": 3, "extend": 3}
+
+
+class Ticket:
+    """A user's place in the scheduler, held until the job is released"""
+
+    def __init__(self, scheduler: "JobScheduler", user_id, guild_id, job_type: str, tag: float, seq: int):
+        self.scheduler = scheduler
+        self.user_id = user_id
+        self.guild_id = guild_id
+        self.job_type = job_type
+        self.tag = tag  # virtual finish time; lower tags start first
+        self.seq = seq
+        self.state = "queued"  # queued, running or released
+        self.queued_at = asyncio.get_running_loop().time()
+        self._started = asyncio.get_running_loop().create_future()
+
+    def __lt__(self, other: "Ticket") -> bool:
+        return (self.tag, self.seq) < (other.tag, other.seq)
+
+    @property
+    def position(self) -> int:
+        """1-based place in the queue, or 0 once the job may run"""
+        if self.state != "queued":
+            return 0
+        return self.scheduler._queue.index(self) + 1
+
+    async def wait(self) -> float:
+        """Wait until the job may run; returns the seconds spent queued"""
+        try:
+            await asyncio.shield(self._started)
+        except asyncio.CancelledError:
+            self.release()
+            raise
+        return self._started.result()
+
+    def release(self):
+        """Give the slot (or queue place) back; safe to call more than once"""
+        self.scheduler._release(self)
+
+
+class JobScheduler:
+    """Admits generation jobs under global, per-guild and per-user limits
+
+    Waiting jobs are ordered by weighted fair queuing: each user's jobs
+    get virtual finish times that advance by cost / weight, so a user who
+    submits many jobs interleaves with everyone else instead of running
+    them back to back. A job whose user or guild is at its limit is
+    skipped until a slot frees up, without blocking jobs behind it.
+    """
+
+    def __init__(self, max_global: int = 8, max_per_guild: int = 4, max_per_user: int = 2,
+                 weights: dict = None):
+        self.max_global = max_global
+        self.max_per_guild = max_per_guild
+        self.max_per_user = max_per_user
+        self.weights = dict(weights or {})
+
+        self._queue = []  # queued tickets sorted by (tag, seq)
+        self._running = 0
+        self._running_by_guild = {}
+        self._running_by_user = {}
+        self._tickets_by_user = {}
+        self._finish_by_user = {}
+        self._virtual_time = 0.0
+        self._sequence = itertools.count()
+
+    def submit(self, user_id, guild_id=None, job_type: str = "image") -> Ticket:
+        """Queue a job and start it at once if limits allow"""
+        cost = JOB_COSTS.get(job_type, 1) / self.weights.get(user_id, 1)
+        start = max(self._virtual_time, self._finish_by_user.get(user_id, 0.0))
+        self._finish_by_user[user_id] = start + cost
+
+        ticket = Ticket(self, user_id, guild_id, job_type, start + cost, next(self._sequence))
+        bisect.insort(self._queue, ticket)
+        self._tickets_by_user[user_id] = self._tickets_by_user.get(user_id, 0) + 1
+        self._dispatch()
+
+        if ticket.state == "queued":
+            log.info(
+                "Job queued",
+                extra={"user_id": user_id, "guild_id": guild_id, "job_type": job_type, "position": ticket.position}
+            )
+        return ticket
+
+    def _can_start(self, ticket: Ticket) -> bool:
+        if self._running_by_user.get(ticket.user_id, 0) >= self.max_per_user:
+            return False
+        # Commands outside a guild (DMs) only count toward the user and global limits
+        if ticket.guild_id is not None and self._running_by_guild.get(ticket.guild_id, 0) >= self.max_per_guild:
+            return False
+        return True
+
+    def _dispatch(self):
+        index = 0
+        while index < len(self._queue) and self._running < self.max_global:
+            ticket = self._queue[index]
+            if not self._can_start(ticket):
+                index += 1
+                continue
+
+            del self._queue[index]
+            ticket.state = "running"
+            self._running += 1
+            self._running_by_user[ticket.user_id] = self._running_by_user.get(ticket.user_id, 0) + 1
+            if ticket.guild_id is not None:
+                self._running_by_guild[ticket.guild_id] = self._running_by_guild.get(ticket.guild_id, 0) + 1
+
+            cost = JOB_COSTS.get(ticket.job_type, 1) / self.weights.get(ticket.user_id, 1)
+            self._virtual_time = max(self._virtual_time, ticket.tag - cost)
+            waited = asyncio.get_running_loop().time() - ticket.queued_at
+            if not ticket._started.done():
+                ticket._started.set_result(waited)
+
+    @staticmethod
+    def _decrement(counts: dict, key):
+        counts[key] -= 1
+        if counts[key] <= 0:
+            del counts[key]
+
+    def _release(self, ticket: Ticket):
+        if ticket.state == "released":
+            return
+
+        if ticket.state == "running":
+            self._running -= 1
+            self._decrement(self._running_by_user, ticket.user_id)
+            if ticket.guild_id is not None:
+                self._decrement(self._running_by_guild, ticket.guild_id)
+        else:
+            self._queue.remove(ticket)
+            ticket._started.cancel()
+        ticket.state = "released"
+
+        # Forget users with nothing left once their finish time has passed
+        self._decrement(self._tickets_by_user, ticket.user_id)
+        if (ticket.user_id not in self._tickets_by_user
+                and self._finish_by_user.get(ticket.user_id, 0.0) <= self._virtual_time):
+            self._finish_by_user.pop(ticket.user_id, None)
+
+        self._dispatch()
+
+    def stats(self) -> dict:
+        return {
+            "running": self._running,
+            "queued": len(self._queue),
+            "users": len(self._tickets_by_user),
+            "guilds_running": len(self._running_by_guild)
+        }
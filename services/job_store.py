@@ -0,0 +1,191 @@
+import asyncio
+import contextvars
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.getLogger("luma.jobs")
+
+COLUMNS = (
+    "generation_id", "kind", "job_type", "model", "interaction_id", "channel_id", "guild_id", "user_id",
+    "state", "delivered", "created_at", "updated_at"
+)
+
+
+class JobStore:
+    """Durable record of generations the bot still owes a result for
+
+    Backed by SQLite in WAL mode. record(), update() and complete() only
+    stage the change in memory; a background task writes staged changes
+    in one transaction every flush_interval seconds, so the command path
+    never waits on the disk. Delivered jobs are purged after retention
+    seconds.
+
+    There is one row per interaction waiting on a generation, so a
+    generation shared by identical requests is delivered to each of them.
+    """
+
+    def __init__(self, path: str = "jobs.db", flush_interval: float = 0.5, retention: float = 7 * 86400):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.retention = retention
+        self.closed = False
+
+        self._staged = {}  # (generation_id, interaction_id or None for all) -> columns to write
+        self._task = None
+        self._lock = threading.Lock()
+        # One writer thread keeps batches in the order they were staged
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="job-store")
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " generation_id TEXT NOT NULL,"
+            " kind TEXT NOT NULL,"
+            " job_type TEXT,"
+            " model TEXT,"
+            " interaction_id INTEGER,"
+            " channel_id INTEGER,"
+            " guild_id INTEGER,"
+            " user_id INTEGER,"
+            " state TEXT,"
+            " delivered INTEGER NOT NULL DEFAULT 0,"
+            " created_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL,"
+            " PRIMARY KEY (generation_id, interaction_id))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_delivered ON jobs (delivered, updated_at)")
+        self._db.commit()
+
+    def start(self):
+        if self._task is None:
+            loop = asyncio.get_running_loop()
+            self._task = contextvars.Context().run(loop.create_task, self._run())
+
+    def _stage(self, generation_id: str, interaction_id: int = None, **columns):
+        if self.closed:
+            return
+        columns["updated_at"] = time.time()
+        # Move the key to the end so changes are written in the order they were made
+        staged = self._staged.pop((generation_id, interaction_id), {})
+        staged.update(columns)
+        self._staged[(generation_id, interaction_id)] = staged
+
+    def record(self, generation_id: str, kind: str, job_type: str = None, model: str = None,
+               interaction_id: int = None, channel_id: int = None, guild_id: int = None,
+               user_id: int = None, state: str = None):
+        """Remember a newly created generation and where to deliver its result"""
+        self._stage(
+            generation_id,
+            interaction_id,
+            kind=kind,
+            job_type=job_type,
+            model=model,
+            channel_id=channel_id,
+            guild_id=guild_id,
+            user_id=user_id,
+            state=state or "queued",
+            delivered=0,
+            created_at=time.time()
+        )
+
+    def update(self, generation_id: str, state: str):
+        """Record the latest Luma state of a pending generation for everyone waiting on it"""
+        self._stage(generation_id, state=state)
+
+    def complete(self, generation_id: str, state: str, interaction_id: int = None):
+        """Mark the result as delivered to interaction_id (or everyone) so it is not resumed after a restart"""
+        self._stage(generation_id, interaction_id, state=state, delivered=1)
+
+    def _write(self, staged: dict):
+        now = time.time()
+        with self._lock:
+            try:
+                for (generation_id, interaction_id), columns in staged.items():
+                    if "kind" in columns:
+                        # A new job, possibly already updated before this flush
+                        names = ["generation_id", "interaction_id"] + list(columns)
+                        updates = ", ".join(f"{name} = excluded.{name}" for name in columns)
+                        self._db.execute(
+                            f"INSERT INTO jobs ({', '.join(names)}) VALUES ({', '.join('?' * len(names))}) "
+                            f"ON CONFLICT (generation_id, interaction_id) DO UPDATE SET {updates}",
+                            [generation_id, interaction_id] + list(columns.values())
+                        )
+                    elif interaction_id is not None:
+                        updates = ", ".join(f"{name} = ?" for name in columns)
+                        self._db.execute(
+                            f"UPDATE jobs SET {updates} WHERE generation_id = ? AND interaction_id = ?",
+                            list(columns.values()) + [generation_id, interaction_id]
+                        )
+                    else:
+                        # Every waiter still owed the result; delivered rows keep their final state
+                        updates = ", ".join(f"{name} = ?" for name in columns)
+                        self._db.execute(
+                            f"UPDATE jobs SET {updates} WHERE generation_id = ? AND delivered = 0",
+                            list(columns.values()) + [generation_id]
+                        )
+                self._db.execute(
+                    "DELETE FROM jobs WHERE delivered = 1 AND updated_at < ?", (now - self.retention,)
+                )
+                self._db.commit()
+            except BaseException:
+                # Leave nothing half-written for the next transaction to commit
+                self._db.rollback()
+                raise
+
+    async def flush(self):
+        """Write every staged change in one transaction
+
+        A batch that fails to write, e.g. while another process holds the
+        database locked, is staged again for the next flush, under any
+        changes staged since.
+        """
+        staged, self._staged = self._staged, {}
+        if not staged:
+            return
+        try:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._write, staged)
+        except BaseException:
+            for key, columns in self._staged.items():
+                staged[key] = dict(staged.get(key, {}), **columns)
+            self._staged = staged
+            raise
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                log.exception("Job store flush failed")
+
+    def _select_pending(self) -> list:
+        with self._lock:
+            cursor = self._db.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM jobs WHERE delivered = 0 ORDER BY created_at"
+            )
+            return [dict(zip(COLUMNS, row)) for row in cursor.fetchall()]
+
+    async def pending_jobs(self) -> list:
+        """Jobs created but not yet delivered, oldest first"""
+        await self.flush()
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._select_pending)
+
+    async def close(self):
+        """Write staged changes and stop accepting new ones"""
+        self.closed = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            self._db.close()
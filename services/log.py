@@ -0,0 +1,134 @@
+import contextvars
+import json
+import logging
+import os
+import sys
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Correlation IDs for the command or generation currently being handled
+interaction_id_var = contextvars.ContextVar("interaction_id", default=None)
+generation_id_var = contextvars.ContextVar("generation_id", default=None)
+
+# Attributes every LogRecord has; anything else was passed with extra=
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+@contextmanager
+def log_context(interaction_id=None, generation_id=None):
+    """Attach correlation IDs to every log record emitted inside the block"""
+    tokens = []
+    if interaction_id is not None:
+        tokens.append((interaction_id_var, interaction_id_var.set(str(interaction_id))))
+    if generation_id is not None:
+        tokens.append((generation_id_var, generation_id_var.set(str(generation_id))))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+def bind_interaction(interaction_id):
+    """Set the interaction ID for the rest of the current task"""
+    interaction_id_var.set(str(interaction_id))
+
+
+def bind_generation(generation_id: str):
+    """Set the generation ID for the rest of the current task"""
+    generation_id_var.set(str(generation_id))
+
+
+def _extra_fields(record: logging.LogRecord) -> dict:
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS}
+
+
+class ContextFilter(logging.Filter):
+    """Copies correlation IDs from the context onto each record"""
+
+    def filter(self, record):
+        if getattr(record, "interaction_id", None) is None:
+            record.interaction_id = interaction_id_var.get()
+        if getattr(record, "generation_id", None) is None:
+            record.generation_id = generation_id_var.get()
+        return True
+
+
+class SampleFilter(logging.Filter):
+    """Lets through the first and every Nth repetitive record per key
+
+    A record opts in by passing sample_key in extra (e.g. the generation
+    ID of a status check). Records whose state differs from the last one
+    seen for that key always pass, so transitions are never dropped.
+    """
+
+    def __init__(self, every: int = 10, max_keys: int = 10000):
+        super().__init__()
+        self.every = max(1, every)
+        self.max_keys = max_keys
+        self._seen = OrderedDict()
+
+    def filter(self, record):
+        key = getattr(record, "sample_key", None)
+        if key is None:
+            return True
+
+        state = getattr(record, "state", None)
+        count, last_state = self._seen.pop(key, (0, None))
+        self._seen[key] = (count + 1, state)
+        if len(self._seen) > self.max_keys:
+            self._seen.popitem(last=False)
+
+        return count % self.every == 0 or state != last_state
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, including correlation IDs and extra fields"""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage()
+        }
+        for key, value in _extra_fields(record).items():
+            if value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable lines with extra fields appended as compact JSON"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s: %(message)s")
+
+    def format(self, record):
+        line = super().format(record)
+        fields = {key: value for key, value in _extra_fields(record).items() if value is not None}
+        if fields:
+            line += " " + json.dumps(fields, default=str, ensure_ascii=False, separators=(",", ":"))
+        return line
+
+
+def setup_logging(level: str = None, fmt: str = None, poll_sample_every: int = None):
+    """Configure the root logger from arguments or LOG_LEVEL, LOG_FORMAT and LOG_POLL_SAMPLE"""
+    level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+    fmt = (fmt or os.getenv("LOG_FORMAT", "json")).lower()
+    if poll_sample_every is None:
+        poll_sample_every = int(os.getenv("LOG_POLL_SAMPLE", 10))
+
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JSONFormatter() if fmt == "json" else TextFormatter())
+    handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+
+    # Status checks repeat for every pending generation; keep a sample
+    poll_logger = logging.getLogger("luma.poll")
+    poll_logger.filters[:] = [SampleFilter(poll_sample_every)]
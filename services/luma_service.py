@@ -1,39 +1,291 @@
-import requests
+import aiohttp
 import os
 from dotenv import load_dotenv
 import json
 import asyncio
-import tempfile
-from pathlib import Path
-import base64
 import time
 import mimetypes
-from PIL import Image
-import io
+from dataclasses import dataclass, field
+from typing import Mapping
+from services.generation_poller import GenerationPoller
+from services.poll_schedule import AdaptiveSchedule
+from services.callback_server import CallbackServer
+from services.rehost_cache import RehostCache
+from services.image_ingest import read_image
+from services.image_processing import PROFILES, preprocess_image
+from services.metrics import (
+    API_RESPONSES, DEDUP_HITS, JOBS_IN_FLIGHT, POLLS_PER_JOB, RATE_LIMIT_WAIT_SECONDS, REHOST_CACHE_ENTRIES,
+    REHOST_CACHE_LOOKUPS, REHOST_SECONDS, STATUS_CACHE, timed_call
+)
+from services.tracing import current_span, span, traced
+from services.rate_limit import RateLimiter
+from services.dedup import GenerationDedup, request_key
+from services.settings import parse_id_map
+from services.status_cache import StatusCache
+from concurrent.futures import ProcessPoolExecutor
+import logging
+import multiprocessing
+
+
+log = logging.getLogger("luma.service")
+poll_log = logging.getLogger("luma.poll")
+
+# Rate limit bucket used by each Luma request operation
+RATE_LIMIT_BUCKETS = {"create": "create", "cancel": "create", "status": "status", "list": "status"}
+
+
+@dataclass
+class APIResponse:
+    """Fully-read HTTP response returned by LumaService._request"""
+    status: int
+    text: str
+    headers: Mapping[str, str] = field(default_factory=dict)
+
+    def json(self):
+        return json.loads(self.text)
+
 
 class LumaService:
-    def __init__(self):
+    def __init__(
+        self,
+        timeout: float = None,
+        connect_timeout: float = None,
+        pool_size: int = None,
+        pool_size_per_host: int = None,
+        dns_cache_ttl: int = None,
+        keepalive_timeout: float = None
+    ):
         load_dotenv()
-        self.base_url = "https://api.lumalabs.ai/dream-machine/v1"
+        # Endpoints can point at a local mock server (see tools/mock_server.py)
+        self.base_url = os.getenv('LUMA_API_BASE_URL', "https://api.lumalabs.ai/dream-machine/v1").rstrip("/")
+        self.imgbb_url = os.getenv('IMGBB_UPLOAD_URL', "https://api.imgbb.com/1/upload")
         self.headers = {
             "accept": "application/json",
             "content-type": "application/json",
             "authorization": f"Bearer {os.getenv('LUMA_API_KEY')}"
         }
         self.imgbb_key = os.getenv('IMGBB_API_KEY')  # Get ImgBB key from .env
-        
-    async def upload_to_imgbb(self, image_data):
-        """Upload image to ImgBB"""
+
+        # HTTP client settings, overridable from .env
+        self.timeout = aiohttp.ClientTimeout(
+            total=timeout or float(os.getenv('LUMA_HTTP_TIMEOUT', 60)),
+            connect=connect_timeout or float(os.getenv('LUMA_HTTP_CONNECT_TIMEOUT', 10))
+        )
+        self.pool_size = pool_size or int(os.getenv('LUMA_HTTP_POOL_SIZE', 100))
+        self.pool_size_per_host = pool_size_per_host or int(os.getenv('LUMA_HTTP_POOL_PER_HOST', 30))
+        self.dns_cache_ttl = dns_cache_ttl or int(os.getenv('LUMA_HTTP_DNS_TTL', 300))
+        self.keepalive_timeout = keepalive_timeout or float(os.getenv('LUMA_HTTP_KEEPALIVE', 30))
+
+        # Shared session, opened by start() and released by close()
+        self.session = None
+
+        # Request budgets shared by all handlers; a 429 pauses every Luma request
+        self.rate_limiter = RateLimiter(
+            {
+                "create": (float(os.getenv('LUMA_RATE_LIMIT_CREATE', 1)),
+                           int(os.getenv('LUMA_RATE_BURST_CREATE', 5))),
+                "status": (float(os.getenv('LUMA_RATE_LIMIT_STATUS', 10)),
+                           int(os.getenv('LUMA_RATE_BURST_STATUS', 20)))
+            },
+            max_backoff=float(os.getenv('LUMA_RATE_LIMIT_MAX_BACKOFF', 120))
+        )
+        self.rate_limit_retries = int(os.getenv('LUMA_RATE_LIMIT_RETRIES', 5))
+
+        # Status lookups for one generation share requests and recent answers
+        self.status_cache = StatusCache(
+            ttl=float(os.getenv('LUMA_STATUS_CACHE_TTL', 2)),
+            max_entries=int(os.getenv('LUMA_STATUS_CACHE_SIZE', 10000))
+        )
+
+        # Opt-in reuse of generations made for identical requests (TTL 0 = off)
+        self.dedup = GenerationDedup(
+            ttl=float(os.getenv('LUMA_DEDUP_TTL', 0)),
+            guild_ttls=parse_id_map(os.getenv('LUMA_DEDUP_GUILD_TTLS', ''))
+        )
+
+        # One poller checks every pending generation for all handlers
+        self.progress_interval = 30
+        poll_interval = float(os.getenv('LUMA_POLL_INTERVAL', 2))
+        self.poller = GenerationPoller(
+            self._fetch_status,
+            interval=poll_interval,
+            max_concurrency=int(os.getenv('LUMA_POLL_CONCURRENCY', 8)),
+            # Learned completion times outlive restarts; an empty path keeps them in memory
+            schedule=AdaptiveSchedule(
+                min_delay=poll_interval, path=os.getenv('LUMA_POLL_SCHEDULE_PATH', 'poll_schedule.json')
+            )
+        )
+
+        # Discord -> ImgBB rehost cache; an empty path disables it
+        self.rehost_cache = None
+        rehost_cache_path = os.getenv('LUMA_REHOST_CACHE_PATH', 'rehost_cache.db')
+        if rehost_cache_path:
+            self.rehost_cache = RehostCache(
+                rehost_cache_path,
+                ttl=float(os.getenv('LUMA_REHOST_CACHE_TTL', 30 * 86400)),
+                max_entries=int(os.getenv('LUMA_REHOST_CACHE_SIZE', 10000))
+            )
+
+        # Image ingestion limits: larger downloads are rejected, and bodies
+        # above the spool threshold are kept in a temporary file
+        self.max_image_bytes = int(os.getenv('LUMA_MAX_IMAGE_BYTES', 32 * 1024 * 1024))
+        self.image_spool_threshold = int(os.getenv('LUMA_IMAGE_SPOOL_BYTES', 1024 * 1024))
+
+        # Reference images are downsized in worker processes before upload
+        self.preprocess_images = os.getenv('LUMA_IMAGE_PREPROCESS', '1') not in ('0', 'false', 'no')
+        self.image_workers = int(os.getenv('LUMA_IMAGE_WORKERS', min(4, os.cpu_count() or 1)))
+        self._process_pool = None
+
+        # Global limit on concurrent rehosts across all requests
+        self.rehost_concurrency = int(os.getenv('LUMA_REHOST_CONCURRENCY', 4))
+        self._rehost_semaphore = None
+
+        # Optional receiver for generation callbacks; polling becomes a safety net
+        self.callback_server = None
+        callback_public_url = os.getenv('LUMA_CALLBACK_PUBLIC_URL')
+        if callback_public_url:
+            self.callback_server = CallbackServer(
+                self._on_callback,
+                public_url=callback_public_url,
+                secret=os.getenv('LUMA_CALLBACK_SECRET'),
+                host=os.getenv('LUMA_CALLBACK_HOST', '0.0.0.0'),
+                port=int(os.getenv('LUMA_CALLBACK_PORT', 8080))
+            )
+            self.poller.safety_net_interval = float(os.getenv('LUMA_CALLBACK_POLL_INTERVAL', 60))
+
+    def bind_metrics(self):
+        """Report this service's gauges whenever /metrics is scraped; call once, for the process's service"""
+        STATUS_CACHE.set_function(
+            lambda: {(counter,): value for counter, value in self.status_cache.stats().items()}
+        )
+        DEDUP_HITS.set_function(lambda: {
+            ("inflight",): self.dedup.inflight_hits,
+            ("recent",): self.dedup.recent_hits
+        })
+        JOBS_IN_FLIGHT.set_function(
+            lambda: {(job_type,): count for job_type, count in self.poller.pending_by_type().items()}
+        )
+        POLLS_PER_JOB.set_function(lambda: self.poller.stats()["polls_per_job"])
+        REHOST_CACHE_ENTRIES.set_function(lambda: self.rehost_stats().get("entries", 0))
+
+    async def start(self):
+        """Open the shared pooled HTTP session"""
+        if self.session is not None and not self.session.closed:
+            return
+
+        connector = aiohttp.TCPConnector(
+            limit=self.pool_size,
+            limit_per_host=self.pool_size_per_host,
+            ttl_dns_cache=self.dns_cache_ttl,
+            keepalive_timeout=self.keepalive_timeout
+        )
+        self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        self.poller.start()
+        if self.callback_server is not None:
+            await self.callback_server.start()
+
+    async def close(self):
+        """Stop polling and close the shared HTTP session and its pooled connections"""
+        if self.callback_server is not None:
+            await self.callback_server.stop()
+        await self.poller.stop()
+        self.poller.schedule.save()
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=False)
+            self._process_pool = None
+        if self.rehost_cache is not None:
+            self.rehost_cache.close()
+            self.rehost_cache = None
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Return the shared session, opening it on first use"""
+        if self.session is None or self.session.closed:
+            await self.start()
+        return self.session
+
+    async def _request(self, method: str, url: str, operation: str = "other", **kwargs) -> APIResponse:
+        """Send a request on the shared session and read the whole body
+
+        operation labels the request in the API response counter. Luma
+        operations first wait for a token from their rate limit bucket,
+        and a 429 pauses the whole client for Retry-After seconds before
+        the request is retried (up to rate_limit_retries times).
+        """
+        session = await self._get_session()
+        bucket = RATE_LIMIT_BUCKETS.get(operation)
+        attempt = 0
+        while True:
+            if bucket is not None:
+                waited = await self.rate_limiter.acquire(bucket)
+                if waited >= 0.001:
+                    RATE_LIMIT_WAIT_SECONDS.observe(waited, bucket=bucket)
+
+            with span(f"http.{operation}", http_method=method, attempt=attempt) as request_span:
+                try:
+                    async with session.request(method, url, **kwargs) as response:
+                        text = await response.text()
+                except Exception:
+                    API_RESPONSES.inc(endpoint=operation, code="error")
+                    raise
+                API_RESPONSES.inc(endpoint=operation, code=response.status)
+                if request_span is not None:
+                    request_span.set_attribute("http_status", response.status)
+
+            if response.status != 429 or bucket is None or attempt >= self.rate_limit_retries:
+                return APIResponse(response.status, text, response.headers)
+
+            # Without Retry-After, back off exponentially from one second
+            retry_after = RateLimiter.parse_retry_after(response.headers.get("Retry-After"))
+            self.rate_limiter.backoff(retry_after if retry_after is not None else 2 ** attempt)
+            attempt += 1
+
+    async def _get_generation(self, generation_id: str) -> APIResponse:
+        """GET a generation object through the status cache"""
+        endpoint = f"{self.base_url}/generations/{generation_id}"
+        return await self.status_cache.fetch(
+            generation_id,
+            lambda: self._request("GET", endpoint, operation="status", headers=self.headers)
+        )
+
+    async def _fetch_status(self, generation_id: str, kind: str) -> dict:
+        """Status lookup used by the poller"""
+        if kind == "video":
+            result = await self.get_video_status(generation_id)
+        else:
+            result = await self.get_capture_status(generation_id)
+
+        # Never hand a failed generation to later identical requests
+        details = result.get("details")
+        if result.get("status") == "failed" or (isinstance(details, dict) and details.get("state") == "failed"):
+            self.dedup.discard_generation(generation_id)
+        return result
+
+    @traced()
+    @timed_call
+    async def upload_to_imgbb(self, image_data, content_type: str = None):
+        """Upload image to ImgBB
+
+        image_data may be bytes or a binary file; files are streamed as a
+        multipart upload rather than read into memory.
+        """
         try:
-            url = "https://api.imgbb.com/1/upload"
-            payload = {
-                "key": self.imgbb_key,  # Use key from .env
-                "image": base64.b64encode(image_data).decode('utf-8')
-            }
-            
-            response = requests.post(url, data=payload)
-            
-            if response.status_code == 200:
+            url = self.imgbb_url
+            extension = mimetypes.guess_extension(content_type or "") or ""
+            payload = aiohttp.FormData()
+            payload.add_field("key", self.imgbb_key)  # Use key from .env
+            payload.add_field(
+                "image",
+                image_data,
+                filename=f"image{extension}",
+                content_type=content_type or "application/octet-stream"
+            )
+            
+            response = await self._request("POST", url, operation="imgbb_upload", data=payload)
+            
+            if response.status == 200:
                 data = response.json()
                 return {
                     "success": True,
@@ -42,7 +294,7 @@ class LumaService:
             else:
                 return {
                     "success": False,
-                    "error": f"ImgBB API Error: {response.status_code}"
+                    "error": f"ImgBB API Error: {response.status}"
                 }
                 
         except Exception as e:
@@ -51,19 +303,99 @@ class LumaService:
                 "error": f"Failed to upload to ImgBB: {str(e)}"
             }
 
-    async def download_and_upload_image(self, image_url: str) -> dict:
-        """Download image from Discord and upload to ImgBB"""
+    @traced()
+    @timed_call
+    async def preprocess_image(self, spool, ref_type: str) -> dict:
+        """Downsize and re-encode a spooled image for ref_type in the process pool"""
+        profile = PROFILES[ref_type]
+        if self._process_pool is None:
+            # Forking the threaded bot process can deadlock the children, so start them clean
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+            self._process_pool = ProcessPoolExecutor(max_workers=self.image_workers, mp_context=context)
+
+        # Large spools are already on disk; workers read them by path
+        source = spool.payload() if spool.in_memory else spool.path
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._process_pool,
+            preprocess_image,
+            source,
+            profile["max_edge"],
+            profile["format"],
+            profile["quality"]
+        )
+
+    async def _cache_call(self, method, *args):
+        """Run a rehost cache call off the event loop; a cache error is logged and counts as a miss"""
         try:
-            # Download image
-            response = requests.get(image_url)
-            if response.status_code != 200:
-                return {
-                    "success": False,
-                    "error": "Failed to download image"
-                }
+            return await asyncio.get_running_loop().run_in_executor(None, method, *args)
+        except Exception as e:
+            log.warning("Rehost cache error: %s", e, extra={"operation": method.__name__})
+            return None
+
+    @traced()
+    @timed_call
+    async def download_and_upload_image(self, image_url: str, ref_type: str = None) -> dict:
+        """Download image from Discord and upload to ImgBB, reusing earlier uploads
+
+        When ref_type names a preprocessing profile, the image is downsized
+        and re-encoded for that kind of reference before upload.
+        """
+        try:
+            variant = ref_type if self.preprocess_images and ref_type in PROFILES else ""
+
+            # Same source already rehosted: skip download and upload
+            if self.rehost_cache is not None:
+                hosted_url = await self._cache_call(self.rehost_cache.get_by_url, image_url, variant)
+                if hosted_url:
+                    REHOST_CACHE_LOOKUPS.inc(result="url_hit")
+                    return {"success": True, "url": hosted_url, "cached": True}
 
-            # Upload to ImgBB
-            result = await self.upload_to_imgbb(response.content)
+            # Stream the download, capped in size and checked for an image signature
+            session = await self._get_session()
+            async with session.get(image_url) as response:
+                if response.status != 200:
+                    return {
+                        "success": False,
+                        "error": "Failed to download image"
+                    }
+                ingested = await read_image(response, self.max_image_bytes, self.image_spool_threshold)
+
+            if not ingested["success"]:
+                return ingested
+
+            with ingested["spool"] as spool:
+                # Same bytes already rehosted from another URL: skip upload
+                digest = spool.sha256
+                if self.rehost_cache is not None:
+                    hosted_url = await self._cache_call(self.rehost_cache.get_by_hash, digest, variant)
+                    REHOST_CACHE_LOOKUPS.inc(result="hash_hit" if hosted_url else "miss")
+                    if hosted_url:
+                        await self._cache_call(self.rehost_cache.put, image_url, digest, hosted_url, variant)
+                        return {"success": True, "url": hosted_url, "cached": True}
+
+                body, content_type = spool.payload(), spool.content_type
+                if variant:
+                    try:
+                        processed = await self.preprocess_image(spool, variant)
+                        if processed["changed"]:
+                            log.debug("Preprocessed image", extra={
+                                "ref_type": variant,
+                                "original_bytes": processed['original_bytes'],
+                                "bytes": processed['bytes'],
+                                "size": f"{processed['width']}x{processed['height']}"
+                            })
+                            body, content_type = processed["data"], processed["content_type"]
+                    except Exception as e:
+                        # Unreadable by PIL (e.g. HEIC); upload the original instead
+                        log.warning("Image preprocessing failed, uploading original: %s", e, extra={"ref_type": variant})
+
+                # Upload to ImgBB
+                result = await self.upload_to_imgbb(body, content_type)
+
+            if result["success"] and self.rehost_cache is not None:
+                await self._cache_call(self.rehost_cache.put, image_url, digest, result["url"], variant)
             return result
 
         except Exception as e:
@@ -72,7 +404,75 @@ class LumaService:
                 "error": f"Failed to process image: {str(e)}"
             }
 
-    async def create_capture(self, capture_type: str, prompt: str, aspect_ratio: str = "16:9", model: str = "photon-1"):
+    @staticmethod
+    def _is_discord_url(url: str) -> bool:
+        return bool(url) and ('cdn.discordapp.com' in url or 'media.discordapp.net' in url)
+
+    async def _rehost_one(self, url: str, ref_type: str = None) -> dict:
+        if self._rehost_semaphore is None:
+            self._rehost_semaphore = asyncio.Semaphore(self.rehost_concurrency)
+
+        async with self._rehost_semaphore:
+            started = time.monotonic()
+            result = await self.download_and_upload_image(url, ref_type)
+        seconds = time.monotonic() - started
+        result["seconds"] = round(seconds, 3)
+        if result["success"]:
+            REHOST_SECONDS.observe(seconds, ref_type=ref_type or "none", cached=bool(result.get("cached")))
+        return result
+
+    @traced()
+    @timed_call
+    async def rehost_images(self, urls: list, ref_type: str = None) -> dict:
+        """Rehost every Discord URL in urls concurrently, keeping their order
+
+        Rehosts from all handlers share one concurrency limit. If one
+        fails, the others are cancelled and its error is returned.
+        ref_type selects the preprocessing profile.
+        """
+        hosted = list(urls)
+        timings = []
+        tasks = {}
+        for index, url in enumerate(urls):
+            if self._is_discord_url(url):
+                log.debug("Rehosting Discord image", extra={"url": url, "ref_type": ref_type})
+                tasks[asyncio.ensure_future(self._rehost_one(url, ref_type))] = index
+
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    index = tasks[task]
+                    result = task.result()
+                    timings.append({
+                        "index": index,
+                        "seconds": result["seconds"],
+                        "cached": result.get("cached", False)
+                    })
+                    if not result["success"]:
+                        log.warning(
+                            "Rehost failed",
+                            extra={"url": urls[index], "index": index, "error": result['error']}
+                        )
+                        return result
+                    hosted[index] = result["url"]
+        finally:
+            # Fail fast: stop sibling rehosts once one has failed
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+        timings.sort(key=lambda timing: timing["index"])
+        if timings:
+            log.info("Rehosted reference images", extra={"ref_type": ref_type, "timings": timings})
+        return {"success": True, "urls": hosted, "timings": timings}
+
+    @traced()
+    @timed_call
+    async def create_capture(self, capture_type: str, prompt: str, aspect_ratio: str = "16:9", model: str = "photon-1",
+                             guild_id: int = None, fresh: bool = False):
         try:
             endpoint = f"{self.base_url}/generations/image"
             payload = {
@@ -81,140 +481,262 @@ class LumaService:
                 "model": model
             }
             
-            response = requests.post(endpoint, json=payload, headers=self.headers)
-            data = response.json()
-            
-            if response.status_code in [200, 201]:
-                return {
-                    "success": True,
-                    "id": data.get("id"),
-                    "state": data.get("state"),
-                    "details": data
-                }
-                
-            return {
-                "success": False,
-                "error": f"API Error: {response.status_code}",
-                "details": data
-            }
+            return await self._submit_generation(endpoint, payload, guild_id=guild_id, fresh=fresh)
             
         except Exception as e:
+            log.exception("create_capture failed")
             return {
                 "success": False,
                 "error": f"Unexpected error: {str(e)}"
             }
 
+    @traced()
+    @timed_call
     async def get_capture_status(self, generation_id: str):
         """Get the status of a generation"""
         try:
-            endpoint = f"{self.base_url}/generations/{generation_id}"
-            
-            print(f"\n=== Status Check for {generation_id} ===")
-            response = requests.get(endpoint, headers=self.headers)
+            response = await self._get_generation(generation_id)
             
-            print(f"Status Code: {response.status_code}")
-            print(f"Response: {response.text}")
-            
-            if response.status_code != 200:
+            if response.status != 200:
+                log.warning(
+                    "Status check failed",
+                    extra={"generation_id": generation_id, "status_code": response.status, "body": response.text}
+                )
                 return {
                     "success": False,
-                    "error": f"API Error: {response.status_code}",
+                    "error": f"API Error: {response.status}",
                     "details": response.text
                 }
                 
-            data = response.json()
-            state = data.get('state', 'unknown')
-            failure_reason = data.get('failure_reason')
-            
-            if state == 'failed':
-                print(f"Generation failed. Reason: {failure_reason}")
+            result = self._parse_capture_status(response.json())
+            poll_log.debug(
+                "Status check",
+                extra={"generation_id": generation_id, "sample_key": generation_id, "state": result.get("status")}
+            )
+            return result
+
+        except Exception as e:
+            log.warning("Status check error: %s", e, extra={"generation_id": generation_id})
+            return {
+                "success": False,
+                "error": f"Failed to get status: {str(e)}"
+            }
+
+    @staticmethod
+    def _parse_capture_status(data: dict) -> dict:
+        """Turn an image generation object into a status result"""
+        state = data.get('state', 'unknown')
+        failure_reason = data.get('failure_reason')
+
+        if state == 'failed':
+            log.info("Generation failed", extra={"generation_id": data.get('id'), "reason": failure_reason})
+            return {
+                "success": False,
+                "error": f"Generation failed: {failure_reason}" if failure_reason else "Generation failed",
+                "details": data
+            }
+
+        return {
+            "success": True,
+            "status": state,
+            "image_url": (data.get('assets') or {}).get('image'),
+            "details": data,
+            "progress_update": state in ['queued', 'dreaming']
+        }
+
+    @staticmethod
+    def _parse_video_status(data: dict) -> dict:
+        """Turn a video generation object into a status result"""
+        state = data.get('state', 'unknown')
+
+        # For completed state, ensure we have a video URL
+        if state == 'completed':
+            video_url = (data.get('assets') or {}).get('video')
+            if video_url:
                 return {
-                    "success": False,
-                    "error": f"Generation failed: {failure_reason}" if failure_reason else "Generation failed",
+                    "success": True,
+                    "status": state,
+                    "video_url": video_url,
                     "details": data
                 }
-            
+
+        # For other states, return status info
+        return {
+            "success": True,
+            "status": state,
+            "video_url": None,
+            "details": data,
+            "progress_update": state in ['queued', 'processing']
+        }
+
+    def _on_callback(self, data: dict):
+        """Wake the poller with a generation object pushed by Luma"""
+        generation_id = data["id"]
+        self.status_cache.put(generation_id, APIResponse(200, json.dumps(data)))
+        if data.get("state") == "failed":
+            # As in _fetch_status: never hand a failed generation to later identical requests
+            self.dedup.discard_generation(generation_id)
+        job = self.poller.get(generation_id)
+        if job is not None and job.kind == "video":
+            result = self._parse_video_status(data)
+        elif job is not None:
+            result = self._parse_capture_status(data)
+        else:
+            # Not watched yet; the shared fields are all the poller needs
+            result = self._parse_capture_status(data)
+            result["video_url"] = (data.get('assets') or {}).get('video')
+        self.poller.push(generation_id, result)
+
+    def _add_callback(self, payload: dict) -> dict:
+        """Ask Luma to push state changes when the callback receiver is running"""
+        if self.callback_server is not None:
+            payload["callback_url"] = self.callback_server.callback_url
+        return payload
+
+    def rehost_stats(self) -> dict:
+        """Hit and miss counters of the rehost cache"""
+        if self.rehost_cache is None:
+            return {}
+        return self.rehost_cache.stats()
+
+    @traced()
+    async def _submit_generation(self, endpoint: str, payload: dict, guild_id: int = None,
+                                 fresh: bool = False) -> dict:
+        """Create a generation, or reuse one made for an identical request
+
+        Reuse follows the dedup TTL for guild_id; fresh=True always
+        creates a new generation. Reused results carry deduplicated=True.
+        """
+        ttl = 0 if fresh else self.dedup.ttl_for(guild_id)
+        return await self.dedup.run(
+            request_key(endpoint, payload, guild_id), ttl, lambda: self._post_generation(endpoint, payload)
+        )
+
+    async def _post_generation(self, endpoint: str, payload: dict) -> dict:
+        """POST a generation request and return the standard result dict"""
+        log.debug("Generation request", extra={"endpoint": endpoint, "payload": payload})
+        response = await self._request(
+            "POST", endpoint, operation="create", json=self._add_callback(payload), headers=self.headers
+        )
+
+        submit_span = current_span()
+        if submit_span is not None:
+            submit_span.set_attribute("model", payload.get("model"))
+
+        if response.status in [200, 201]:
+            data = response.json()
+            if submit_span is not None:
+                submit_span.set_attribute("generation_id", data.get("id"))
+            log.info(
+                "Generation created",
+                extra={"generation_id": data.get("id"), "state": data.get("state"), "model": payload.get("model")}
+            )
             return {
                 "success": True,
-                "status": state,
-                "image_url": data.get('assets', {}).get('image'),
-                "details": data,
-                "progress_update": state in ['queued', 'dreaming']
+                "id": data.get("id"),
+                "state": data.get("state"),
+                "details": data
             }
-            
+
+        log.warning(
+            "Generation request rejected",
+            extra={"endpoint": endpoint, "status_code": response.status, "body": response.text}
+        )
+        return {
+            "success": False,
+            "error": f"API Error: {response.status}",
+            "details": response.text
+        }
+
+    @traced()
+    @timed_call
+    async def cancel_generation(self, generation_id: str):
+        """Stop waiting on a generation and delete it upstream
+
+        Local waiters are released first, so the poll slot frees up even
+        if Luma is slow to answer.
+        """
+        self.poller.cancel(generation_id)
+        self.dedup.discard_generation(generation_id)
+        try:
+            endpoint = f"{self.base_url}/generations/{generation_id}"
+            response = await self._request("DELETE", endpoint, operation="cancel", headers=self.headers)
+
+            if response.status in [200, 204]:
+                log.info("Generation cancelled", extra={"generation_id": generation_id})
+                return {"success": True, "id": generation_id}
+
+            log.warning(
+                "Generation cancel rejected",
+                extra={"generation_id": generation_id, "status_code": response.status, "body": response.text}
+            )
+            return {
+                "success": False,
+                "error": f"API Error: {response.status}",
+                "details": response.text
+            }
+
         except Exception as e:
-            print(f"Status check error: {str(e)}")
+            log.warning("Cancel error: %s", e, extra={"generation_id": generation_id})
             return {
                 "success": False,
-                "error": f"Failed to get status: {str(e)}"
+                "error": f"Failed to cancel generation: {str(e)}"
             }
 
+    def rate_limit_stats(self) -> dict:
+        """Throttling and waits imposed by the shared rate limiter"""
+        return self.rate_limiter.stats()
+
+    def dedup_stats(self) -> dict:
+        """Requests answered with an existing generation"""
+        return self.dedup.stats()
+
+    def expected_duration(self, job_type: str, model: str = None) -> float:
+        """Typical seconds from creation to completion, as learned by the poll schedule"""
+        low, high = self.poller.schedule.expected_window(job_type, model)
+        return (low + high) / 2
+
+    def polling_stats(self) -> dict:
+        """Pending generations and status checks made per completed generation"""
+        return self.poller.stats()
+
+    @traced()
+    @timed_call
     async def list_captures(self):
         try:
             endpoint = f"{self.base_url}/generations"
-            response = requests.get(endpoint, headers=self.headers)
+            response = await self._request("GET", endpoint, operation="list", headers=self.headers)
             return response.json()
         except Exception as e:
             return {"error": f"Failed to list generations: {str(e)}"}
 
-    async def wait_for_generation(self, generation_id: str, max_attempts: int = 300, delay: int = 2):
-        """Wait for generation to complete with timeout (10 minutes max for reference images)"""
-        for attempt in range(max_attempts):
-            result = await self.get_capture_status(generation_id)
-            
-            if not result.get("success"):
-                if attempt < 5:  # More retries at the start
-                    await asyncio.sleep(delay)
-                    continue
-                return result
-                
-            state = result.get("status")
-            result["elapsed_time"] = attempt * delay
-            
-            # Return immediately if completed or failed
-            if state == "completed" and result.get("image_url"):
-                return result
-            elif state == "failed":
-                return {
-                    "success": False,
-                    "error": "Generation failed",
-                    "details": result.get("details")
-                }
-            
-            # Progress update every 30 seconds
-            if attempt > 0 and attempt % 15 == 0:
-                result["progress_update"] = True
-                return result
-                
-            # Add small delay between checks
-            await asyncio.sleep(delay)
-            
-        return {
-            "success": False,
-            "error": "Timeout waiting for generation",
-            "elapsed_time": max_attempts * delay
-        }
+    async def wait_for_generation(self, generation_id: str, max_attempts: int = 300, delay: int = 2,
+                                  model: str = None):
+        """Wait for generation to complete with timeout (10 minutes max for reference images)
 
+        Status checks are made by the shared poller on a schedule learned
+        per model; this returns the final result, or a progress update
+        every 30 seconds while still pending.
+        """
+        job = self.poller.watch(generation_id, "image", timeout=max_attempts * delay, model=model)
+        return await job.wait(self.progress_interval)
+
+    @traced()
+    @timed_call
     async def create_capture_with_ref(self, prompt: str, aspect_ratio: str = "16:9", 
-                                    model: str = "photon-1", image_refs: list = None):
+                                    model: str = "photon-1", image_refs: list = None,
+                                    guild_id: int = None, fresh: bool = False):
         try:
             if image_refs and isinstance(image_refs, list):
-                new_refs = []
-                for ref in image_refs:
-                    if 'cdn.discordapp.com' in ref['url'] or 'media.discordapp.net' in ref['url']:
-                        # Upload Discord image to ImgBB
-                        upload_result = await self.download_and_upload_image(ref['url'])
-                        if not upload_result['success']:
-                            return upload_result
-                        
-                        new_refs.append({
-                            "url": upload_result['url'],
-                            "weight": ref.get('weight', 0.85)
-                        })
-                    else:
-                        new_refs.append(ref)
-                        
-                image_refs = new_refs
+                # Upload Discord images to ImgBB
+                rehosted = await self.rehost_images([ref['url'] for ref in image_refs], "image_ref")
+                if not rehosted['success']:
+                    return rehosted
+
+                image_refs = [
+                    {"url": url, "weight": ref.get('weight', 0.85)} if url != ref['url'] else ref
+                    for ref, url in zip(image_refs, rehosted['urls'])
+                ]
 
             endpoint = f"{self.base_url}/generations/image"
             payload = {
@@ -224,61 +746,39 @@ class LumaService:
                 "image_ref": image_refs
             }
             
-            print(f"Sending payload: {json.dumps(payload, indent=2)}")
-            response = requests.post(endpoint, json=payload, headers=self.headers)
-            
-            if response.status_code in [200, 201]:
-                data = response.json()
-                return {
-                    "success": True,
-                    "id": data.get("id"),
-                    "state": data.get("state"),
-                    "details": data
-                }
-                
-            return {
-                "success": False,
-                "error": f"API Error: {response.status_code}",
-                "details": response.text
-            }
+            return await self._submit_generation(endpoint, payload, guild_id=guild_id, fresh=fresh)
             
         except Exception as e:
+            log.exception("create_capture_with_ref failed")
             return {
                 "success": False,
                 "error": f"Unexpected error: {str(e)}"
             }
 
+    @traced()
+    @timed_call
     async def create_capture_with_style(self, prompt: str, aspect_ratio: str = "16:9", 
-                                      model: str = "photon-1", style_refs: list = None):
+                                      model: str = "photon-1", style_refs: list = None,
+                                      guild_id: int = None, fresh: bool = False):
         """Create a generation with style references"""
         try:
             endpoint = f"{self.base_url}/generations/image"
             
-            # Debug: Print incoming parameters
-            print("\n=== Style Generation Debug ===")
-            print(f"Prompt: {prompt}")
-            print(f"Aspect Ratio: {aspect_ratio}")
-            print(f"Model: {model}")
-            print(f"Style Refs: {json.dumps(style_refs, indent=2)}")
+            log.debug(
+                "Style generation requested",
+                extra={"prompt": prompt, "aspect_ratio": aspect_ratio, "model": model, "style_refs": style_refs}
+            )
             
             # Process Discord URLs if needed
             if style_refs and isinstance(style_refs, list):
-                new_refs = []
-                for ref in style_refs:
-                    url = ref['url']
-                    if 'cdn.discordapp.com' in url or 'media.discordapp.net' in url:
-                        print(f"Processing Discord URL: {url}")
-                        upload_result = await self.download_and_upload_image(url)
-                        if not upload_result['success']:
-                            print(f"Failed to process URL: {upload_result['error']}")
-                            return upload_result
-                        new_refs.append({
-                            "url": upload_result['url'],
-                            "weight": ref['weight']
-                        })
-                    else:
-                        new_refs.append(ref)
-                style_refs = new_refs
+                rehosted = await self.rehost_images([ref['url'] for ref in style_refs], "style_ref")
+                if not rehosted['success']:
+                    return rehosted
+
+                style_refs = [
+                    {"url": url, "weight": ref['weight']} if url != ref['url'] else ref
+                    for ref, url in zip(style_refs, rehosted['urls'])
+                ]
             
             payload = {
                 "prompt": prompt,
@@ -287,65 +787,30 @@ class LumaService:
                 "style_ref": style_refs  # Keep as list, don't extract single item
             }
             
-            # Debug: Print final payload
-            print("\n=== API Request ===")
-            print(f"Endpoint: {endpoint}")
-            print(f"Headers: {json.dumps({k:v for k,v in self.headers.items() if k != 'Authorization'}, indent=2)}")
-            print(f"Payload: {json.dumps(payload, indent=2)}")
-            
-            response = requests.post(endpoint, json=payload, headers=self.headers)
-            
-            # Debug: Print response
-            print("\n=== API Response ===")
-            print(f"Status Code: {response.status_code}")
-            print(f"Response Headers: {dict(response.headers)}")
-            print(f"Response Body: {response.text}")
-            
-            if response.status_code in [200, 201]:
-                data = response.json()
-                return {
-                    "success": True,
-                    "id": data.get("id"),
-                    "state": data.get("state"),
-                    "details": data
-                }
-                
-            return {
-                "success": False,
-                "error": f"API Error: {response.status_code}",
-                "details": response.text
-            }
+            return await self._submit_generation(endpoint, payload, guild_id=guild_id, fresh=fresh)
             
         except Exception as e:
-            print(f"\n=== Exception ===")
-            print(f"Error: {str(e)}")
-            import traceback
-            print(f"Traceback: {traceback.format_exc()}")
+            log.exception("create_capture_with_style failed")
             return {
                 "success": False,
                 "error": f"Unexpected error: {str(e)}"
             }
 
+    @traced()
+    @timed_call
     async def create_capture_with_char(self, prompt: str, aspect_ratio: str = "16:9", 
-                                     model: str = "photon-1", char_images: list = None):
+                                     model: str = "photon-1", char_images: list = None,
+                                     guild_id: int = None, fresh: bool = False):
         """Create a generation with character references"""
         try:
             endpoint = f"{self.base_url}/generations/image"
             
             # Process Discord URLs if needed
             if char_images:
-                processed_images = []
-                for url in char_images:
-                    if 'cdn.discordapp.com' in url or 'media.discordapp.net' in url:
-                        print(f"Processing Discord URL: {url}")
-                        upload_result = await self.download_and_upload_image(url)
-                        if not upload_result['success']:
-                            print(f"Failed to process URL: {upload_result['error']}")
-                            return upload_result
-                        processed_images.append(upload_result['url'])
-                    else:
-                        processed_images.append(url)
-                char_images = processed_images
+                rehosted = await self.rehost_images(char_images, "character_ref")
+                if not rehosted['success']:
+                    return rehosted
+                char_images = rehosted['urls']
             
             # Build character reference structure exactly as in API docs
             payload = {
@@ -359,50 +824,29 @@ class LumaService:
                 }
             }
             
-            print("\n=== API Request ===")
-            print(f"Payload: {json.dumps(payload, indent=2)}")
-            
-            response = requests.post(endpoint, json=payload, headers=self.headers)
-            
-            print(f"Status Code: {response.status_code}")
-            print(f"Response: {response.text}")
-            
-            if response.status_code in [200, 201]:
-                data = response.json()
-                return {
-                    "success": True,
-                    "id": data.get("id"),
-                    "state": data.get("state"),
-                    "details": data
-                }
-                
-            return {
-                "success": False,
-                "error": f"API Error: {response.status_code}",
-                "details": response.text
-            }
+            return await self._submit_generation(endpoint, payload, guild_id=guild_id, fresh=fresh)
             
         except Exception as e:
-            print(f"Error: {str(e)}")
+            log.exception("create_capture_with_char failed")
             return {
                 "success": False,
                 "error": f"Unexpected error: {str(e)}"
             } 
 
+    @traced()
+    @timed_call
     async def create_capture_with_mod(self, prompt: str, model: str = "photon-1", 
-                                    image_url: str = None, weight: float = 0.85):
+                                    image_url: str = None, weight: float = 0.85,
+                                    guild_id: int = None, fresh: bool = False):
         """Create a generation that modifies an existing image"""
         try:
             endpoint = f"{self.base_url}/generations/image"
             
             # Process Discord URL if needed
-            if 'cdn.discordapp.com' in image_url or 'media.discordapp.net' in image_url:
-                print(f"Processing Discord URL: {image_url}")
-                upload_result = await self.download_and_upload_image(image_url)
-                if not upload_result['success']:
-                    print(f"Failed to process URL: {upload_result['error']}")
-                    return upload_result
-                image_url = upload_result['url']
+            rehosted = await self.rehost_images([image_url], "modify_image_ref")
+            if not rehosted['success']:
+                return rehosted
+            image_url = rehosted['urls'][0]
             
             # Build modification payload exactly as in API docs
             payload = {
@@ -414,37 +858,19 @@ class LumaService:
                 }
             }
             
-            print("\n=== API Request ===")
-            print(f"Payload: {json.dumps(payload, indent=2)}")
-            
-            response = requests.post(endpoint, json=payload, headers=self.headers)
-            
-            print(f"Status Code: {response.status_code}")
-            print(f"Response: {response.text}")
-            
-            if response.status_code in [200, 201]:
-                data = response.json()
-                return {
-                    "success": True,
-                    "id": data.get("id"),
-                    "state": data.get("state"),
-                    "details": data
-                }
-                
-            return {
-                "success": False,
-                "error": f"API Error: {response.status_code}",
-                "details": response.text
-            }
+            return await self._submit_generation(endpoint, payload, guild_id=guild_id, fresh=fresh)
             
         except Exception as e:
-            print(f"Error: {str(e)}")
+            log.exception("create_capture_with_mod failed")
             return {
                 "success": False,
                 "error": f"Unexpected error: {str(e)}"
             } 
 
-    async def create_video(self, prompt: str, aspect_ratio: str = "16:9", loop: bool = False):
+    @traced()
+    @timed_call
+    async def create_video(self, prompt: str, aspect_ratio: str = "16:9", loop: bool = False,
+                           guild_id: int = None, fresh: bool = False):
         """Create a video generation"""
         try:
             endpoint = f"{self.base_url}/generations"
@@ -456,123 +882,60 @@ class LumaService:
                 "loop": loop
             }
             
-            print("\n=== Video Generation Request ===")
-            print(f"Endpoint: {endpoint}")
-            print(f"Payload: {json.dumps(payload, indent=2)}")
-            
-            response = requests.post(endpoint, json=payload, headers=self.headers)
-            
-            print(f"Status Code: {response.status_code}")
-            print(f"Response: {response.text}")
-            
-            if response.status_code in [200, 201]:
-                data = response.json()
-                return {
-                    "success": True,
-                    "id": data.get("id"),
-                    "state": data.get("state"),
-                    "details": data
-                }
-                
-            return {
-                "success": False,
-                "error": f"API Error: {response.status_code}",
-                "details": response.text
-            }
+            return await self._submit_generation(endpoint, payload, guild_id=guild_id, fresh=fresh)
             
         except Exception as e:
-            print(f"Error in create_video: {str(e)}")
+            log.exception("create_video failed")
             return {
                 "success": False,
                 "error": f"Failed to create video: {str(e)}"
             }
 
-    async def wait_for_video_generation(self, generation_id: str, max_attempts: int = 600, delay: int = 2):
-        """Wait for video generation to complete with timeout (20 minutes max)"""
-        for attempt in range(max_attempts):
-            result = await self.get_video_status(generation_id)
-            
-            if not result.get("success"):
-                if attempt < 5:  # More retries at the start
-                    await asyncio.sleep(delay)
-                    continue
-                return result
-                
-            state = result.get("status")
-            result["elapsed_time"] = attempt * delay
-            
-            # Return immediately if completed or failed
-            if state == "completed" and result.get("video_url"):
-                return result
-            elif state == "failed":
-                return {
-                    "success": False,
-                    "error": "Generation failed",
-                    "details": result.get("details")
-                }
-            
-            # Progress update every 30 seconds
-            if attempt > 0 and attempt % 15 == 0:
-                result["progress_update"] = True
-                return result
-                
-            # Add small delay between checks
-            await asyncio.sleep(delay)
-            
-        return {
-            "success": False,
-            "error": "Timeout waiting for video generation",
-            "elapsed_time": max_attempts * delay
-        }
+    async def wait_for_video_generation(self, generation_id: str, max_attempts: int = 600, delay: int = 2,
+                                        job_type: str = "t2v"):
+        """Wait for video generation to complete with timeout (20 minutes max)
 
+        Status checks are made by the shared poller on a schedule learned
+        per job type (t2v, i2v or extend); this returns the final result,
+        or a progress update every 30 seconds while still pending.
+        """
+        job = self.poller.watch(generation_id, "video", timeout=max_attempts * delay, job_type=job_type)
+        return await job.wait(self.progress_interval)
+
+    @traced()
+    @timed_call
     async def get_video_status(self, generation_id: str):
         """Get the status of a video generation"""
         try:
-            endpoint = f"{self.base_url}/generations/{generation_id}"
-            response = requests.get(endpoint, headers=self.headers)
+            response = await self._get_generation(generation_id)
             
-            print(f"\n=== Video Status Check ===")
-            print(f"Generation ID: {generation_id}")
-            print(f"Status Code: {response.status_code}")
-            print(f"Response: {response.text}")
-            
-            if response.status_code != 200:
+            if response.status != 200:
+                log.warning(
+                    "Video status check failed",
+                    extra={"generation_id": generation_id, "status_code": response.status, "body": response.text}
+                )
                 return {
                     "success": False,
-                    "error": f"API Error: {response.status_code}",
+                    "error": f"API Error: {response.status}",
                     "details": response.text
                 }
                 
-            data = response.json()
-            state = data.get('state', 'unknown')
-            
-            # For completed state, ensure we have a video URL
-            if state == 'completed':
-                video_url = data.get('assets', {}).get('video')
-                if video_url:
-                    return {
-                        "success": True,
-                        "status": state,
-                        "video_url": video_url,
-                        "details": data
-                    }
-            
-            # For other states, return status info
-            return {
-                "success": True,
-                "status": state,
-                "video_url": None,
-                "details": data,
-                "progress_update": state in ['queued', 'processing']
-            }
-            
+            result = self._parse_video_status(response.json())
+            poll_log.debug(
+                "Video status check",
+                extra={"generation_id": generation_id, "sample_key": generation_id, "state": result.get("status")}
+            )
+            return result
+
         except Exception as e:
-            print(f"Status check error: {str(e)}")
+            log.warning("Status check error: %s", e, extra={"generation_id": generation_id})
             return {
                 "success": False,
                 "error": f"Failed to get status: {str(e)}"
             }
 
+    @traced()
+    @timed_call
     async def create_image_video(
         self, 
         prompt: str, 
@@ -581,20 +944,20 @@ class LumaService:
         image_url2: str = None,
         frame_type2: str = None,
         aspect_ratio: str = "16:9",
-        loop: bool = False
+        loop: bool = False,
+        guild_id: int = None,
+        fresh: bool = False
     ):
         """Create a video generation from one or two images"""
         try:
             endpoint = f"{self.base_url}/generations"
             
-            # Process first image if it's from Discord
-            if 'cdn.discordapp.com' in image_url1 or 'media.discordapp.net' in image_url1:
-                print(f"Processing Discord URL 1: {image_url1}")
-                upload_result = await self.download_and_upload_image(image_url1)
-                if not upload_result['success']:
-                    print(f"Failed to process URL 1: {upload_result['error']}")
-                    return upload_result
-                image_url1 = upload_result['url']
+            # Process Discord images (both frames at once)
+            use_second = bool(image_url2 and frame_type2)
+            rehosted = await self.rehost_images([image_url1, image_url2] if use_second else [image_url1], "keyframe")
+            if not rehosted['success']:
+                return rehosted
+            image_url1 = rehosted['urls'][0]
             
             # Initialize keyframes
             keyframes = {
@@ -604,16 +967,9 @@ class LumaService:
                 }
             }
             
-            # Process second image if provided
-            if image_url2 and frame_type2:
-                if 'cdn.discordapp.com' in image_url2 or 'media.discordapp.net' in image_url2:
-                    print(f"Processing Discord URL 2: {image_url2}")
-                    upload_result = await self.download_and_upload_image(image_url2)
-                    if not upload_result['success']:
-                        print(f"Failed to process URL 2: {upload_result['error']}")
-                        return upload_result
-                    image_url2 = upload_result['url']
-                
+            # Add second image if provided
+            if use_second:
+                image_url2 = rehosted['urls'][1]
                 keyframes[frame_type2] = {
                     "type": "image",
                     "url": image_url2
@@ -627,57 +983,37 @@ class LumaService:
                 "loop": loop
             }
             
-            print("\n=== Image-to-Video Generation Request ===")
-            print(f"Endpoint: {endpoint}")
-            print(f"Payload: {json.dumps(payload, indent=2)}")
-            
-            response = requests.post(endpoint, json=payload, headers=self.headers)
-            
-            print(f"Status Code: {response.status_code}")
-            print(f"Response: {response.text}")
-            
-            if response.status_code in [200, 201]:
-                data = response.json()
-                return {
-                    "success": True,
-                    "id": data.get("id"),
-                    "state": data.get("state"),
-                    "details": data
-                }
-                
-            return {
-                "success": False,
-                "error": f"API Error: {response.status_code}",
-                "details": response.text
-            }
+            return await self._submit_generation(endpoint, payload, guild_id=guild_id, fresh=fresh)
             
         except Exception as e:
-            print(f"Error in create_image_video: {str(e)}")
+            log.exception("create_image_video failed")
             return {
                 "success": False,
                 "error": f"Failed to create video: {str(e)}"
             }
 
+    @traced()
+    @timed_call
     async def extend_video(
         self,
         prompt: str,
         mode: str,
         video_id1: str,
         video_id2: str = None,
-        image_url: str = None
+        image_url: str = None,
+        guild_id: int = None,
+        fresh: bool = False
     ):
         """Extend a video using various modes"""
         try:
             endpoint = f"{self.base_url}/generations"
             
             # Process image URL if provided (for modes that use images)
-            if image_url and ('cdn.discordapp.com' in image_url or 'media.discordapp.net' in image_url):
-                print(f"Processing Discord URL: {image_url}")
-                upload_result = await self.download_and_upload_image(image_url)
-                if not upload_result['success']:
-                    print(f"Failed to process URL: {upload_result['error']}")
-                    return upload_result
-                image_url = upload_result['url']
+            if image_url:
+                rehosted = await self.rehost_images([image_url], "keyframe")
+                if not rehosted['success']:
+                    return rehosted
+                image_url = rehosted['urls'][0]
             
             # Initialize keyframes based on mode
             keyframes = {}
@@ -730,35 +1066,10 @@ class LumaService:
                 "keyframes": keyframes
             }
             
-            print("\n=== Video Extension Request ===")
-            print(f"Mode: {mode}")
-            print(f"Endpoint: {endpoint}")
-            print(f"Payload: {json.dumps(payload, indent=2)}")
-            
-            response = requests.post(endpoint, json=payload, headers=self.headers)
-            
-            print(f"Status Code: {response.status_code}")
-            print(f"Response: {response.text}")
-            
-            if response.status_code in [200, 201]:
-                data = response.json()
-                return {
-                    "success": True,
-                    "id": data.get("id"),
-                    "state": data.get("state"),
-                    "details": data
-                }
-                
-            return {
-                "success": False,
-                "error": f"API Error: {response.status_code}",
-                "details": response.text
-            }
+            return await self._submit_generation(endpoint, payload, guild_id=guild_id, fresh=fresh)
             
         except Exception as e:
-            print(f"Error in extend_video: {str(e)}")
-            import traceback
-            print(f"Traceback: {traceback.format_exc()}")
+            log.exception("extend_video failed")
             return {
                 "success": False,
                 "error": f"Failed to extend video: {str(e)}"
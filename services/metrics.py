@@ -0,0 +1,279 @@
+import functools
+import logging
+import threading
+import time
+
+from aiohttp import web
+
+log = logging.getLogger("luma.metrics")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+COMMAND_BUCKETS = (0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 180, 300, 600, 900, 1200)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> list:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> list:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing count per label set"""
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """Value that can go up and down, or be read from a function at scrape time"""
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values = {}
+        self._function = None
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function):
+        """Read values at scrape time; function returns a number, or {label tuple: number}"""
+        self._function = function
+
+    def _samples(self):
+        if self._function is not None:
+            try:
+                values = self._function()
+            except Exception:
+                log.exception("Gauge callback failed", extra={"metric": self.name})
+                return []
+            if not isinstance(values, dict):
+                values = {(): values}
+        else:
+            with self._lock:
+                values = dict(self._values)
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in values.items()]
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets"""
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: tuple = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[index] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def count(self, **labels) -> int:
+        entry = self._values.get(self._key(labels))
+        return entry[-1] if entry else 0
+
+    def time(self, **labels):
+        """Context manager observing the seconds spent inside the block"""
+        return _Timer(self, labels)
+
+    def _samples(self):
+        lines = []
+        with self._lock:
+            items = [(key, list(entry)) for key, entry in self._values.items()]
+        for key, entry in items:
+            for bound, bucket_count in zip(self.buckets, entry):
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {bucket_count}")
+            inf = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, inf)} {entry[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {entry[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {entry[-1]}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+class Registry:
+    """Collection of metrics rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric: _Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Bot and API metrics
+COMMAND_SECONDS = Histogram(
+    "luma_command_seconds", "End-to-end time of a slash command from interaction creation",
+    ("command",), buckets=COMMAND_BUCKETS
+)
+SERVICE_CALL_SECONDS = Histogram(
+    "luma_service_call_seconds", "Time spent in a LumaService method", ("method",)
+)
+API_RESPONSES = Counter(
+    "luma_api_responses_total", "HTTP responses from Luma and ImgBB by endpoint and status code",
+    ("endpoint", "code")
+)
+JOBS_IN_FLIGHT = Gauge(
+    "luma_jobs_in_flight", "Generations currently being waited on, by job type", ("job_type",)
+)
+POLLS_PER_JOB = Gauge(
+    "luma_polls_per_job", "Average status checks per completed generation"
+)
+REHOST_SECONDS = Histogram(
+    "luma_rehost_seconds", "Time to rehost one reference image", ("ref_type", "cached")
+)
+REHOST_CACHE_LOOKUPS = Counter(
+    "luma_rehost_cache_lookups_total", "Rehost cache lookups by result", ("result",)
+)
+REHOST_CACHE_ENTRIES = Gauge(
+    "luma_rehost_cache_entries", "Uploads held in the rehost cache"
+)
+RATE_LIMIT_WAIT_SECONDS = Histogram(
+    "luma_rate_limit_wait_seconds", "Time Luma requests waited for the rate limiter", ("bucket",)
+)
+STATUS_CACHE = Gauge(
+    "luma_status_cache", "Generation status cache hits, misses, coalesced lookups and entries", ("counter",)
+)
+DEDUP_HITS = Gauge(
+    "luma_dedup_hits", "Requests answered with an identical in-flight or recent generation", ("kind",)
+)
+SCHEDULER_JOBS = Gauge(
+    "luma_scheduler_jobs", "Jobs admitted by the fair scheduler, by state", ("state",)
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    "luma_queue_wait_seconds", "Time jobs waited in the fair scheduler for a slot", ("job_type",),
+    buckets=COMMAND_BUCKETS
+)
+DISCORD_SEND_SECONDS = Histogram(
+    "luma_discord_send_seconds", "Time to send a Discord interaction response or followup", ("kind",)
+)
+
+
+def timed(histogram: Histogram, **labels):
+    """Decorator observing how long each call of a coroutine function takes"""
+    def decorator(function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            with histogram.time(**labels):
+                return await function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def timed_call(function):
+    """Record each call of a LumaService coroutine method under its name"""
+    return timed(SERVICE_CALL_SECONDS, method=function.__name__)(function)
+
+
+class MetricsServer:
+    """Serves the registry at /metrics for Prometheus to scrape"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 9100, registry: Registry = None):
+        self.host = host
+        self.port = port
+        self.registry = registry or REGISTRY
+        self._runner = None
+
+    async def start(self):
+        if self._runner is not None:
+            return
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        log.info("Metrics endpoint listening", extra={"host": self.host, "port": self.port})
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(
+            text=self.registry.render(),
+            content_type="text/plain",
+            headers={"X-Content-Format": "prometheus-0.0.4"}
+        )
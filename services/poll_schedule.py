@@ -0,0 +1,147 @@
+import json
+import logging
+import os
+from collections import defaultdict, deque
+
+log = logging.getLogger("luma.schedule")
+
+# Typical seconds from submission to completion, used until real samples exist
+DEFAULT_DURATIONS = {
+    ("image", "photon-flash-1"): 15,
+    ("image", "photon-1"): 30,
+    ("image", None): 30,
+    ("t2v", None): 120,
+    ("i2v", None): 120,
+    ("extend", None): 150,
+}
+
+
+class AdaptiveSchedule:
+    """Chooses the delay before each status check from observed completion times
+
+    Completion times are learned per (job type, model). A job is polled
+    rarely until it nears the fast end of that distribution, often while
+    inside it (spread_fraction of its width, never under min_delay), and
+    with exponential backoff once it overruns the slow end.
+
+    With a path, the samples are saved to that JSON file every
+    save_every completions and by save(), and read back on creation, so
+    a restart starts from the learned times rather than the defaults.
+    """
+
+    def __init__(self, min_delay: float = 2, max_delay: float = 60, window: int = 50, min_samples: int = 5,
+                 spread_fraction: float = 0.1, path: str = None, save_every: int = 10):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+        self.spread_fraction = spread_fraction
+        self.path = path
+        self.save_every = save_every
+        self._samples = defaultdict(lambda: deque(maxlen=window))
+        self._unsaved = 0
+
+        # Polls-per-job accounting
+        self.completed_jobs = 0
+        self.completed_polls = 0
+        self._by_key = defaultdict(lambda: {"jobs": 0, "polls": 0})
+
+        if path:
+            self.load()
+
+    def _key(self, job_type: str, model: str):
+        return (job_type or "image", model)
+
+    def expected_window(self, job_type: str, model: str) -> tuple:
+        """Return the (early, late) completion bounds in seconds for a job type and model"""
+        samples = self._samples.get(self._key(job_type, model))
+        if samples and len(samples) >= self.min_samples:
+            ordered = sorted(samples)
+            low = ordered[int(len(ordered) * 0.1)]
+            high = ordered[min(len(ordered) - 1, int(len(ordered) * 0.9))]
+            return low, max(high, low + self.min_delay)
+
+        default = DEFAULT_DURATIONS.get(self._key(job_type, model))
+        if default is None:
+            default = DEFAULT_DURATIONS.get((job_type, None), 60)
+        return default * 0.6, default * 1.5
+
+    def next_delay(self, job, state: str, elapsed: float) -> float:
+        """Seconds to wait before the next status check of job"""
+        low, high = self.expected_window(job.job_type, job.model)
+
+        if state == "completed":
+            # Finished but assets not attached yet
+            return self.min_delay
+
+        if elapsed < low:
+            # Close in on the early bound, covering most of the gap per poll
+            return max(self.min_delay, (low - elapsed) * 0.75)
+
+        if elapsed <= high and state != "queued":
+            return max(self.min_delay, (high - low) * self.spread_fraction)
+
+        # Overrun, or still queued when it should be finishing
+        job.overrun_polls += 1
+        return min(self.max_delay, self.min_delay * 2 ** job.overrun_polls)
+
+    def record_completion(self, job, duration: float):
+        """Learn from a completed job and count the polls it took"""
+        key = self._key(job.job_type, job.model)
+        self._samples[key].append(duration)
+        self._unsaved += 1
+        if self.path and self._unsaved >= self.save_every:
+            self.save()
+
+        self.completed_jobs += 1
+        self.completed_polls += job.attempts
+        self._by_key[key]["jobs"] += 1
+        self._by_key[key]["polls"] += job.attempts
+
+    def load(self):
+        """Read the samples saved by an earlier run, if any"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as file:
+                saved = json.load(file)
+            for entry in saved["samples"]:
+                self._samples[self._key(entry["job_type"], entry["model"])].extend(
+                    float(duration) for duration in entry["durations"]
+                )
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            log.warning("Ignoring unreadable poll schedule: %s", e)
+
+    def save(self):
+        """Write the samples to path"""
+        if not self.path:
+            return
+        samples = [
+            {"job_type": job_type, "model": model, "durations": [round(duration, 3) for duration in durations]}
+            for (job_type, model), durations in self._samples.items() if durations
+        ]
+        # Write a new file and swap it in, so a crash never leaves half a file
+        temporary = f"{self.path}.tmp"
+        try:
+            with open(temporary, "w") as file:
+                json.dump({"samples": samples}, file)
+            os.replace(temporary, self.path)
+            self._unsaved = 0
+        except OSError as e:
+            log.warning("Could not save poll schedule: %s", e)
+
+    def stats(self) -> dict:
+        """Polls-per-job and learned completion windows"""
+        by_type = {}
+        for (job_type, model), counts in self._by_key.items():
+            low, high = self.expected_window(job_type, model)
+            by_type[f"{job_type}/{model or 'default'}"] = {
+                "jobs": counts["jobs"],
+                "polls_per_job": counts["polls"] / counts["jobs"],
+                "expected_window": [round(low, 1), round(high, 1)]
+            }
+
+        return {
+            "completed_jobs": self.completed_jobs,
+            "polls_per_job": self.completed_polls / self.completed_jobs if self.completed_jobs else 0.0,
+            "by_type": by_type
+        }
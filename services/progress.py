@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import time
+
+log = logging.getLogger("luma.progress")
+
+STATE_LABELS = {
+    "queued": "🕒 Queued",
+    "dreaming": "💭 Dreaming",
+    "processing": "⚙️ Processing",
+    "completed": "✅ Completed",
+    "failed": "❌ Failed",
+    "cancelled": "🛑 Cancelled",
+}
+
+
+class ProgressReporter:
+    """Keeps one message up to date with a job's state instead of posting one per update
+
+    Elapsed time and ETA are written as Discord relative timestamps,
+    which clients count up live, so the message only has to be edited
+    when the state or the ETA changes. An edit within min_interval of
+    the previous one is deferred, and only the latest content is sent.
+
+    send(content) posts the message and returns it; edit(message,
+    content) edits it. Edits run one at a time, so the final state is
+    always the last one shown. An edit failing with an error matched by
+    repost_on (e.g. an expired interaction token) posts the message
+    again with send, and later edits go to the new message.
+    """
+
+    def __init__(self, send, edit, header: str, eta_seconds: float = None, min_interval: float = 5,
+                 repost_on=None):
+        self.send = send
+        self.edit = edit
+        self.header = header
+        self.eta_seconds = eta_seconds
+        self.min_interval = min_interval
+        self.repost_on = repost_on  # (error) -> bool
+        self.started_at = time.time()
+        self.edits = 0
+
+        self.message = None
+        self._shown = None
+        self._latest = None
+        self._last_edit = 0.0
+        self._pending = None
+        self._finished = False
+        self._lock = asyncio.Lock()
+
+    def render(self, state: str) -> str:
+        started = int(self.started_at)
+        lines = [self.header, "", f"{STATE_LABELS.get(state, state)} · started <t:{started}:R>"]
+        if state not in ("completed", "failed", "cancelled") and self.eta_seconds:
+            eta = int(self.started_at + self.eta_seconds)
+            if time.time() < eta:
+                lines.append(f"⏱️ Expected <t:{eta}:R>")
+            else:
+                lines.append("⏱️ Taking longer than usual, should be ready any moment")
+        return "\n".join(lines)
+
+    async def start(self, state: str = "queued"):
+        """Post the progress message"""
+        self._shown = self.render(state)
+        self.message = await self.send(self._shown)
+        self._last_edit = asyncio.get_running_loop().time()
+        return self.message
+
+    async def update(self, state: str):
+        """Show state, editing now or as soon as the debounce interval allows"""
+        content = self.render(state)
+        if self.message is None or content == self._shown:
+            return
+
+        loop = asyncio.get_running_loop()
+        wait = self._last_edit + self.min_interval - loop.time()
+        if wait > 0:
+            self._latest = content
+            if self._pending is None:
+                self._pending = loop.create_task(self._deferred(wait))
+            return
+        await self._edit(content)
+
+    async def finish(self, state: str):
+        """Show the final state and drop any deferred edit"""
+        self._finished = True
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
+        content = self.render(state)
+        if self.message is not None and content != self._shown:
+            await self._edit(content, final=True)
+
+    async def _deferred(self, wait: float):
+        await asyncio.sleep(wait)
+        # From here finish() waits for this edit instead of cancelling it part way
+        self._pending = None
+        await self._edit(self._latest)
+
+    async def _edit(self, content: str, final: bool = False):
+        async with self._lock:
+            if self._finished and not final:
+                return
+            self._last_edit = asyncio.get_running_loop().time()
+            try:
+                await self.edit(self.message, content)
+                self._shown = content
+                self.edits += 1
+            except Exception as e:
+                if self.repost_on is not None and self.repost_on(e):
+                    await self._repost(content)
+                    return
+                # A lost progress edit is not worth failing the job over
+                log.warning("Progress edit failed: %s", e)
+
+    async def _repost(self, content: str):
+        try:
+            self.message = await self.send(content)
+            self._shown = content
+        except Exception as e:
+            log.warning("Progress repost failed: %s", e)
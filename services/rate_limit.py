@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import time
+from email.utils import parsedate_to_datetime
+
+log = logging.getLogger("luma.ratelimit")
+
+
+class TokenBucket:
+    """Allows rate requests per second on average, with bursts of up to burst
+
+    Callers that find the bucket empty wait their turn in FIFO order
+    instead of failing.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = None
+        self._lock = None
+
+    def _refill(self, now: float):
+        if self._updated is not None:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            while True:
+                self._refill(loop.time())
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class RateLimiter:
+    """Named token buckets plus a client-wide pause after a 429
+
+    backoff() stops every caller, whichever bucket it uses, until the
+    pause ends, since the API limits the account rather than one endpoint.
+    """
+
+    def __init__(self, limits: dict = None, max_backoff: float = 120):
+        # limits maps a bucket name to (requests per second, burst); a rate of 0 disables it
+        self.buckets = {
+            name: TokenBucket(rate, burst) for name, (rate, burst) in (limits or {}).items() if rate > 0
+        }
+        self.max_backoff = max_backoff
+        self.throttled = 0
+        self.waits = 0
+        self._paused_until = 0.0
+
+    async def _wait_for_pause(self, loop):
+        while True:
+            delay = self._paused_until - loop.time()
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+    async def acquire(self, name: str) -> float:
+        """Wait for a token from the named bucket; returns the seconds spent waiting"""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+
+        await self._wait_for_pause(loop)
+        bucket = self.buckets.get(name)
+        if bucket is not None:
+            await bucket.acquire()
+        # A 429 may have arrived while this caller waited for a token
+        await self._wait_for_pause(loop)
+
+        waited = loop.time() - started
+        if waited >= 0.001:
+            self.waits += 1
+        return waited
+
+    def backoff(self, seconds: float):
+        """Pause all callers for seconds (capped at max_backoff)"""
+        loop = asyncio.get_running_loop()
+        seconds = min(max(seconds, 0), self.max_backoff)
+        self._paused_until = max(self._paused_until, loop.time() + seconds)
+        self.throttled += 1
+        log.warning("Rate limited, pausing requests", extra={"seconds": round(seconds, 2)})
+
+    @property
+    def paused_for(self) -> float:
+        try:
+            now = asyncio.get_running_loop().time()
+        except RuntimeError:
+            return 0.0
+        return max(0.0, self._paused_until - now)
+
+    @staticmethod
+    def parse_retry_after(value: str) -> float:
+        """Seconds to wait from a Retry-After header (delta-seconds or HTTP date), or None"""
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def stats(self) -> dict:
+        return {
+            "throttled": self.throttled,
+            "waits": self.waits,
+            "paused_for": round(self.paused_for, 2)
+        }
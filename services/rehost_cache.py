@@ -0,0 +1,120 @@
+import sqlite3
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+DISCORD_HOSTS = ("cdn.discordapp.com", "media.discordapp.net")
+
+
+def normalize_source_url(url: str) -> str:
+    """Cache key for a source URL
+
+    Discord attachment URLs carry expiring signature parameters (ex, is,
+    hm) that change between messages while the attachment path stays the
+    same, so the query string is dropped for Discord hosts.
+    """
+    parts = urlsplit(url)
+    if parts.hostname in DISCORD_HOSTS:
+        return urlunsplit((parts.scheme, parts.netloc, parts.path, "", ""))
+    return url
+
+
+class RehostCache:
+    """SQLite-backed cache of rehosted image URLs
+
+    Entries are found by source URL (skipping download and upload) or by
+    SHA-256 of the downloaded bytes (skipping the upload). The variant
+    names how the image was processed before upload, so one source can be
+    cached once per processing profile. Entries expire after ttl seconds
+    and the least recently used are evicted beyond max_entries.
+    """
+
+    def __init__(self, path: str = "rehost_cache.db", ttl: float = 30 * 86400, max_entries: int = 10000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self.url_hits = 0
+        self.hash_hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        # WAL and a busy timeout let processes sharing the file read while another writes
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS rehost ("
+            " source_url TEXT NOT NULL,"
+            " variant TEXT NOT NULL DEFAULT '',"
+            " sha256 TEXT NOT NULL,"
+            " hosted_url TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " PRIMARY KEY (source_url, variant))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS rehost_sha256 ON rehost (sha256, variant)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS rehost_last_used ON rehost (last_used)")
+        self._db.commit()
+
+    def _lookup(self, column: str, value: str, variant: str):
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT rowid, hosted_url FROM rehost WHERE {column} = ? AND variant = ? AND created_at >= ? "
+                "ORDER BY last_used DESC LIMIT 1",
+                (value, variant, now - self.ttl)
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE rehost SET last_used = ? WHERE rowid = ?", (now, row[0]))
+            self._db.commit()
+            return row[1]
+
+    def get_by_url(self, source_url: str, variant: str = "") -> str:
+        """Hosted URL previously stored for source_url, or None"""
+        hosted_url = self._lookup("source_url", normalize_source_url(source_url), variant)
+        if hosted_url is not None:
+            self.url_hits += 1
+        return hosted_url
+
+    def get_by_hash(self, sha256: str, variant: str = "") -> str:
+        """Hosted URL previously stored for identical bytes, or None"""
+        hosted_url = self._lookup("sha256", sha256, variant)
+        if hosted_url is not None:
+            self.hash_hits += 1
+        else:
+            self.misses += 1
+        return hosted_url
+
+    def put(self, source_url: str, sha256: str, hosted_url: str, variant: str = ""):
+        """Store a rehosted URL and evict expired and least recently used entries"""
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO rehost (source_url, variant, sha256, hosted_url, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (normalize_source_url(source_url), variant, sha256, hosted_url, now, now)
+            )
+            self._db.execute("DELETE FROM rehost WHERE created_at < ?", (now - self.ttl,))
+            self._db.execute(
+                "DELETE FROM rehost WHERE rowid IN ("
+                " SELECT rowid FROM rehost ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM rehost").fetchone()[0]
+        return {
+            "url_hits": self.url_hits,
+            "hash_hits": self.hash_hits,
+            "misses": self.misses,
+            "entries": entries
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,7 @@
+def parse_id_map(value: str, convert=float) -> dict:
+    """Parse "id:value,id:value" settings into {id: convert(value)}"""
+    parsed = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        key, _, setting = item.partition(":")
+        parsed[int(key)] = convert(setting)
+    return parsed
@@ -0,0 +1,64 @@
+def shard_for_guild(guild_id: int, shard_count: int) -> int:
+    """Gateway shard that receives a guild's events; direct messages go to shard 0"""
+    if not guild_id or not shard_count:
+        return 0
+    return (guild_id >> 22) % shard_count
+
+
+def parse_shard_ids(value: str) -> list:
+    """Parse "0,1,4-7" into [0, 1, 4, 5, 6, 7]"""
+    shard_ids = set()
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        first, _, last = item.partition("-")
+        shard_ids.update(range(int(first), int(last or first) + 1))
+    return sorted(shard_ids)
+
+
+def split_shards(shard_count: int, processes: int) -> list:
+    """Split shards 0..shard_count-1 into contiguous groups of nearly equal size"""
+    processes = max(1, min(processes, shard_count))
+    size, extra = divmod(shard_count, processes)
+    groups = []
+    start = 0
+    for index in range(processes):
+        end = start + size + (1 if index < extra else 0)
+        groups.append(list(range(start, end)))
+        start = end
+    return groups
+
+
+class ShardConfig:
+    """Which gateway shards this process connects
+
+    With no shard count the bot runs unsharded, or auto-sharded with the
+    count Discord recommends; either way it owns every guild. With a
+    count and shard IDs it owns only the guilds on those shards, so
+    processes sharing a job store each resume their own generations.
+    """
+
+    def __init__(self, auto: bool = False, shard_count: int = None, shard_ids: list = None):
+        if shard_ids and not shard_count:
+            raise ValueError("Shard IDs need a shard count")
+        if shard_ids and any(not 0 <= shard_id < shard_count for shard_id in shard_ids):
+            raise ValueError(f"Shard IDs must be between 0 and {shard_count - 1}")
+        self.auto = auto or bool(shard_count)
+        self.shard_count = shard_count
+        self.shard_ids = list(shard_ids) if shard_ids else None
+
+    def owns(self, guild_id: int) -> bool:
+        """Whether this process receives the guild's events and delivers its results"""
+        if self.shard_ids is None:
+            return True
+        return shard_for_guild(guild_id, self.shard_count) in self.shard_ids
+
+    def bot_options(self) -> dict:
+        """Keyword arguments for commands.AutoShardedBot"""
+        return {"shard_count": self.shard_count, "shard_ids": self.shard_ids}
+
+    def describe(self) -> str:
+        if not self.auto:
+            return "unsharded"
+        if self.shard_count is None:
+            return "auto-sharded"
+        shards = "all" if self.shard_ids is None else ",".join(map(str, self.shard_ids))
+        return f"shards {shards} of {self.shard_count}"
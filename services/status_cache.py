@@ -0,0 +1,89 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+
+
+def is_terminal(data: dict) -> bool:
+    """True once a generation object can no longer change"""
+    state = data.get("state")
+    return state == "failed" or (state == "completed" and bool(data.get("assets")))
+
+
+class StatusCache:
+    """Coalesces and caches generation lookups by ID
+
+    Concurrent lookups for one ID share a single request. Successful
+    responses for pending generations are reused for ttl seconds;
+    completed and failed generations are kept until evicted as least
+    recently used beyond max_entries. Error responses are never cached.
+    """
+
+    def __init__(self, ttl: float = 2, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+        self._entries = OrderedDict()  # generation_id -> (expires_at or None, response)
+        self._inflight = {}
+
+    def get(self, generation_id: str):
+        entry = self._entries.get(generation_id)
+        if entry is None:
+            return None
+        expires_at, response = entry
+        if expires_at is not None and time.monotonic() >= expires_at:
+            del self._entries[generation_id]
+            return None
+        self._entries.move_to_end(generation_id)
+        return response
+
+    def put(self, generation_id: str, response):
+        """Cache a 200 response whose body is the generation object"""
+        if response.status != 200:
+            return
+        try:
+            data = json.loads(response.text)
+        except ValueError:
+            return
+        expires_at = None if is_terminal(data) else time.monotonic() + self.ttl
+        self._entries[generation_id] = (expires_at, response)
+        self._entries.move_to_end(generation_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def fetch(self, generation_id: str, request):
+        """Cached response for generation_id, or the result of awaiting request()"""
+        response = self.get(generation_id)
+        if response is not None:
+            self.hits += 1
+            return response
+
+        inflight = self._inflight.get(generation_id)
+        if inflight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(inflight)
+
+        self.misses += 1
+        inflight = asyncio.ensure_future(request())
+        self._inflight[generation_id] = inflight
+        try:
+            # Shielded so one caller giving up does not fail the others
+            response = await asyncio.shield(inflight)
+        finally:
+            if inflight.done():
+                self._inflight.pop(generation_id, None)
+            else:
+                inflight.add_done_callback(lambda _: self._inflight.pop(generation_id, None))
+        self.put(generation_id, response)
+        return response
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "entries": len(self._entries)
+        }
@@ -0,0 +1,272 @@
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+import os
+import secrets
+import time
+from contextlib import contextmanager
+
+import aiohttp
+
+from services.log import generation_id_var, interaction_id_var
+
+log = logging.getLogger("luma.tracing")
+
+# Span currently open in this task; children started inside it become its children
+current_span_var = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """One timed operation within a trace"""
+
+    def __init__(self, name: str, parent: "Span" = None, attributes: dict = None, start_ns: int = None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent is not None else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent is not None else None
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes or {})
+        self.error = None
+
+    def set_attribute(self, key: str, value):
+        if value is not None:
+            self.attributes[key] = value
+
+    def end(self, end_ns: int = None):
+        # Correlation IDs are read at the end, since the generation ID is
+        # usually only known part-way through a command
+        self.attributes.setdefault("interaction_id", interaction_id_var.get())
+        self.attributes.setdefault("generation_id", generation_id_var.get())
+        self.end_ns = end_ns or time.time_ns()
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start_ns / 1e9,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "status": "error" if self.error else "ok",
+            "error": self.error,
+            "attributes": {key: value for key, value in self.attributes.items() if value is not None}
+        }
+
+
+class JSONLExporter:
+    """Appends finished spans to a file, one JSON object per line"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _write(self, lines: list):
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write("".join(lines))
+
+    async def export(self, spans: list):
+        lines = [json.dumps(span.to_dict(), default=str, ensure_ascii=False) + "\n" for span in spans]
+        await asyncio.get_running_loop().run_in_executor(None, self._write, lines)
+
+    async def close(self):
+        pass
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OTLPExporter:
+    """Sends finished spans to an OpenTelemetry collector as OTLP/HTTP JSON"""
+
+    def __init__(self, endpoint: str, service_name: str = "luma-discord-bot", timeout: float = 10):
+        if not endpoint.rstrip("/").endswith("/v1/traces"):
+            endpoint = endpoint.rstrip("/") + "/v1/traces"
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self._session = None
+
+    def _encode(self, spans: list) -> dict:
+        encoded = []
+        for span in spans:
+            entry = {
+                "traceId": span.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                "kind": 1,
+                "startTimeUnixNano": str(span.start_ns),
+                "endTimeUnixNano": str(span.end_ns),
+                "attributes": [
+                    {"key": key, "value": _otlp_value(value)}
+                    for key, value in span.attributes.items() if value is not None
+                ],
+                "status": {"code": 2, "message": span.error} if span.error else {"code": 1}
+            }
+            if span.parent_id:
+                entry["parentSpanId"] = span.parent_id
+            encoded.append(entry)
+
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+                "scopeSpans": [{"scope": {"name": "luma"}, "spans": encoded}]
+            }]
+        }
+
+    async def export(self, spans: list):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=self.timeout)
+        async with self._session.post(self.endpoint, json=self._encode(spans)) as response:
+            if response.status >= 300:
+                raise RuntimeError(f"Collector returned {response.status}: {await response.text()}")
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class Tracer:
+    """Collects finished spans and exports them in batches
+
+    Spans are buffered in memory and handed to every exporter every
+    flush_interval seconds, or sooner once batch_size spans are waiting.
+    With no exporters configured, spans are not created at all.
+    """
+
+    def __init__(self, exporters: list = None, flush_interval: float = 5, batch_size: int = 256,
+                 max_buffer: int = 10000):
+        self.exporters = list(exporters or [])
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_buffer = max_buffer
+        self.dropped = 0
+        self._buffer = []
+        self._task = None
+        self._flushing = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.exporters)
+
+    def start(self):
+        if self.enabled and self._task is None:
+            # Run the flush loop outside any open span
+            loop = asyncio.get_running_loop()
+            self._task = contextvars.Context().run(loop.create_task, self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        for exporter in self.exporters:
+            await exporter.close()
+
+    def add(self, span: Span):
+        if len(self._buffer) >= self.max_buffer:
+            self.dropped += 1
+            return
+        self._buffer.append(span)
+        if len(self._buffer) >= self.batch_size and self._task is not None:
+            self._wake()
+
+    def _wake(self):
+        if self._flushing is None or self._flushing.done():
+            self._flushing = contextvars.Context().run(asyncio.get_running_loop().create_task, self.flush())
+
+    async def flush(self):
+        spans, self._buffer = self._buffer, []
+        if not spans:
+            return
+        for exporter in self.exporters:
+            try:
+                await exporter.export(spans)
+            except Exception as e:
+                log.warning("Span export failed: %s", e, extra={"exporter": type(exporter).__name__})
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+
+tracer = Tracer()
+
+
+def current_span() -> Span:
+    return current_span_var.get()
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Time the block as a child of the current span"""
+    if not tracer.enabled:
+        yield None
+        return
+
+    current = Span(name, current_span_var.get(), attributes)
+    token = current_span_var.set(current)
+    try:
+        yield current
+    except asyncio.CancelledError:
+        current.error = "cancelled"
+        raise
+    except Exception as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current_span_var.reset(token)
+        current.end()
+        tracer.add(current)
+
+
+def record_span(name: str, start_ns: int, parent: Span = None, error: str = None, **attributes):
+    """Add a span for an operation that was not timed with span(), e.g. a poller job"""
+    if not tracer.enabled:
+        return
+    finished = Span(name, parent, attributes, start_ns=start_ns)
+    finished.error = error
+    finished.end()
+    tracer.add(finished)
+
+
+def traced(name: str = None):
+    """Decorator running each call of a coroutine function in its own span"""
+    def decorator(function):
+        span_name = name or function.__qualname__
+
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            with span(span_name):
+                return await function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def setup_tracing(path: str = None, otlp_endpoint: str = None, service_name: str = None):
+    """Configure exporters from arguments or LUMA_TRACE_FILE and LUMA_TRACE_OTLP_ENDPOINT"""
+    path = path or os.getenv("LUMA_TRACE_FILE")
+    otlp_endpoint = otlp_endpoint or os.getenv("LUMA_TRACE_OTLP_ENDPOINT")
+    service_name = service_name or os.getenv("LUMA_TRACE_SERVICE_NAME", "luma-discord-bot")
+
+    exporters = []
+    if path:
+        exporters.append(JSONLExporter(path))
+    if otlp_endpoint:
+        exporters.append(OTLPExporter(otlp_endpoint, service_name))
+    tracer.exporters = exporters
+    return tracer
@@ -1,32 +1,7 @@
-import discord
-from discord import app_commands
-from discord.ext import commands
-import os
-from dotenv import load_dotenv
-from lumadisc import bot
+# Same as `python lumadisc.py --sync-only --force`; kept so existing instructions still work
+import sys
 
-# Load environment variables
-load_dotenv()
-DISCORD_TOKEN = os.getenv('DISCORD_TOKEN')
+from lumadisc import main
 
-@bot.event
-async def on_ready():
-    print(f'Logged in as {bot.user} (ID: {bot.user.id})')
-    print('------')
-    
-    # Sync commands
-    try:
-        print("Starting global command sync...")
-        await bot.tree.sync()
-        print("Commands synced successfully!")
-        
-        # Print all registered commands
-        commands = [cmd.name for cmd in bot.tree.get_commands()]
-        print(f'Registered commands: {commands}')
-        
-    except Exception as e:
-        print(f"Error syncing commands: {e}")
-    
-    await bot.close()
-
-bot.run(DISCORD_TOKEN) 
\ No newline at end of file
+if __name__ == "__main__":
+    main(["--sync-only", "--force", *sys.argv[1:]])
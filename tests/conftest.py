@@ -0,0 +1,60 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.luma_service import LumaService  # noqa: E402
+from tools.mock_server import Distribution, MockLumaServer  # noqa: E402
+
+# Settings are read at import; keep the tests away from real state, ports and rate limits
+_mock = MockLumaServer()
+os.environ.update({
+    "LUMA_API_BASE_URL": _mock.luma_url,
+    "IMGBB_UPLOAD_URL": _mock.imgbb_url,
+    "LUMA_API_KEY": "test",
+    "IMGBB_API_KEY": "test",
+    "LUMA_JOB_STORE_PATH": "",
+    "LUMA_REHOST_CACHE_PATH": "",
+    "LUMA_POLL_SCHEDULE_PATH": "",
+    "LUMA_SYNC_STATE_PATH": "",
+    "LUMA_RATE_LIMIT_CREATE": "0",
+    "LUMA_RATE_LIMIT_STATUS": "0",
+    "LUMA_STATUS_CACHE_TTL": "0",
+})
+for name in ("LUMA_METRICS_PORT", "LUMA_CALLBACK_PUBLIC_URL", "LUMA_TRACE_FILE", "LUMA_TRACE_OTLP_ENDPOINT",
+             "LUMA_QUEUE_PATH", "LUMA_DEDUP_TTL", "LUMA_DEDUP_GUILD_TTLS"):
+    os.environ.pop(name, None)
+
+
+def fast_polls(luma: LumaService, delay: float = 0.02):
+    """Poll every pending generation every delay seconds instead of on the learned schedule"""
+    luma.poller.schedule.next_delay = lambda job, state, elapsed: delay
+    return luma
+
+
+@pytest.fixture
+def server():
+    """A mock Luma API whose generations finish in a fraction of a second"""
+    return MockLumaServer(
+        image_queued=Distribution("const:0.05"), image_dreaming=Distribution("const:0.1"),
+        video_queued=Distribution("const:0.05"), video_dreaming=Distribution("const:0.1")
+    )
+
+
+@pytest.fixture
+def luma(server):
+    """A LumaService answered in-process by the mock server"""
+    service = LumaService()
+    service.session = server.session()
+    return fast_polls(service)
+
+
+@pytest.fixture
+def lumadisc(server):
+    """The bot module, its Luma requests answered by the mock server"""
+    import lumadisc
+    lumadisc.luma.session = server.session()
+    fast_polls(lumadisc.luma)
+    return lumadisc
@@ -0,0 +1,48 @@
+import asyncio
+import socket
+
+import aiohttp
+
+from services.callback_server import CallbackServer, make_generation, send_callback
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_callbacks_need_the_token_handed_out():
+    async def scenario():
+        received = []
+        port = free_port()
+        server = CallbackServer(received.append, f"http://127.0.0.1:{port}", secret="local", host="127.0.0.1", port=port)
+        other = CallbackServer(received.append, f"http://127.0.0.1:{port}", secret="elsewhere")
+        await server.start()
+        try:
+            generation = make_generation("g1", "completed", image_url="https://example.com/g1.png")
+            assert await send_callback(server.callback_url, generation) == 200
+
+            # A URL from another secret, or a guessed token, is refused before the body is read
+            assert await send_callback(other.callback_url, generation) == 403
+            assert await send_callback(f"http://127.0.0.1:{port}/luma/callback/{'0' * 64}", generation) == 403
+
+            async with aiohttp.ClientSession() as session:
+                async with session.post(server.callback_url, data=b"not json") as response:
+                    assert response.status == 400
+            assert await send_callback(server.callback_url, {"id": "g1"}) == 400
+        finally:
+            await server.stop()
+        return received, server
+
+    received, server = asyncio.run(scenario())
+    assert [generation["id"] for generation in received] == ["g1"]
+    assert (server.received, server.rejected) == (1, 4)
+
+
+def test_token_depends_on_the_secret():
+    first = CallbackServer(print, "https://bot.example.com/", secret="a")
+    assert first.callback_url == f"https://bot.example.com/luma/callback/{first.token}"
+    assert first.token == CallbackServer(print, "https://bot.example.com", secret="a").token
+    assert first.token != CallbackServer(print, "https://bot.example.com", secret="b").token
+    assert not first.verify("")
@@ -0,0 +1,59 @@
+import asyncio
+import json
+
+import discord
+from discord import app_commands
+
+from services.command_sync import SyncState, sync_commands, tree_hash
+
+
+def make_tree(*commands, description: str = "Generate an image") -> app_commands.CommandTree:
+    """A tree with an /image command plus the named commands, registered in the given order"""
+    tree = app_commands.CommandTree(discord.Client(intents=discord.Intents.none()))
+
+    for name in commands:
+        async def callback(interaction: discord.Interaction):
+            pass
+        tree.add_command(app_commands.Command(name=name, description=f"The {name} command", callback=callback))
+
+    @tree.command(name="image", description=description)
+    @app_commands.describe(prompt="What to generate")
+    @app_commands.choices(aspect=[app_commands.Choice(name="1:1", value="1:1")])
+    async def image(interaction: discord.Interaction, prompt: str, aspect: app_commands.Choice[str]):
+        pass
+
+    return tree
+
+
+def test_hash_is_stable_across_registration_order():
+    assert tree_hash(make_tree("cancel", "help")) == tree_hash(make_tree("help", "cancel"))
+    assert tree_hash(make_tree("cancel")) == tree_hash(make_tree("cancel"))
+
+
+def test_hash_changes_with_anything_discord_sees():
+    base = tree_hash(make_tree("cancel"))
+    assert tree_hash(make_tree("cancel", "help")) != base
+    assert tree_hash(make_tree("cancel", description="Make an image")) != base
+
+
+def test_unchanged_tree_is_not_synced_again(tmp_path):
+    path = str(tmp_path / "command_sync.json")
+    tree = make_tree("cancel")
+    tree.client._connection.application_id = 42
+    synced = []
+
+    async def sync(guild=None):
+        synced.append(guild)
+        return tree.get_commands()
+    tree.sync = sync
+
+    async def scenario():
+        assert await sync_commands(tree, SyncState(path)) is not None
+        # A restart reads the hash back from the file
+        assert await sync_commands(tree, SyncState(path)) is None
+        assert await sync_commands(tree, SyncState(path), force=True) is not None
+
+    asyncio.run(scenario())
+    assert len(synced) == 2
+    with open(path) as file:
+        assert list(json.load(file)) == ["42:global"]
@@ -0,0 +1,61 @@
+import asyncio
+
+from tools.discord_sim import DEFAULT_ARGS, DiscordCalls, FakeInteraction, run_simulation
+from tools.mock_server import Distribution
+
+
+def calls() -> DiscordCalls:
+    return DiscordCalls(Distribution("0"))
+
+
+def test_luma_delivers_images(lumadisc):
+    async def scenario():
+        try:
+            return await run_simulation(
+                lumadisc.bot, "luma", DEFAULT_ARGS["luma"], invocations=6, concurrency=6,
+                users=3, guilds=2, calls=calls()
+            )
+        finally:
+            await lumadisc.luma.close()
+
+    report = asyncio.run(scenario())
+    assert report["errors"] == []
+    assert (report["succeeded"], report["failed"]) == (6, 0)
+    assert report["discord_calls"]["response"] == 6
+
+
+def test_luma_cancel_ends_a_running_generation(lumadisc, server):
+    server.durations["image"] = (Distribution("const:0.05"), Distribution("const:60"))
+
+    async def scenario():
+        command = lumadisc.bot.tree.get_command("luma")
+        interaction = FakeInteraction(command, calls(), user_id=1000, guild_id=2000, channel_id=3000)
+        running = asyncio.create_task(command.callback(interaction, **DEFAULT_ARGS["luma"]))
+        try:
+            while not lumadisc.runner._active:
+                await asyncio.sleep(0.01)
+            [generation_id] = lumadisc.runner._active
+
+            # Someone else may not cancel it
+            cancel = lumadisc.bot.tree.get_command("luma_cancel")
+            other = FakeInteraction(cancel, calls(), user_id=1001, guild_id=2000, channel_id=3000)
+            await cancel.callback(other, generation_id=generation_id)
+            assert "requested by someone else" in other.messages[0]
+            assert lumadisc.runner.watchers(generation_id)
+
+            # The user who asked for it may; run_simulation invokes as user 1000
+            report = await run_simulation(
+                lumadisc.bot, "luma_cancel", {"generation_id": generation_id}, invocations=1, concurrency=1,
+                users=1, guilds=1, calls=calls()
+            )
+            await asyncio.wait_for(running, 2)
+            return report, interaction.messages, generation_id
+        finally:
+            running.cancel()
+            await lumadisc.luma.close()
+
+    report, messages, generation_id = asyncio.run(scenario())
+    assert report["errors"] == [] and report["failed"] == 0
+    assert generation_id not in lumadisc.runner._active
+    assert generation_id not in server.generations
+    assert not any(message.startswith(("✅", "❌")) for message in messages)
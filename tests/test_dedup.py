@@ -0,0 +1,70 @@
+import asyncio
+
+from services.dedup import request_key
+from tools.mock_server import Distribution
+
+
+def test_request_key_is_scoped_to_the_guild():
+    payload = {"prompt": "a lighthouse", "aspect_ratio": "1:1", "model": "photon-1"}
+    assert request_key("/image", payload, 1) == request_key("/image", dict(reversed(payload.items())), 1)
+    assert request_key("/image", payload, 1) != request_key("/image", payload, 2)
+    assert request_key("/image", payload, 1) == request_key("/image", dict(payload, callback_url="http://x"), 1)
+
+
+def test_identical_requests_reuse_a_generation(luma, server):
+    async def scenario():
+        luma.dedup.ttl = 60
+        # Slow enough that the second request arrives while the first is being created
+        server.latency = Distribution("const:0.02")
+        try:
+            def create(**kwargs):
+                return luma.create_capture("image", "a lighthouse", "1:1", **kwargs)
+
+            first, concurrent = await asyncio.gather(create(guild_id=1), create(guild_id=1))
+            assert first["success"] and not first.get("deduplicated")
+            assert concurrent["id"] == first["id"] and concurrent["deduplicated"]
+
+            later = await create(guild_id=1)
+            assert later["id"] == first["id"] and later["deduplicated"]
+            assert luma.dedup.stats()["inflight_hits"] == 1
+            assert luma.dedup.stats()["recent_hits"] == 1
+
+            assert (await create(guild_id=2))["id"] != first["id"]
+            assert (await create(guild_id=1, fresh=True))["id"] != first["id"]
+        finally:
+            await luma.close()
+
+    asyncio.run(scenario())
+
+
+def test_failed_callback_stops_reuse(luma, server):
+    async def scenario():
+        luma.dedup.ttl = 60
+        try:
+            first = await luma.create_capture("image", "a lighthouse", "1:1", guild_id=1)
+            failed = dict(server.generations[first["id"]].to_dict(), state="failed", failure_reason="Mock failure")
+            luma._on_callback(failed)
+
+            again = await luma.create_capture("image", "a lighthouse", "1:1", guild_id=1)
+            assert again["id"] != first["id"] and not again.get("deduplicated")
+        finally:
+            await luma.close()
+
+    asyncio.run(scenario())
+
+
+def test_failed_poll_stops_reuse(luma, server):
+    async def scenario():
+        luma.dedup.ttl = 60
+        server.failure_rate = 1.0
+        try:
+            first = await luma.create_capture("image", "a lighthouse", "1:1", guild_id=1)
+            result = await luma.wait_for_generation(first["id"], max_attempts=5)
+            assert not result["success"]
+
+            again = await luma.create_capture("image", "a lighthouse", "1:1", guild_id=1)
+            assert again["id"] != first["id"]
+        finally:
+            await luma.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,100 @@
+import asyncio
+
+from services.generation_poller import GenerationPoller
+
+
+def make_poller(states: dict) -> GenerationPoller:
+    """A poller whose status checks answer from states, polling every 10 ms"""
+    async def fetch_status(generation_id, kind):
+        state = states.get(generation_id, "queued")
+        result = {"success": True, "status": state, "details": {"state": state}}
+        if state == "completed":
+            result["image_url"] = f"https://example.com/{generation_id}.png"
+        return result
+
+    poller = GenerationPoller(fetch_status, interval=0.01)
+    poller.schedule.next_delay = lambda job, state, elapsed: 0.01
+    return poller
+
+
+def test_completed_generation_resolves_every_waiter():
+    async def scenario():
+        states = {}
+        poller = make_poller(states)
+        job = poller.watch("g1", "image", timeout=5)
+        assert poller.watch("g1", "image", timeout=5) is job
+
+        states["g1"] = "completed"
+        first, second = await asyncio.gather(job.wait(5), job.wait(5))
+        assert first["success"] and first["image_url"].endswith("g1.png")
+        assert second is first
+        assert poller.pending == 0
+        await poller.stop()
+
+    asyncio.run(scenario())
+
+
+def test_generation_times_out():
+    async def scenario():
+        poller = make_poller({})
+        job = poller.watch("g1", "image", timeout=0.1)
+        result = await asyncio.wait_for(job.wait(60), 2)
+        assert not result["success"]
+        assert result["error"] == "Timeout waiting for image generation"
+        await poller.stop()
+
+    asyncio.run(scenario())
+
+
+def test_pending_wait_returns_progress_updates():
+    async def scenario():
+        states = {"g1": "dreaming"}
+        poller = make_poller(states)
+        job = poller.watch("g1", "image", timeout=5)
+        await asyncio.sleep(0.05)
+
+        update = await job.wait(0.1)
+        assert update["progress_update"] and update["status"] == "dreaming"
+        await poller.stop()
+
+    asyncio.run(scenario())
+
+
+def test_stop_leaves_generations_unfinished():
+    async def scenario():
+        poller = make_poller({})
+        job = poller.watch("g1", "image", timeout=60)
+        await poller.stop()
+        result = job.future.result()
+        assert result["stopped"] and not result.get("cancelled")
+
+    asyncio.run(scenario())
+
+
+def test_cancel_ends_the_wait_at_once():
+    async def scenario():
+        poller = make_poller({})
+        job = poller.watch("g1", "video", timeout=60)
+        waiter = asyncio.create_task(job.wait(60))
+        await asyncio.sleep(0.05)
+
+        assert poller.cancel("g1")
+        result = await asyncio.wait_for(waiter, 1)
+        assert result["cancelled"] and result["status"] == "cancelled"
+        assert poller.pending == 0
+        assert not poller.cancel("g1")
+        await poller.stop()
+
+    asyncio.run(scenario())
+
+
+def test_pushed_result_arriving_before_watch_is_kept():
+    async def scenario():
+        poller = make_poller({})
+        assert not poller.push("g1", {"success": True, "status": "completed", "image_url": "https://example.com/g1.png"})
+        job = poller.watch("g1", "image", timeout=60)
+        result = await asyncio.wait_for(job.wait(60), 1)
+        assert result["success"] and result["image_url"] == "https://example.com/g1.png"
+        await poller.stop()
+
+    asyncio.run(scenario())
@@ -0,0 +1,79 @@
+import asyncio
+import os
+
+from services.image_ingest import read_image, sniff_image_type
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 56
+
+
+class FakeContent:
+    def __init__(self, body: bytes):
+        self.body = body
+        self.read = 0
+
+    async def iter_chunked(self, size: int):
+        for offset in range(0, len(self.body), size):
+            self.read += 1
+            yield self.body[offset:offset + size]
+
+
+class FakeResponse:
+    """What read_image uses of aiohttp.ClientResponse"""
+
+    def __init__(self, body: bytes, content_type: str = "image/png", content_length: int = None):
+        self.content_type = content_type
+        self.content_length = content_length
+        self.content = FakeContent(body)
+
+
+def read(response: FakeResponse, max_bytes: int = 1024, spool_threshold: int = 1024) -> dict:
+    return asyncio.run(read_image(response, max_bytes, spool_threshold))
+
+
+def test_sniffs_image_signatures():
+    assert sniff_image_type(PNG[:16]) == "image/png"
+    assert sniff_image_type(b"\xff\xd8\xff\xe0" + b"\x00" * 12) == "image/jpeg"
+    assert sniff_image_type(b"RIFF\x00\x00\x00\x00WEBPVP8 ") == "image/webp"
+    assert sniff_image_type(b"\x00\x00\x00\x18ftypheic\x00\x00\x00\x00") == "image/heic"
+    assert sniff_image_type(b"<!DOCTYPE html><html>") is None
+
+
+def test_image_is_spooled_and_hashed():
+    result = read(FakeResponse(PNG))
+    with result["spool"] as spool:
+        assert spool.content_type == "image/png"
+        assert spool.size == len(PNG) and spool.in_memory
+        assert spool.payload() == PNG
+
+
+def test_large_image_rolls_over_to_a_temporary_file():
+    body = PNG + b"\x01" * 200_000
+    result = read(FakeResponse(body), max_bytes=len(body), spool_threshold=1024)
+    spool = result["spool"]
+    path = spool.path
+    assert not spool.in_memory and os.path.exists(path)
+    assert spool.payload().read() == body
+    spool.close()
+    assert not os.path.exists(path)
+
+
+def test_byte_cap_is_enforced():
+    # Refused from the declared length without reading the body
+    declared = FakeResponse(PNG, content_length=10_000)
+    assert "too large" in read(declared)["error"]
+    assert declared.content.read == 0
+
+    # Refused part way through when the length is not declared
+    streamed = FakeResponse(PNG + b"\x00" * 200_000)
+    result = read(streamed, max_bytes=100_000)
+    assert not result["success"] and "too large" in result["error"]
+    assert streamed.content.read < 4
+
+
+def test_non_images_are_refused():
+    assert "not an image" in read(FakeResponse(PNG, content_type="text/html"))["error"]
+    # A generic content type is accepted only if the bytes are an image
+    assert read(FakeResponse(PNG, content_type="application/octet-stream"))["success"]
+    result = read(FakeResponse(b"<html><body>Not found</body></html>", content_type="image/png"))
+    assert result == {"success": False, "error": "URL is not a supported image"}
+    assert not read(FakeResponse(b"GIF"))["success"]
@@ -0,0 +1,28 @@
+import asyncio
+import io
+
+from PIL import Image
+
+from services.image_ingest import ImageSpool
+
+
+def test_reference_images_are_downsized_in_clean_worker_processes(luma):
+    buffer = io.BytesIO()
+    Image.new("RGB", (3000, 2000), (90, 120, 200)).save(buffer, format="PNG")
+    spool = ImageSpool()
+    spool.write(buffer.getvalue())
+    spool.content_type = "image/png"
+
+    async def scenario():
+        try:
+            result = await luma.preprocess_image(spool, "style_ref")
+            return result, luma._process_pool._mp_context.get_start_method()
+        finally:
+            await luma.close()
+
+    result, start_method = asyncio.run(scenario())
+    spool.close()
+    assert result["changed"] and (result["width"], result["height"]) == (1024, 683)
+    assert result["content_type"] == "image/jpeg"
+    # Never forked from the threaded bot process
+    assert start_method in ("forkserver", "spawn")
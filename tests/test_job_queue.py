@@ -0,0 +1,134 @@
+import asyncio
+
+from services.job_queue import JobQueue, QueuedLuma, QueueWorker
+
+
+class FakeLuma:
+    """Answers queued calls the way LumaService would, noting each one"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def create_capture(self, **params):
+        self.calls.append(("create_capture", params))
+        return {"success": True, "id": "g1"}
+
+    async def wait_for_generation(self, **params):
+        self.calls.append(("wait_for_generation", params))
+        return {"success": True, "status": "completed", "image_url": "https://example.com/g1.png"}
+
+
+class FakeVideoLuma:
+    """A worker's answer to a video wait, with the polls it took"""
+
+    async def wait_for_video_generation(self, **params):
+        return {"success": True, "status": "completed", "video_url": "https://example.com/g1.mp4", "polls": 4}
+
+
+def test_expired_leases_retry_waits_and_fail_creates(tmp_path):
+    async def scenario():
+        queue = JobQueue(str(tmp_path / "queue.db"))
+        wait_id = await queue.submit("wait_for_generation", {"generation_id": "g1"})
+        create_id = await queue.submit("create_capture", {"capture_type": "image", "prompt": "a lighthouse"})
+        claimed = await queue.claim("stopped-worker", limit=5)
+        assert sorted(task_id for task_id, _, _ in claimed) == [wait_id, create_id]
+
+        # Renewed leases are left alone
+        await queue.heartbeat("stopped-worker")
+        assert await queue.recover(lease=60) == (0, 0)
+
+        await asyncio.sleep(0.1)
+        assert await queue.recover(lease=0.05) == (1, 1)
+        assert await queue.stats() == {"queued": 1, "running": 0, "results": 1}
+
+        # The wait is run again by another worker; the create is answered instead of repeated
+        [(task_id, method, params)] = await queue.claim("other-worker", limit=5)
+        [(_, failed_id, result)] = await queue.results_after(0)
+        await queue.close()
+        return (task_id, method, params), (failed_id, result), wait_id, create_id
+
+    retried, failed, wait_id, create_id = asyncio.run(scenario())
+    assert retried == (wait_id, "wait_for_generation", {"generation_id": "g1"})
+    assert failed == (create_id, {"success": False, "error": "The generation worker stopped"})
+
+
+def test_cancels_are_claimed_first(tmp_path):
+    async def scenario():
+        queue = JobQueue(str(tmp_path / "queue.db"))
+        await queue.submit("create_capture", {"prompt": "a"})
+        await queue.submit("wait_for_generation", {"generation_id": "g1"})
+        await queue.submit("cancel_generation", {"generation_id": "g2"})
+        methods = []
+        for _ in range(3):
+            [(_, method, _)] = await queue.claim("worker")
+            methods.append(method)
+        await queue.close()
+        return methods
+
+    assert asyncio.run(scenario()) == ["cancel_generation", "create_capture", "wait_for_generation"]
+
+
+def test_worker_takes_over_calls_of_a_stopped_worker(tmp_path):
+    path = str(tmp_path / "queue.db")
+
+    async def scenario():
+        bot = QueuedLuma(JobQueue(path), poll_interval=0.01, timeout=5)
+        await bot.start()
+        created = await asyncio.wait_for(asyncio.gather(
+            bot.create_capture("image", "a lighthouse", guild_id=1),
+            run_worker_until_idle(path, FakeLuma())
+        ), 5)
+        assert created[0] == {"success": True, "id": "g1"}
+
+        # A worker claims the wait and then disappears without answering
+        waiting = asyncio.create_task(bot.wait_for_generation("g1", max_attempts=10))
+        stopped = JobQueue(path)
+        while not await stopped.claim("stopped-worker"):
+            await asyncio.sleep(0.01)
+        await stopped.close()
+
+        luma = FakeLuma()
+        worker_queue = JobQueue(path)
+        worker = QueueWorker(worker_queue, luma, poll_interval=0.01, lease=0.15)
+        running = asyncio.create_task(worker.run(grace=0))
+        result = await asyncio.wait_for(waiting, 5)
+        worker.stop()
+        await running
+        await worker_queue.close()
+        await bot.close()
+        return result, luma.calls
+
+    result, calls = asyncio.run(scenario())
+    assert result["image_url"] == "https://example.com/g1.png"
+    assert calls == [("wait_for_generation", {"generation_id": "g1", "max_attempts": 10})]
+
+
+def test_bot_reports_its_waits_and_the_workers_polls(tmp_path):
+    path = str(tmp_path / "queue.db")
+
+    async def scenario():
+        bot = QueuedLuma(JobQueue(path), poll_interval=0.01, timeout=5)
+        await bot.start()
+        waiting = asyncio.create_task(bot.wait_for_video_generation("g1", job_type="i2v"))
+        while not bot.pending_by_type():
+            await asyncio.sleep(0.01)
+        in_flight = bot.pending_by_type()
+        await asyncio.wait_for(asyncio.gather(waiting, run_worker_until_idle(path, FakeVideoLuma())), 5)
+        await bot.close()
+        return bot, in_flight
+
+    bot, in_flight = asyncio.run(scenario())
+    assert in_flight == {"i2v": 1}
+    assert bot.pending_by_type() == {}
+    assert (bot.completed_jobs, bot.completed_polls) == (1, 4)
+
+
+async def run_worker_until_idle(path: str, luma: FakeLuma):
+    queue = JobQueue(path)
+    worker = QueueWorker(queue, luma, poll_interval=0.01)
+    running = asyncio.create_task(worker.run(grace=1))
+    while worker.completed == 0:
+        await asyncio.sleep(0.01)
+    worker.stop()
+    await running
+    await queue.close()
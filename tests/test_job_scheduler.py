@@ -0,0 +1,89 @@
+import asyncio
+
+from services.job_scheduler import JobScheduler
+
+
+def test_limits_cap_running_jobs():
+    async def scenario():
+        scheduler = JobScheduler(max_global=3, max_per_guild=2, max_per_user=1)
+        first = scheduler.submit(1, 10)
+        second_from_user = scheduler.submit(1, 10)
+        other_user = scheduler.submit(2, 10)
+        guild_full = scheduler.submit(3, 10)
+        other_guild = scheduler.submit(4, 20)
+        global_full = scheduler.submit(5, 30)
+
+        assert [ticket.state for ticket in (first, second_from_user, other_user, guild_full, other_guild)] == [
+            "running", "queued", "running", "queued", "running"
+        ]
+        assert global_full.state == "queued"
+        assert scheduler.stats()["running"] == 3
+
+        # A freed slot goes to the queued job with the earliest fair share that is under its limits;
+        # the user's second job comes last since that user already had a turn
+        first.release()
+        assert guild_full.state == "running"
+        assert second_from_user.state == "queued"
+
+        other_guild.release()
+        assert global_full.state == "running"
+        assert second_from_user.state == "queued"
+
+        guild_full.release()
+        assert second_from_user.state == "running"
+
+    asyncio.run(scenario())
+
+
+def test_users_share_capacity_fairly():
+    async def scenario():
+        scheduler = JobScheduler(max_global=1, max_per_guild=1, max_per_user=1)
+        order = []
+        tickets = [scheduler.submit("heavy", 1) for _ in range(4)] + [scheduler.submit("light", 1) for _ in range(2)]
+
+        running = tickets[0]
+        while running is not None:
+            order.append(running.user_id)
+            running.release()
+            running = next((ticket for ticket in tickets if ticket.state == "running"), None)
+
+        # The light user's jobs interleave with the heavy user's backlog instead of waiting behind it
+        assert order == ["heavy", "light", "heavy", "light", "heavy", "heavy"]
+
+    asyncio.run(scenario())
+
+
+def test_videos_cost_more_than_images():
+    async def scenario():
+        scheduler = JobScheduler(max_global=1)
+        blocker = scheduler.submit("blocker")
+        video = scheduler.submit("video_user", job_type="t2v")
+        images = [scheduler.submit("image_user") for _ in range(3)]
+
+        # A video weighs three images, so two images submitted after it still go first
+        assert [ticket.position for ticket in images] == [1, 2, 4]
+        assert video.position == 3
+        blocker.release()
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_wait_gives_up_its_place():
+    async def scenario():
+        scheduler = JobScheduler(max_global=1)
+        running = scheduler.submit(1)
+        queued = scheduler.submit(2)
+        behind = scheduler.submit(3)
+
+        waiter = asyncio.create_task(queued.wait())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+
+        assert queued.state == "released"
+        assert behind.position == 1
+        running.release()
+        assert behind.state == "running"
+        assert await behind.wait() >= 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,107 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from services.generation_runner import GenerationRunner
+from services.job_scheduler import JobScheduler
+from services.job_store import JobStore
+
+
+class FakeChannel:
+    def __init__(self):
+        self.messages = []
+
+    async def send(self, content: str):
+        self.messages.append(content)
+
+
+class FakeClient:
+    """Enough of discord.Client for delivering resumed generations"""
+
+    def __init__(self):
+        self.channels = {}
+
+    def get_channel(self, channel_id: int) -> FakeChannel:
+        return self.channels.setdefault(channel_id, FakeChannel())
+
+
+def test_pending_jobs_survive_a_restart(tmp_path):
+    path = str(tmp_path / "jobs.db")
+
+    async def scenario():
+        store = JobStore(path)
+        store.record("g1", "image", interaction_id=1, channel_id=10, guild_id=100, user_id=1000)
+        store.record("g1", "image", interaction_id=2, channel_id=20, guild_id=100, user_id=2000)
+        store.record("g2", "video", job_type="t2v", interaction_id=3, channel_id=10, guild_id=100, user_id=1000)
+        store.update("g1", "dreaming")
+        store.complete("g2", "completed", interaction_id=3)
+        await store.close()
+
+        reopened = JobStore(path)
+        pending = await reopened.pending_jobs()
+        assert [(job["generation_id"], job["interaction_id"], job["state"]) for job in pending] == [
+            ("g1", 1, "dreaming"), ("g1", 2, "dreaming")
+        ]
+
+        # Each requester of a shared generation is marked delivered on its own
+        reopened.complete("g1", "completed", interaction_id=2)
+        assert [job["interaction_id"] for job in await reopened.pending_jobs()] == [1]
+        await reopened.close()
+
+    asyncio.run(scenario())
+
+
+def test_failed_write_is_kept_for_the_next_flush(tmp_path):
+    path = str(tmp_path / "jobs.db")
+
+    async def scenario():
+        store = JobStore(path)
+        store.record("g1", "image", interaction_id=1, channel_id=10, guild_id=100, user_id=1000)
+
+        # Another process holds the database locked for longer than the busy timeout
+        write = store._write
+
+        def locked(staged):
+            raise sqlite3.OperationalError("database is locked")
+        store._write = locked
+        with pytest.raises(sqlite3.OperationalError):
+            await store.flush()
+
+        # Changes staged meanwhile are newer and win
+        store.update("g1", "dreaming")
+        store.record("g2", "video", interaction_id=2, channel_id=10, guild_id=100, user_id=1000)
+        store._write = write
+        pending = await store.pending_jobs()
+        await store.close()
+        return pending
+
+    pending = asyncio.run(scenario())
+    assert [(job["generation_id"], job["state"]) for job in pending] == [("g1", "dreaming"), ("g2", "queued")]
+
+
+def test_resume_delivers_generations_left_pending(tmp_path, luma):
+    path = str(tmp_path / "jobs.db")
+
+    async def scenario():
+        created = await luma.create_capture("image", "a lighthouse", "1:1")
+        store = JobStore(path)
+        store.record(created["id"], "image", job_type="image", model="photon-1",
+                     interaction_id=1, channel_id=10, guild_id=100, user_id=1000)
+        await store.close()
+
+        store = JobStore(path)
+        client = FakeClient()
+        runner = GenerationRunner(client, luma, JobScheduler(), job_store=store)
+        try:
+            await runner.resume()
+            await asyncio.wait_for(asyncio.gather(*runner._resumed), 5)
+        finally:
+            await luma.close()
+
+        [message] = client.channels[10].messages
+        assert message.startswith(f"<@1000> ✅ Your generation `{created['id']}` finished")
+        assert await store.pending_jobs() == []
+        await store.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,34 @@
+import asyncio
+
+from services.luma_service import LumaService
+from services.metrics import JOBS_IN_FLIGHT, REHOST_CACHE_LOOKUPS
+from services.rehost_cache import RehostCache
+
+
+def test_gauges_stay_bound_to_the_service_that_bound_them(luma):
+    async def scenario():
+        luma.bind_metrics()
+        luma.poller.watch("g1", "video", timeout=60, job_type="t2v")
+        LumaService()
+        rendered = JOBS_IN_FLIGHT.render()
+        await luma.poller.stop()
+        return rendered
+
+    assert 'luma_jobs_in_flight{job_type="t2v"} 1' in asyncio.run(scenario())
+
+
+def test_rehost_cache_lookups_are_counted(luma, server, tmp_path):
+    async def scenario():
+        luma.rehost_cache = RehostCache(str(tmp_path / "rehost.db"))
+        url = f"{server.base_url}/images/a.png"
+        results = [await luma.download_and_upload_image(url) for _ in range(2)]
+        results.append(await luma.download_and_upload_image(f"{server.base_url}/images/b.png"))
+        luma.rehost_cache.close()
+        return results
+
+    before = {result: REHOST_CACHE_LOOKUPS.value(result=result) for result in ("url_hit", "hash_hit", "miss")}
+    results = asyncio.run(scenario())
+    assert [result.get("cached", False) for result in results] == [False, True, True]
+    assert {result: REHOST_CACHE_LOOKUPS.value(result=result) - count for result, count in before.items()} == {
+        "url_hit": 1, "hash_hit": 1, "miss": 1
+    }
@@ -0,0 +1,77 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+from services.generation_poller import GenerationPoller
+from services.poll_schedule import DEFAULT_DURATIONS, AdaptiveSchedule
+
+
+def job(job_type: str = "image", model: str = "photon-1") -> SimpleNamespace:
+    return SimpleNamespace(job_type=job_type, model=model, attempts=2, overrun_polls=0)
+
+
+def learned_sample(completes_after: float, poll_every: float, push: bool = False) -> float:
+    """Completion time the poller records for a generation that completes after completes_after seconds"""
+    async def scenario():
+        started = time.monotonic()
+
+        async def fetch_status(generation_id, kind):
+            if time.monotonic() - started < completes_after:
+                return {"success": True, "status": "dreaming"}
+            return {"success": True, "status": "completed", "image_url": "https://example.com/g1.png"}
+
+        schedule = AdaptiveSchedule()
+        schedule.next_delay = lambda job, state, elapsed: 60 if push else poll_every
+        poller = GenerationPoller(fetch_status, interval=poll_every, schedule=schedule)
+        watched = poller.watch("g1", "image", timeout=10, model="photon-1")
+        if push:
+            await asyncio.sleep(completes_after)
+            poller.push("g1", await fetch_status("g1", "image"))
+        await watched.wait(10)
+        await poller.stop()
+        [sample] = schedule._samples[("image", "photon-1")]
+        return sample
+
+    return asyncio.run(scenario())
+
+
+def test_polled_completion_is_the_midpoint_between_checks():
+    # Checks at 0.2 s (dreaming) and 0.4 s (completed); the poll delay is not counted in full
+    assert 0.25 <= learned_sample(0.25, poll_every=0.2) <= 0.35
+
+
+def test_pushed_completion_is_taken_as_is():
+    assert 0.1 <= learned_sample(0.1, poll_every=0.2, push=True) < 0.15
+
+
+def test_windows_start_from_the_defaults_and_learn():
+    schedule = AdaptiveSchedule(min_samples=3)
+    default = DEFAULT_DURATIONS[("image", "photon-1")]
+    assert schedule.expected_window("image", "photon-1") == (default * 0.6, default * 1.5)
+
+    for duration in (4, 5, 6):
+        schedule.record_completion(job(), duration)
+    low, high = schedule.expected_window("image", "photon-1")
+    assert 4 <= low <= high <= 6 + schedule.min_delay
+
+
+def test_samples_survive_a_restart(tmp_path):
+    path = str(tmp_path / "poll_schedule.json")
+    schedule = AdaptiveSchedule(min_samples=3, path=path, save_every=3)
+    for duration in (4, 5, 6):
+        schedule.record_completion(job(), duration)
+    schedule.record_completion(job("t2v", None), 50)
+
+    restarted = AdaptiveSchedule(min_samples=3, path=path)
+    assert restarted.expected_window("image", "photon-1") == schedule.expected_window("image", "photon-1")
+    # Saved every third completion, and on save()
+    assert ("t2v", None) not in restarted._samples
+    schedule.save()
+    assert list(AdaptiveSchedule(path=path)._samples[("t2v", None)]) == [50]
+
+
+def test_unreadable_samples_are_ignored(tmp_path):
+    path = tmp_path / "poll_schedule.json"
+    path.write_text("{not json")
+    schedule = AdaptiveSchedule(path=str(path))
+    assert not schedule._samples
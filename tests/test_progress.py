@@ -0,0 +1,86 @@
+import asyncio
+
+from services.progress import ProgressReporter
+
+
+class Expired(Exception):
+    pass
+
+
+class FakeMessage:
+    def __init__(self, where: str, content: str):
+        self.where = where
+        self.content = content
+
+
+class FakeDiscord:
+    """Records sends and edits; edits of expired messages fail like an expired interaction token"""
+
+    def __init__(self, edit_delay: float = 0):
+        self.edit_delay = edit_delay
+        self.expired = False
+        self.sent = []
+        self.edited = []
+
+    async def send(self, content: str) -> FakeMessage:
+        message = FakeMessage("channel" if self.expired else "followup", content)
+        self.sent.append(message)
+        return message
+
+    async def edit(self, message: FakeMessage, content: str):
+        await asyncio.sleep(self.edit_delay)
+        if self.expired and message.where == "followup":
+            raise Expired()
+        message.content = content
+        self.edited.append(content)
+
+
+def test_finish_lands_after_an_in_flight_edit():
+    async def scenario():
+        discord = FakeDiscord(edit_delay=0.05)
+        progress = ProgressReporter(discord.send, discord.edit, "job", min_interval=0.01)
+        message = await progress.start("queued")
+        await progress.update("dreaming")
+        await asyncio.sleep(0.03)  # the deferred edit is now waiting on Discord
+        await progress.finish("completed")
+        await asyncio.sleep(0.1)
+        return message, discord
+
+    message, discord = asyncio.run(scenario())
+    assert "Dreaming" in discord.edited[0]
+    assert "Completed" in discord.edited[-1]
+    assert "Completed" in message.content
+
+
+def test_no_update_is_shown_after_finish():
+    async def scenario():
+        discord = FakeDiscord()
+        progress = ProgressReporter(discord.send, discord.edit, "job", min_interval=0.05)
+        message = await progress.start("queued")
+        await progress.update("dreaming")
+        await progress.finish("failed")
+        await progress.update("processing")
+        await asyncio.sleep(0.1)
+        return message, discord
+
+    message, discord = asyncio.run(scenario())
+    assert len(discord.edited) == 1
+    assert "Failed" in message.content
+
+
+def test_expired_token_reposts_and_edits_the_new_message():
+    async def scenario():
+        discord = FakeDiscord()
+        progress = ProgressReporter(discord.send, discord.edit, "job", min_interval=0,
+                                    repost_on=lambda e: isinstance(e, Expired))
+        await progress.start("queued")
+        discord.expired = True
+        await progress.update("dreaming")
+        await progress.finish("completed")
+        return progress, discord
+
+    progress, discord = asyncio.run(scenario())
+    assert [m.where for m in discord.sent] == ["followup", "channel"]
+    assert progress.message is discord.sent[1]
+    assert "Completed" in discord.sent[1].content
+    assert "Queued" in discord.sent[0].content
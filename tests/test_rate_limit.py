@@ -0,0 +1,119 @@
+import asyncio
+import time
+from email.utils import formatdate
+
+from services.luma_service import LumaService
+from services.rate_limit import RateLimiter, TokenBucket
+
+
+class ScriptedResponse:
+    def __init__(self, status: int, headers: dict = None):
+        self.status = status
+        self.headers = headers or {}
+
+    async def text(self) -> str:
+        return "{}"
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+class ScriptedSession:
+    """Answers requests with the given statuses in turn, noting when each arrived"""
+
+    def __init__(self, *responses: ScriptedResponse):
+        self.responses = list(responses)
+        self.times = []
+        self.closed = False
+
+    def request(self, method: str, url: str, **kwargs) -> ScriptedResponse:
+        self.times.append(asyncio.get_running_loop().time())
+        return self.responses.pop(0)
+
+    async def close(self):
+        self.closed = True
+
+
+def test_parses_retry_after():
+    assert RateLimiter.parse_retry_after("3") == 3
+    assert RateLimiter.parse_retry_after("0.5") == 0.5
+    assert RateLimiter.parse_retry_after("-2") == 0
+    assert 8 < RateLimiter.parse_retry_after(formatdate(time.time() + 10, usegmt=True)) <= 10
+    assert RateLimiter.parse_retry_after(formatdate(time.time() - 60, usegmt=True)) == 0
+    assert RateLimiter.parse_retry_after("soon") is None
+    assert RateLimiter.parse_retry_after(None) is None
+
+
+def test_bucket_allows_a_burst_then_spaces_requests():
+    async def scenario():
+        bucket = TokenBucket(rate=20, burst=3)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        times = []
+        for _ in range(5):
+            await bucket.acquire()
+            times.append(loop.time() - started)
+        return times
+
+    times = asyncio.run(scenario())
+    assert times[2] < 0.02
+    assert times[4] >= 0.09
+
+
+def test_backoff_pauses_every_bucket():
+    async def scenario():
+        limiter = RateLimiter({"create": (1000, 10), "status": (1000, 10)}, max_backoff=0.2)
+        limiter.backoff(60)
+        assert 0.15 < limiter.paused_for <= 0.2
+        waited = await limiter.acquire("status")
+        assert waited >= 0.15
+        assert limiter.stats()["throttled"] == 1
+        # Buckets not configured only wait out the pause
+        assert await limiter.acquire("other") < 0.01
+
+    asyncio.run(scenario())
+
+
+def test_429_is_retried_after_retry_after():
+    async def scenario():
+        luma = LumaService()
+        session = ScriptedSession(
+            ScriptedResponse(429, {"Retry-After": "0.2"}), ScriptedResponse(429), ScriptedResponse(429),
+            ScriptedResponse(200)
+        )
+        luma.session = session
+        # Without Retry-After the pause doubles from one second; keep it short here
+        luma.rate_limiter.max_backoff = 0.2
+        pauses = []
+        backoff = luma.rate_limiter.backoff
+        luma.rate_limiter.backoff = lambda seconds: (pauses.append(seconds), backoff(seconds))
+        try:
+            response = await luma._request("GET", "https://luma.test/generations/g1", operation="status")
+        finally:
+            await luma.close()
+        return response, session, pauses
+
+    response, session, pauses = asyncio.run(scenario())
+    assert response.status == 200
+    assert pauses == [0.2, 2, 4]
+    assert session.times[1] - session.times[0] >= 0.19
+
+
+def test_429_is_returned_once_retries_run_out():
+    async def scenario():
+        luma = LumaService()
+        luma.rate_limit_retries = 1
+        session = ScriptedSession(ScriptedResponse(429, {"Retry-After": "0"}), ScriptedResponse(429, {"Retry-After": "0"}))
+        luma.session = session
+        try:
+            response = await luma._request("GET", "https://luma.test/generations/g1", operation="status")
+        finally:
+            await luma.close()
+        return response, session
+
+    response, session = asyncio.run(scenario())
+    assert response.status == 429
+    assert session.responses == []
@@ -0,0 +1,7 @@
+from services.settings import parse_id_map
+
+
+def test_parse_id_map():
+    assert parse_id_map("") == {}
+    assert parse_id_map("123:60, 456:0.5,") == {123: 60.0, 456: 0.5}
+    assert parse_id_map("123:2", convert=int) == {123: 2}
@@ -0,0 +1,94 @@
+import asyncio
+import json
+
+from services.luma_service import APIResponse
+from services.status_cache import StatusCache
+
+
+def generation(state: str, assets: dict = None, status: int = 200) -> APIResponse:
+    return APIResponse(status, json.dumps({"id": "g1", "state": state, "assets": assets}))
+
+
+class Lookup:
+    """A status request that returns each response in turn after delay seconds"""
+
+    def __init__(self, *responses: APIResponse, delay: float = 0.05):
+        self.responses = list(responses)
+        self.delay = delay
+        self.calls = 0
+
+    async def __call__(self) -> APIResponse:
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return self.responses.pop(0)
+
+
+def test_concurrent_lookups_share_one_request():
+    async def scenario():
+        cache = StatusCache(ttl=0)
+        lookup = Lookup(generation("dreaming"))
+        results = await asyncio.gather(*(cache.fetch("g1", lookup) for _ in range(5)))
+        return cache, lookup, results
+
+    cache, lookup, results = asyncio.run(scenario())
+    assert lookup.calls == 1
+    assert all(result is results[0] for result in results)
+    assert cache.stats() == {"hits": 0, "misses": 1, "coalesced": 4, "entries": 1}
+
+
+def test_caller_giving_up_does_not_fail_the_others():
+    async def scenario():
+        cache = StatusCache(ttl=0)
+        lookup = Lookup(generation("dreaming"))
+        first = asyncio.create_task(cache.fetch("g1", lookup))
+        second = asyncio.create_task(cache.fetch("g1", lookup))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return lookup, await second
+
+    lookup, response = asyncio.run(scenario())
+    assert lookup.calls == 1 and response.status == 200
+
+
+def test_pending_states_expire_and_final_states_stay():
+    async def scenario():
+        cache = StatusCache(ttl=0.05)
+        lookup = Lookup(
+            generation("dreaming"), generation("completed", {"image": "https://example.com/g1.png"}), delay=0
+        )
+        assert json.loads((await cache.fetch("g1", lookup)).text)["state"] == "dreaming"
+        await cache.fetch("g1", lookup)
+        assert lookup.calls == 1
+
+        await asyncio.sleep(0.06)
+        completed = await cache.fetch("g1", lookup)
+        await asyncio.sleep(0.06)
+        assert await cache.fetch("g1", lookup) is completed
+        return cache, lookup
+
+    cache, lookup = asyncio.run(scenario())
+    assert lookup.calls == 2
+    assert cache.stats()["hits"] == 2
+
+
+def test_completed_without_assets_and_errors_are_not_kept():
+    async def scenario():
+        cache = StatusCache(ttl=0)
+        lookup = Lookup(generation("completed"), generation("failed", status=500), generation("failed"), delay=0)
+        for _ in range(3):
+            await cache.fetch("g1", lookup)
+        # A failed generation is final
+        await cache.fetch("g1", lookup)
+        return lookup
+
+    assert asyncio.run(scenario()).calls == 3
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = StatusCache(max_entries=2)
+    for generation_id in ("g1", "g2"):
+        cache.put(generation_id, generation("failed"))
+    cache.get("g1")
+    cache.put("g3", generation("failed"))
+    assert cache.get("g2") is None
+    assert cache.get("g1") is not None and cache.get("g3") is not None
@@ -0,0 +1,314 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from services.generation_poller import GenerationPoller
+from services.luma_service import APIResponse, LumaService
+from services.poll_schedule import AdaptiveSchedule
+from services.rehost_cache import RehostCache
+
+RESULTS_DIR = ".benchmarks"
+
+PROMPT = "a lighthouse on a cliff at dusk, waves crashing below, cinematic lighting"
+IMAGE_URLS = ["https://example.com/reference-1.png", "https://example.com/reference-2.png"]
+DISCORD_URLS = [
+    "https://cdn.discordapp.com/attachments/1/2/reference-1.png",
+    "https://media.discordapp.net/attachments/1/2/reference-2.png"
+]
+
+GENERATION = {
+    "id": "0b7ad4a4-1b3c-4f0e-9a57-0c3d8f0a2b11",
+    "generation_type": "video",
+    "state": "completed",
+    "failure_reason": None,
+    "created_at": "2026-01-01T00:00:00.000Z",
+    "assets": {
+        "video": "https://storage.cdn-luma.com/dream_machine/0b7ad4a4/video.mp4",
+        "image": "https://storage.cdn-luma.com/dream_machine/0b7ad4a4/image.jpg"
+    },
+    "model": "ray-2",
+    "request": {"prompt": PROMPT, "aspect_ratio": "16:9", "loop": False}
+}
+
+# name -> async (iterations) -> seconds spent on the measured operations
+BENCHMARKS = {}
+
+
+def benchmark(name: str):
+    def register(function):
+        BENCHMARKS[name] = function
+        return function
+    return register
+
+
+class _ImmediateSchedule(AdaptiveSchedule):
+    """Polls again straight away, so a benchmark measures only poller overhead"""
+
+    def next_delay(self, job, state: str, elapsed: float) -> float:
+        return 0
+
+
+class Fixture:
+    """A LumaService whose network calls are answered in-process"""
+
+    def __init__(self):
+        os.environ["LUMA_REHOST_CACHE_PATH"] = ""
+        os.environ["LUMA_POLL_SCHEDULE_PATH"] = ""
+        os.environ.pop("LUMA_CALLBACK_PUBLIC_URL", None)
+        self.luma = LumaService()
+        self.luma._submit_generation = self._submitted
+        self.luma._get_generation = self._generation
+        self._tempdir = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self._tempdir.name, "rehost_cache.db")
+
+    @staticmethod
+    async def _submitted(endpoint: str, payload: dict, guild_id: int = None, fresh: bool = False) -> dict:
+        return {"success": True, "id": GENERATION["id"], "state": "queued", "details": payload}
+
+    @staticmethod
+    async def _generation(generation_id: str) -> APIResponse:
+        return APIResponse(200, json.dumps(GENERATION))
+
+    def with_rehost_cache(self):
+        """Give the service a rehost cache that already knows DISCORD_URLS"""
+        if self.luma.rehost_cache is None:
+            self.luma.rehost_cache = RehostCache(self.cache_path)
+            for index, url in enumerate(DISCORD_URLS):
+                self.luma.rehost_cache.put(url, f"{index:064x}", f"https://i.ibb.co/bench/{index}.png")
+        return self.luma
+
+    async def close(self):
+        await self.luma.close()
+        self._tempdir.cleanup()
+
+
+fixture = None
+
+
+async def timed(iterations: int, call) -> float:
+    """Seconds taken to await call() iterations times"""
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await call()
+    return time.perf_counter() - started
+
+
+def _create_benchmark(name: str, method: str, *args, **kwargs):
+    @benchmark(f"create.{name}")
+    async def run(iterations: int) -> float:
+        create = getattr(fixture.luma, method)
+        return await timed(iterations, lambda: create(*args, **kwargs))
+
+
+_create_benchmark("capture", "create_capture", "image", PROMPT, "16:9", "photon-1")
+_create_benchmark("capture_with_ref", "create_capture_with_ref", PROMPT,
+                  image_refs=[{"url": url, "weight": 0.85} for url in IMAGE_URLS])
+_create_benchmark("capture_with_style", "create_capture_with_style", PROMPT,
+                  style_refs=[{"url": IMAGE_URLS[0], "weight": 0.85}])
+_create_benchmark("capture_with_char", "create_capture_with_char", PROMPT, char_images=IMAGE_URLS)
+_create_benchmark("capture_with_mod", "create_capture_with_mod", PROMPT, image_url=IMAGE_URLS[0], weight=0.45)
+_create_benchmark("video", "create_video", PROMPT)
+_create_benchmark("image_video", "create_image_video", PROMPT, IMAGE_URLS[0], "frame0", IMAGE_URLS[1], "frame1")
+_create_benchmark("extend_video", "extend_video", PROMPT, "extend_end", GENERATION["id"], image_url=IMAGE_URLS[0])
+
+
+@benchmark("status.capture")
+async def status_capture(iterations: int) -> float:
+    return await timed(iterations, lambda: fixture.luma.get_capture_status(GENERATION["id"]))
+
+
+@benchmark("status.video")
+async def status_video(iterations: int) -> float:
+    return await timed(iterations, lambda: fixture.luma.get_video_status(GENERATION["id"]))
+
+
+@benchmark("rehost.is_discord_url")
+async def is_discord_url(iterations: int) -> float:
+    urls = IMAGE_URLS + DISCORD_URLS
+    started = time.perf_counter()
+    for index in range(iterations):
+        LumaService._is_discord_url(urls[index % len(urls)])
+    return time.perf_counter() - started
+
+
+@benchmark("rehost.passthrough")
+async def rehost_passthrough(iterations: int) -> float:
+    return await timed(iterations, lambda: fixture.luma.rehost_images(IMAGE_URLS, "image_ref"))
+
+
+@benchmark("rehost.cached")
+async def rehost_cached(iterations: int) -> float:
+    luma = fixture.with_rehost_cache()
+    return await timed(iterations, lambda: luma.rehost_images(DISCORD_URLS))
+
+
+async def _poll_pending(iterations: int, pending: int) -> float:
+    """Seconds per iterations status checks spread over pending jobs"""
+    polls = 0
+    done = asyncio.get_running_loop().create_future()
+
+    async def fetch_status(generation_id: str, kind: str) -> dict:
+        nonlocal polls
+        polls += 1
+        if polls >= iterations and not done.done():
+            done.set_result(time.perf_counter())
+        return {"success": True, "status": "dreaming"}
+
+    poller = GenerationPoller(fetch_status, interval=0, max_concurrency=8, schedule=_ImmediateSchedule(min_delay=0))
+    started = time.perf_counter()
+    for index in range(pending):
+        poller.watch(f"generation-{index}", "video", timeout=3600, job_type="t2v")
+    finished = await done
+    await poller.stop()
+    return finished - started
+
+
+@benchmark("poller.poll_100_pending")
+async def poll_100_pending(iterations: int) -> float:
+    return await _poll_pending(iterations, 100)
+
+
+@benchmark("poller.poll_1000_pending")
+async def poll_1000_pending(iterations: int) -> float:
+    return await _poll_pending(iterations, 1000)
+
+
+@benchmark("poller.watch_to_result")
+async def watch_to_result(iterations: int) -> float:
+    result = {"success": True, "status": "completed", "video_url": GENERATION["assets"]["video"]}
+
+    async def fetch_status(generation_id: str, kind: str) -> dict:
+        return result
+
+    poller = GenerationPoller(fetch_status, interval=0, max_concurrency=8, schedule=_ImmediateSchedule(min_delay=0))
+    started = time.perf_counter()
+    jobs = [poller.watch(f"generation-{index}", "video", timeout=3600, job_type="t2v") for index in range(iterations)]
+    await asyncio.gather(*(job.future for job in jobs))
+    elapsed = time.perf_counter() - started
+    await poller.stop()
+    return elapsed
+
+
+async def measure(function, min_time: float, repeat: int) -> dict:
+    """Calibrate iterations to take at least min_time, then time repeat rounds"""
+    iterations = 1
+    while True:
+        elapsed = await function(iterations)
+        if elapsed >= min_time or iterations >= 1 << 24:
+            break
+        iterations = max(iterations * 2, int(iterations * min_time / max(elapsed, 1e-9) * 1.2))
+
+    rounds = [elapsed / iterations]
+    for _ in range(repeat - 1):
+        rounds.append(await function(iterations) / iterations)
+    return {
+        "ns_per_op": round(statistics.median(rounds) * 1e9, 1),
+        "min_ns_per_op": round(min(rounds) * 1e9, 1),
+        "iterations": iterations,
+        "rounds": len(rounds)
+    }
+
+
+def current_commit() -> str:
+    """Short hash of HEAD, marked -dirty when tracked files have changed"""
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short=12", "HEAD"], text=True).strip()
+        changed = subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"], text=True)
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return f"{commit}-dirty" if changed.strip() else commit
+
+
+def results_path(reference: str) -> str:
+    """A results file given as a path, or the stored results for a commit"""
+    if os.path.exists(reference):
+        return reference
+    return os.path.join(RESULTS_DIR, f"{reference}.json")
+
+
+async def run_benchmarks(names: list, min_time: float, repeat: int) -> dict:
+    global fixture
+    fixture = Fixture()
+    results = {}
+    try:
+        for name in names:
+            results[name] = await measure(BENCHMARKS[name], min_time, repeat)
+            print(f"{name:<32} {results[name]['ns_per_op'] / 1000:>12.2f} µs/op", file=sys.stderr)
+    finally:
+        await fixture.close()
+    return results
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    """Print the change per benchmark and return the names slower by more than threshold percent"""
+    regressions = []
+    print(f"{'benchmark':<32} {'baseline µs':>12} {'current µs':>12} {'change':>8}")
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            print(f"{name:<32} {'-':>12} {result['ns_per_op'] / 1000:>12.2f} {'new':>8}")
+            continue
+        change = (result["ns_per_op"] - before["ns_per_op"]) / before["ns_per_op"] * 100
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  regression"
+        print(f"{name:<32} {before['ns_per_op'] / 1000:>12.2f} {result['ns_per_op'] / 1000:>12.2f} "
+              f"{change:>+7.1f}%{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for LumaService hot paths")
+    parser.add_argument("--filter", default="", help="Only run benchmarks whose name contains this")
+    parser.add_argument("--list", action="store_true", help="List benchmarks and exit")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Minimum seconds per round (default: 0.2)")
+    parser.add_argument("--repeat", type=int, default=5, help="Rounds per benchmark (default: 5)")
+    parser.add_argument("--output", help=f"Results file (default: {RESULTS_DIR}/<commit>.json)")
+    parser.add_argument("--compare", metavar="COMMIT_OR_FILE",
+                        help="Compare with stored results for a commit, or a results file")
+    parser.add_argument("--threshold", type=float, default=10,
+                        help="Percent slowdown reported as a regression (default: 10)")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 on any regression")
+    args = parser.parse_args()
+
+    names = [name for name in BENCHMARKS if args.filter in name]
+    if args.list:
+        print("\n".join(names))
+        return
+
+    logging.basicConfig(level=logging.ERROR)
+    commit = current_commit()
+    report = {
+        "commit": commit,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": asyncio.run(run_benchmarks(names, args.min_time, args.repeat))
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"Saved results to {output}", file=sys.stderr)
+
+    if args.compare:
+        with open(results_path(args.compare)) as file:
+            baseline = json.load(file)
+        print(f"Comparing {commit} with {baseline['commit']}")
+        regressions = compare(report, baseline, args.threshold)
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import time
+
+import discord
+
+from tools.load_test import percentile
+from tools.mock_server import Distribution, add_arguments, server_from_args
+
+# Arguments used for a command when --args is not given
+DEFAULT_ARGS = {
+    "luma": {"aspect": "1:1", "model": "photon-1", "prompt": "a lighthouse at dusk"},
+    "luma_t2v": {"prompt": "waves rolling onto a beach", "aspect": "16:9"},
+    "luma_ref": {"aspect": "1:1", "model": "photon-1", "prompt": "in this style",
+                 "image_url1": "https://example.com/reference.png"},
+    "luma_style": {"aspect": "1:1", "model": "photon-1", "prompt": "in this style",
+                   "style_url": "https://example.com/style.png"},
+    "luma_char": {"aspect": "1:1", "model": "photon-1", "prompt": "the same person waving",
+                  "image_url1": "https://example.com/person.png"},
+    "luma_mod": {"model": "photon-1", "prompt": "make the sky purple", "image_url": "https://example.com/photo.png"},
+    "luma_i2v": {"prompt": "the scene comes alive", "image_url1": "https://example.com/frame.png",
+                 "frame_type1": "frame0"},
+    "luma_help": {"section": "info"},
+}
+
+_snowflakes = itertools.count(1 << 40)
+
+
+class DiscordCalls:
+    """Discord API calls made by fake interactions, each delayed by a sampled latency"""
+
+    def __init__(self, latency: Distribution):
+        self.latency = latency
+        self.counts = {}
+
+    async def call(self, kind: str):
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+        delay = self.latency.sample()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class FakeMessage:
+    def __init__(self, calls: DiscordCalls, interaction: "FakeInteraction", content: str):
+        self.id = next(_snowflakes)
+        self.calls = calls
+        self.interaction = interaction
+        self.content = content
+
+    async def edit(self, content: str = None, **kwargs):
+        await self.calls.call("edit")
+        self.content = content
+        return self
+
+
+class FakeResponse:
+    def __init__(self, interaction: "FakeInteraction"):
+        self.interaction = interaction
+        self._done = False
+
+    def is_done(self) -> bool:
+        return self._done
+
+    async def send_message(self, content: str = None, **kwargs):
+        if self._done:
+            raise discord.InteractionResponded(self.interaction)
+        self._done = True
+        await self.interaction.calls.call("response")
+        self.interaction.responded_at = time.monotonic()
+        self.interaction.messages.append(content)
+
+    async def defer(self, **kwargs):
+        if self._done:
+            raise discord.InteractionResponded(self.interaction)
+        self._done = True
+        await self.interaction.calls.call("defer")
+        self.interaction.responded_at = time.monotonic()
+
+
+class FakeFollowup:
+    def __init__(self, interaction: "FakeInteraction"):
+        self.interaction = interaction
+
+    async def send(self, content: str = None, **kwargs) -> FakeMessage:
+        await self.interaction.calls.call("followup")
+        self.interaction.messages.append(content)
+        return FakeMessage(self.interaction.calls, self.interaction, content)
+
+
+class FakeInteraction:
+    """Enough of discord.Interaction for the bot's slash command handlers"""
+
+    def __init__(self, command, calls: DiscordCalls, user_id: int, guild_id: int, channel_id: int):
+        self.id = next(_snowflakes)
+        self.command = command
+        self.calls = calls
+        self.user = discord.Object(user_id)
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.permissions = discord.Permissions.none()
+        self.created_at = discord.utils.utcnow()
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+        self.messages = []
+        self.responded_at = None
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop runs a callback scheduled every interval seconds"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.samples = []
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - expected))
+
+
+async def run_simulation(bot, command_name: str, kwargs: dict, invocations: int, concurrency: int,
+                         users: int, guilds: int, calls: DiscordCalls) -> dict:
+    """Invoke a registered slash command through fake interactions and summarise the run"""
+    command = bot.tree.get_command(command_name)
+    if command is None:
+        raise ValueError(f"Unknown command: {command_name}")
+
+    semaphore = asyncio.Semaphore(concurrency)
+    results = []
+
+    async def invoke(index: int):
+        async with semaphore:
+            interaction = FakeInteraction(
+                command, calls,
+                user_id=1000 + index % users,
+                guild_id=2000 + index % guilds,
+                channel_id=3000 + index % guilds
+            )
+            started = time.monotonic()
+            error = None
+            try:
+                await command.callback(interaction, **kwargs)
+            except Exception as e:
+                error = repr(e)
+            finished = time.monotonic()
+            results.append({
+                "handler_seconds": finished - started,
+                "response_seconds": (interaction.responded_at or finished) - started,
+                "succeeded": any((message or "").startswith("✅") for message in interaction.messages),
+                "failed": error is not None or any((message or "").startswith("❌") for message in interaction.messages),
+                "error": error
+            })
+
+    monitor = LoopLagMonitor()
+    monitor.start()
+    started = time.monotonic()
+    await asyncio.gather(*(invoke(index) for index in range(invocations)))
+    wall_seconds = time.monotonic() - started
+    await monitor.stop()
+
+    handler = [result["handler_seconds"] for result in results]
+    response = [result["response_seconds"] for result in results]
+    return {
+        "command": command_name,
+        "invocations": invocations,
+        "concurrency": concurrency,
+        "succeeded": sum(result["succeeded"] for result in results),
+        "failed": sum(result["failed"] for result in results),
+        "errors": sorted({result["error"] for result in results if result["error"]}),
+        "wall_seconds": round(wall_seconds, 3),
+        "commands_per_second": round(invocations / wall_seconds, 3) if wall_seconds else 0.0,
+        "handler_p50_seconds": round(percentile(handler, 50), 3),
+        "handler_p99_seconds": round(percentile(handler, 99), 3),
+        "first_response_p50_seconds": round(percentile(response, 50), 4),
+        "first_response_p99_seconds": round(percentile(response, 99), 4),
+        "loop_lag_p50_ms": round(percentile(monitor.samples, 50) * 1000, 2),
+        "loop_lag_p99_ms": round(percentile(monitor.samples, 99) * 1000, 2),
+        "loop_lag_max_ms": round(max(monitor.samples, default=0.0) * 1000, 2),
+        "discord_calls": dict(calls.counts),
+        "discord_calls_per_command": round(sum(calls.counts.values()) / invocations, 2) if invocations else 0.0
+    }
+
+
+def print_report(report: dict, luma_requests: dict):
+    print(f"Command:           /{report['command']} x {report['invocations']} at concurrency {report['concurrency']}")
+    print(f"Results:           {report['succeeded']} succeeded, {report['failed']} failed")
+    for error in report["errors"]:
+        print(f"  {error}")
+    print(f"Wall time:         {report['wall_seconds']:.1f} s ({report['commands_per_second']:.2f} commands/s)")
+    print(f"Handler latency:   p50 {report['handler_p50_seconds']:.2f} s, p99 {report['handler_p99_seconds']:.2f} s")
+    print(f"First response:    p50 {report['first_response_p50_seconds'] * 1000:.0f} ms, "
+          f"p99 {report['first_response_p99_seconds'] * 1000:.0f} ms")
+    print(f"Event loop lag:    p50 {report['loop_lag_p50_ms']:.1f} ms, p99 {report['loop_lag_p99_ms']:.1f} ms, "
+          f"max {report['loop_lag_max_ms']:.1f} ms")
+    calls = ", ".join(f"{count} {kind}" for kind, count in sorted(report["discord_calls"].items()))
+    print(f"Discord calls:     {report['discord_calls_per_command']} per command ({calls})")
+    print(f"Luma requests:     {sum(luma_requests.values())}")
+
+
+async def main_async(args: argparse.Namespace) -> tuple:
+    server = server_from_args(args)
+    # The bot reads its settings at import; keep the simulation away from real state and ports
+    os.environ["LUMA_API_BASE_URL"] = server.luma_url
+    os.environ["IMGBB_UPLOAD_URL"] = server.imgbb_url
+    os.environ["LUMA_JOB_STORE_PATH"] = ""
+    os.environ["LUMA_REHOST_CACHE_PATH"] = ""
+    os.environ["LUMA_POLL_SCHEDULE_PATH"] = ""
+    for name in ("LUMA_METRICS_PORT", "LUMA_CALLBACK_PUBLIC_URL", "LUMA_TRACE_FILE", "LUMA_TRACE_OTLP_ENDPOINT"):
+        os.environ.pop(name, None)
+    os.environ.setdefault("LUMA_API_KEY", "simulation")
+    os.environ.setdefault("IMGBB_API_KEY", "simulation")
+    import lumadisc
+
+    # Luma requests are answered in-process by the mock server
+    lumadisc.luma.session = server.session()
+    kwargs = json.loads(args.args) if args.args else DEFAULT_ARGS.get(args.command, {})
+    try:
+        report = await run_simulation(
+            lumadisc.bot, args.command, kwargs, args.invocations, args.concurrency,
+            args.users, args.guilds, DiscordCalls(args.discord_latency)
+        )
+    finally:
+        await lumadisc.luma.close()
+    return report, server.stats()["requests"]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Invoke the bot's slash commands in-process with fake Discord interactions and a mock Luma API"
+    )
+    parser.add_argument("--command", default="luma", help="Slash command to invoke (default: luma)")
+    parser.add_argument("--args", help="Command arguments as a JSON object (defaults exist for most commands)")
+    parser.add_argument("--invocations", type=int, default=50, help="Commands to invoke (default: 50)")
+    parser.add_argument("--concurrency", type=int, default=50, help="Commands in flight at once (default: 50)")
+    parser.add_argument("--users", type=int, default=50, help="Distinct users invoking commands (default: 50)")
+    parser.add_argument("--guilds", type=int, default=10, help="Distinct guilds invoking commands (default: 10)")
+    parser.add_argument("--discord-latency", type=Distribution, default=Distribution("lognormal:0.08,0.4"),
+                        help="Delay of each Discord API call (default: lognormal:0.08,0.4)")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    add_arguments(parser)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    report, luma_requests = asyncio.run(main_async(args))
+    if args.json:
+        print(json.dumps(dict(report, luma_requests=luma_requests), indent=2))
+    else:
+        print_report(report, luma_requests)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+
+import aiohttp
+
+from services.luma_service import LumaService
+from tools.mock_server import add_arguments, server_from_args
+
+
+def percentile(values: list, q: float) -> float:
+    """Nearest-rank percentile of values; 0 when there are none"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+async def run_job(luma, index: int, job_type: str) -> dict:
+    """Create one generation and wait for its final result, timing both"""
+    started = time.monotonic()
+    if job_type == "image":
+        created = await luma.create_capture("image", f"load test image {index}", "1:1", "photon-1")
+    else:
+        created = await luma.create_video(f"load test video {index}", "16:9")
+    create_seconds = time.monotonic() - started
+    if not created.get("success"):
+        return {"job_type": job_type, "success": False, "error": created.get("error"), "create_seconds": create_seconds}
+
+    while True:
+        if job_type == "image":
+            result = await luma.wait_for_generation(created["id"], model="photon-1")
+        else:
+            result = await luma.wait_for_video_generation(created["id"], job_type=job_type)
+        if not result.get("progress_update"):
+            break
+
+    return {
+        "job_type": job_type,
+        "success": bool(result.get("success")),
+        "error": result.get("error"),
+        "create_seconds": create_seconds,
+        "total_seconds": time.monotonic() - started
+    }
+
+
+async def run_load(luma, jobs: int, concurrency: int, video_share: float, stats_url: str) -> dict:
+    """Run jobs simulated generations, at most concurrency at a time, and summarise them"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(index: int):
+        async with semaphore:
+            job_type = "t2v" if random.random() < video_share else "image"
+            return await run_job(luma, index, job_type)
+
+    started = time.monotonic()
+    results = await asyncio.gather(*(limited(index) for index in range(jobs)))
+    wall_seconds = time.monotonic() - started
+
+    async with aiohttp.ClientSession() as session:
+        async with session.get(stats_url) as response:
+            server = await response.json()
+
+    completed = [result for result in results if result["success"]]
+    total = [result["total_seconds"] for result in completed]
+    create = [result["create_seconds"] for result in results]
+    requests = sum(server["requests"].values())
+    status_requests = sum(
+        count for endpoint, count in server["requests"].items()
+        if endpoint.startswith("GET /dream-machine/v1/generations/")
+    )
+    errors = {}
+    for result in results:
+        if not result["success"]:
+            errors[result["error"]] = errors.get(result["error"], 0) + 1
+
+    return {
+        "jobs": jobs,
+        "concurrency": concurrency,
+        "completed": len(completed),
+        "failed": jobs - len(completed),
+        "errors": errors,
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_jobs_per_second": round(len(completed) / wall_seconds, 3) if wall_seconds else 0.0,
+        "latency_p50_seconds": round(percentile(total, 50), 3),
+        "latency_p99_seconds": round(percentile(total, 99), 3),
+        "create_p50_seconds": round(percentile(create, 50), 3),
+        "create_p99_seconds": round(percentile(create, 99), 3),
+        "requests": requests,
+        "requests_per_completed_job": round(requests / len(completed), 2) if completed else None,
+        "status_requests_per_completed_job": round(status_requests / len(completed), 2) if completed else None,
+        "server_requests": server["requests"]
+    }
+
+
+def print_report(report: dict):
+    print(f"Jobs:              {report['completed']} completed, {report['failed']} failed "
+          f"({report['jobs']} at concurrency {report['concurrency']})")
+    for error, count in report["errors"].items():
+        print(f"  {count} x {error}")
+    print(f"Wall time:         {report['wall_seconds']:.1f} s")
+    print(f"Throughput:        {report['throughput_jobs_per_second']:.2f} jobs/s")
+    print(f"Job latency:       p50 {report['latency_p50_seconds']:.2f} s, p99 {report['latency_p99_seconds']:.2f} s")
+    print(f"Create latency:    p50 {report['create_p50_seconds'] * 1000:.0f} ms, "
+          f"p99 {report['create_p99_seconds'] * 1000:.0f} ms")
+    print(f"Requests:          {report['requests']} "
+          f"({report['requests_per_completed_job']} per completed job, "
+          f"{report['status_requests_per_completed_job']} of them status checks)")
+
+
+async def main_async(args: argparse.Namespace) -> dict:
+    server = None
+    if args.base_url:
+        luma_url = args.base_url.rstrip("/")
+        stats_url = luma_url.split("/dream-machine/")[0] + "/_stats"
+    else:
+        server = server_from_args(args)
+        await server.start()
+        luma_url = server.luma_url
+        stats_url = f"{server.base_url}/_stats"
+        os.environ["IMGBB_UPLOAD_URL"] = server.imgbb_url
+
+    # LumaService reads its endpoints and limits from the environment
+    os.environ["LUMA_API_BASE_URL"] = luma_url
+    os.environ.setdefault("LUMA_API_KEY", "load-test")
+    os.environ.setdefault("IMGBB_API_KEY", "load-test")
+    os.environ.setdefault("LUMA_REHOST_CACHE_PATH", "")
+    os.environ.setdefault("LUMA_POLL_SCHEDULE_PATH", "")
+
+    luma = LumaService()
+    await luma.start()
+    try:
+        return await run_load(luma, args.jobs, args.concurrency, args.video_share, stats_url)
+    finally:
+        await luma.close()
+        if server is not None:
+            await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Drive LumaService with simulated generations against the mock server and report throughput"
+    )
+    parser.add_argument("--jobs", type=int, default=100, help="Generations to run (default: 100)")
+    parser.add_argument("--concurrency", type=int, default=20, help="Generations in flight at once (default: 20)")
+    parser.add_argument("--video-share", type=float, default=0.0, help="Share of jobs that are text-to-video")
+    parser.add_argument("--base-url", help="Use an already running mock at this Luma base URL instead of starting one")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    add_arguments(parser)
+    args = parser.parse_args()
+    # Keep per-request warnings (e.g. injected errors) out of the report
+    logging.basicConfig(level=logging.ERROR)
+
+    report = asyncio.run(main_async(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
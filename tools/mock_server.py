@@ -0,0 +1,433 @@
+import argparse
+import asyncio
+import io
+import itertools
+import json
+import logging
+import random
+import time
+import uuid
+from urllib.parse import parse_qsl, urlsplit
+
+from aiohttp import web
+from PIL import Image
+
+log = logging.getLogger("luma.mock")
+
+
+class Distribution:
+    """Random durations in seconds, parsed from "kind:arg,arg"
+
+    const:x, uniform:low,high, exp:mean and lognormal:median,sigma are
+    supported; a bare number means const.
+    """
+
+    def __init__(self, spec: str):
+        self.spec = spec
+        kind, _, args = spec.partition(":") if ":" in spec else ("const", "", spec)
+        self.kind = kind
+        self.args = [float(arg) for arg in args.split(",") if arg]
+
+        expected = {"const": 1, "uniform": 2, "exp": 1, "lognormal": 2}
+        if expected.get(kind) != len(self.args):
+            raise ValueError(f"Invalid distribution: {spec!r}")
+
+    def sample(self) -> float:
+        if self.kind == "const":
+            return self.args[0]
+        if self.kind == "uniform":
+            return random.uniform(*self.args)
+        if self.kind == "exp":
+            return random.expovariate(1 / self.args[0]) if self.args[0] > 0 else 0.0
+        median, sigma = self.args
+        return random.lognormvariate(0, sigma) * median if median > 0 else 0.0
+
+    def __repr__(self) -> str:
+        return f"Distribution({self.spec!r})"
+
+
+class MockGeneration:
+    """A generation whose state follows the clock from its creation time"""
+
+    def __init__(self, generation_id: str, kind: str, request: dict, queued: float, dreaming: float,
+                 fails: bool, base_url: str):
+        self.id = generation_id
+        self.kind = kind  # "image" or "video"
+        self.request = request
+        self.created_at = time.time()
+        self.dreaming_at = self.created_at + queued
+        self.finished_at = self.dreaming_at + dreaming
+        self.fails = fails
+        self.base_url = base_url
+
+    @property
+    def state(self) -> str:
+        now = time.time()
+        if now < self.dreaming_at:
+            return "queued"
+        if now < self.finished_at:
+            return "dreaming"
+        return "failed" if self.fails else "completed"
+
+    def to_dict(self) -> dict:
+        state = self.state
+        assets = None
+        if state == "completed":
+            extension = "jpg" if self.kind == "image" else "mp4"
+            assets = {self.kind: f"{self.base_url}/assets/{self.id}.{extension}"}
+        return {
+            "id": self.id,
+            "generation_type": self.kind,
+            "state": state,
+            "failure_reason": "Mock failure" if state == "failed" else None,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.created_at)),
+            "assets": assets,
+            "request": self.request
+        }
+
+
+class MockResponse:
+    """What MockLumaServer answers to one request"""
+
+    def __init__(self, status: int, data=None, body: bytes = b"", content_type: str = "application/json",
+                 headers: dict = None):
+        self.status = status
+        self.body = json.dumps(data).encode() if data is not None else body
+        self.content_type = content_type
+        self.headers = headers or {}
+
+
+class MockLumaServer:
+    """Local stand-in for the Luma generation API and the ImgBB upload API
+
+    Serves create, status, list and delete for generations, the ImgBB
+    upload endpoint and the images it hands out. Every response is
+    delayed by a sample from latency; each generation spends a sampled
+    time queued and then dreaming before it completes, or fails with
+    probability failure_rate. error_rate answers that share of requests
+    with a 500, and rate_limit (requests per second, 0 for none) answers
+    with 429 and Retry-After beyond it.
+
+    Point the bot at it with LUMA_API_BASE_URL=http://host:port/dream-machine/v1
+    and IMGBB_UPLOAD_URL=http://host:port/1/upload, or answer requests
+    without sockets by giving LumaService the session() of an unstarted server.
+    """
+
+    ROUTES = (
+        ("POST", "/dream-machine/v1/generations", "_create_video"),
+        ("POST", "/dream-machine/v1/generations/image", "_create_image"),
+        ("POST", "/dream-machine/v1/generations/video", "_create_video"),
+        ("GET", "/dream-machine/v1/generations", "_list"),
+        ("GET", "/dream-machine/v1/generations/{id}", "_status"),
+        ("DELETE", "/dream-machine/v1/generations/{id}", "_delete"),
+        ("POST", "/1/upload", "_upload"),
+        ("GET", "/images/{id}", "_image_file"),
+        ("GET", "/assets/{id}", "_image_file"),
+        ("GET", "/_stats", "_stats"),
+    )
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8765, latency: Distribution = None,
+                 image_queued: Distribution = None, image_dreaming: Distribution = None,
+                 video_queued: Distribution = None, video_dreaming: Distribution = None,
+                 failure_rate: float = 0.0, error_rate: float = 0.0, rate_limit: float = 0):
+        self.host = host
+        self.port = port
+        self.latency = latency or Distribution("0")
+        self.durations = {
+            "image": (image_queued or Distribution("uniform:1,3"), image_dreaming or Distribution("lognormal:15,0.3")),
+            "video": (video_queued or Distribution("uniform:2,10"), video_dreaming or Distribution("lognormal:90,0.3"))
+        }
+        self.failure_rate = failure_rate
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+
+        self.generations = {}
+        self.requests = {}  # "METHOD route" -> count
+        self._window = (0, 0)  # (second, requests in it) for the rate limit
+        self._image = None
+        self._runner = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def luma_url(self) -> str:
+        return f"{self.base_url}/dream-machine/v1"
+
+    @property
+    def imgbb_url(self) -> str:
+        return f"{self.base_url}/1/upload"
+
+    async def start(self):
+        if self._runner is not None:
+            return
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_route("*", "/{tail:.*}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        log.info("Mock Luma server listening", extra={"host": self.host, "port": self.port})
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def session(self) -> "InProcessSession":
+        """A client session that answers from this server in-process"""
+        return InProcessSession(self)
+
+    def stats(self) -> dict:
+        states = {}
+        for generation in self.generations.values():
+            states[generation.state] = states.get(generation.state, 0) + 1
+        return {"requests": dict(self.requests), "generations": states}
+
+    def _route(self, method: str, path: str):
+        parts = path.rstrip("/").split("/")
+        for route_method, route, handler in self.ROUTES:
+            route_parts = route.split("/")
+            if route_method != method or len(route_parts) != len(parts):
+                continue
+            if all(expected == actual or expected == "{id}" for expected, actual in zip(route_parts, parts)):
+                params = [actual for expected, actual in zip(route_parts, parts) if expected == "{id}"]
+                return f"{method} {route}", getattr(self, handler), params
+        return f"{method} {path}", None, []
+
+    def _rate_limited(self) -> bool:
+        if not self.rate_limit:
+            return False
+        second = int(time.monotonic())
+        start, count = self._window
+        if start != second:
+            start, count = second, 0
+        self._window = (start, count + 1)
+        return count >= self.rate_limit
+
+    async def dispatch(self, method: str, path: str, payload=None, form: dict = None,
+                       query: dict = None) -> MockResponse:
+        """Answer one request, applying latency and injected errors"""
+        endpoint, handler, params = self._route(method, path)
+        if endpoint == "GET /_stats":
+            return self._stats()
+
+        self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+        delay = self.latency.sample()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if handler is None:
+            return MockResponse(404, {"detail": "Not found"})
+        if self._rate_limited():
+            return MockResponse(429, {"detail": "Rate limit exceeded"}, headers={"Retry-After": "1"})
+        if random.random() < self.error_rate:
+            return MockResponse(500, {"detail": "Mock server error"})
+
+        if handler in (self._create_image, self._create_video):
+            return handler(payload)
+        if handler == self._list:
+            return handler(query or {})
+        if handler == self._upload:
+            return handler(form or {})
+        return handler(*params)
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        payload = form = None
+        if request.content_type == "application/json":
+            try:
+                payload = await request.json()
+            except ValueError:
+                payload = None
+        elif request.method == "POST":
+            form = dict(await request.post())
+
+        response = await self.dispatch(request.method, request.path, payload=payload, form=form,
+                                       query=dict(request.query))
+        return web.Response(
+            status=response.status, body=response.body, content_type=response.content_type, headers=response.headers
+        )
+
+    def _create(self, payload, kind: str) -> MockResponse:
+        if not isinstance(payload, dict) or not payload.get("prompt"):
+            return MockResponse(400, {"detail": "prompt is required"})
+
+        queued, dreaming = self.durations[kind]
+        generation = MockGeneration(
+            str(uuid.uuid4()), kind, payload, queued.sample(), dreaming.sample(),
+            random.random() < self.failure_rate, self.base_url
+        )
+        self.generations[generation.id] = generation
+        return MockResponse(201, generation.to_dict())
+
+    def _create_image(self, payload) -> MockResponse:
+        return self._create(payload, "image")
+
+    def _create_video(self, payload) -> MockResponse:
+        return self._create(payload, "video")
+
+    def _status(self, generation_id: str) -> MockResponse:
+        generation = self.generations.get(generation_id)
+        if generation is None:
+            return MockResponse(404, {"detail": "Generation not found"})
+        return MockResponse(200, generation.to_dict())
+
+    def _list(self, query: dict) -> MockResponse:
+        limit = int(query.get("limit", 100))
+        offset = int(query.get("offset", 0))
+        generations = sorted(self.generations.values(), key=lambda generation: generation.created_at, reverse=True)
+        return MockResponse(200, {
+            "has_more": offset + limit < len(generations),
+            "count": len(generations),
+            "limit": limit,
+            "offset": offset,
+            "generations": [generation.to_dict() for generation in itertools.islice(generations, offset, offset + limit)]
+        })
+
+    def _delete(self, generation_id: str) -> MockResponse:
+        if self.generations.pop(generation_id, None) is None:
+            return MockResponse(404, {"detail": "Generation not found"})
+        return MockResponse(204)
+
+    def _upload(self, form: dict) -> MockResponse:
+        if not form.get("key") or form.get("image") is None:
+            return MockResponse(400, {"success": False, "error": {"message": "Missing key or image"}})
+
+        url = f"{self.base_url}/images/{uuid.uuid4().hex[:16]}.png"
+        return MockResponse(200, {"success": True, "status": 200, "data": {"url": url, "display_url": url}})
+
+    def _image_file(self, name: str) -> MockResponse:
+        # Every image and asset is the same small PNG, which is enough for downloads and preprocessing
+        if self._image is None:
+            buffer = io.BytesIO()
+            Image.new("RGB", (64, 64), (90, 120, 200)).save(buffer, format="PNG")
+            self._image = buffer.getvalue()
+        return MockResponse(200, body=self._image, content_type="image/png")
+
+    def _stats(self) -> MockResponse:
+        return MockResponse(200, self.stats())
+
+
+class _InProcessContent:
+    def __init__(self, body: bytes):
+        self._body = body
+
+    async def iter_chunked(self, size: int):
+        for offset in range(0, len(self._body), size):
+            yield self._body[offset:offset + size]
+
+
+class _InProcessResponse:
+    def __init__(self, response: MockResponse):
+        self.status = response.status
+        self.headers = response.headers
+        self.content_type = response.content_type
+        self.content_length = len(response.body)
+        self.content = _InProcessContent(response.body)
+        self._body = response.body
+
+    async def text(self) -> str:
+        return self._body.decode()
+
+    async def json(self):
+        return json.loads(self._body)
+
+
+class _InProcessRequest:
+    def __init__(self, server: MockLumaServer, method: str, url: str, payload=None, form: dict = None):
+        self.server = server
+        self.method = method
+        self.url = url
+        self.payload = payload
+        self.form = form
+
+    async def __aenter__(self) -> _InProcessResponse:
+        parts = urlsplit(self.url)
+        response = await self.server.dispatch(
+            self.method, parts.path, payload=self.payload, form=self.form, query=dict(parse_qsl(parts.query))
+        )
+        return _InProcessResponse(response)
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+class InProcessSession:
+    """The parts of aiohttp.ClientSession LumaService uses, answered by a MockLumaServer
+
+    Request bodies are passed as Python objects; an upload's form is not
+    encoded, so the server only sees that a key and an image were sent.
+    """
+
+    def __init__(self, server: MockLumaServer):
+        self.server = server
+        self.closed = False
+
+    def request(self, method: str, url: str, json=None, data=None, **kwargs) -> _InProcessRequest:
+        form = {"key": "in-process", "image": b""} if data is not None else None
+        return _InProcessRequest(self.server, method, url, payload=json, form=form)
+
+    def get(self, url: str, **kwargs) -> _InProcessRequest:
+        return self.request("GET", url, **kwargs)
+
+    async def close(self):
+        self.closed = True
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """Mock server options, shared with the load test"""
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=Distribution, default=Distribution("lognormal:0.05,0.5"),
+                        help="Delay added to every response (default: lognormal:0.05,0.5)")
+    parser.add_argument("--image-queued", type=Distribution, default=Distribution("uniform:1,3"),
+                        help="Time an image generation stays queued (default: uniform:1,3)")
+    parser.add_argument("--image-dreaming", type=Distribution, default=Distribution("lognormal:15,0.3"),
+                        help="Time an image generation stays dreaming (default: lognormal:15,0.3)")
+    parser.add_argument("--video-queued", type=Distribution, default=Distribution("uniform:2,10"),
+                        help="Time a video generation stays queued (default: uniform:2,10)")
+    parser.add_argument("--video-dreaming", type=Distribution, default=Distribution("lognormal:90,0.3"),
+                        help="Time a video generation stays dreaming (default: lognormal:90,0.3)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of generations that fail")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with HTTP 500")
+    parser.add_argument("--rate-limit", type=float, default=0,
+                        help="Requests per second before answering 429 (default: unlimited)")
+
+
+def server_from_args(args: argparse.Namespace) -> MockLumaServer:
+    return MockLumaServer(
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        image_queued=args.image_queued,
+        image_dreaming=args.image_dreaming,
+        video_queued=args.video_queued,
+        video_dreaming=args.video_dreaming,
+        failure_rate=args.failure_rate,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit
+    )
+
+
+async def serve(server: MockLumaServer):
+    await server.start()
+    print(f"Mock Luma API:   {server.luma_url}")
+    print(f"Mock ImgBB API:  {server.imgbb_url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local mock of the Luma and ImgBB APIs")
+    add_arguments(parser)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(serve(server_from_args(args)))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import argparse
+import asyncio
+import logging
+import os
+import signal
+
+from dotenv import load_dotenv
+
+from services.job_queue import JobQueue, QueueWorker
+from services.log import setup_logging
+from services.luma_service import LumaService
+from services.metrics import MetricsServer
+from services.tracing import setup_tracing, tracer
+
+log = logging.getLogger("luma.worker")
+
+
+async def run(args: argparse.Namespace):
+    luma = LumaService()
+    luma.bind_metrics()
+    await luma.start()
+    tracer.start()
+    queue = JobQueue(args.queue)
+    worker = QueueWorker(queue, luma, concurrency=args.concurrency, lease=args.lease)
+
+    metrics_server = None
+    if os.getenv('LUMA_METRICS_PORT'):
+        metrics_server = MetricsServer(
+            host=os.getenv('LUMA_METRICS_HOST', '127.0.0.1'),
+            port=int(os.getenv('LUMA_METRICS_PORT'))
+        )
+        await metrics_server.start()
+
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, worker.stop)
+
+    try:
+        await worker.run(grace=args.grace)
+    finally:
+        if metrics_server is not None:
+            await metrics_server.stop()
+        await queue.close()
+        await luma.close()
+        await tracer.stop()
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Run generations queued by the bot in queue mode")
+    parser.add_argument("--queue", default=os.getenv('LUMA_QUEUE_PATH') or "queue.db",
+                        help="Queue file shared with the bot (default: LUMA_QUEUE_PATH or queue.db)")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv('LUMA_WORKER_CONCURRENCY', 200)),
+                        help="Queued calls run at once (default: 200)")
+    parser.add_argument("--lease", type=float, default=60,
+                        help="Seconds after which another worker takes over the calls of one that stopped")
+    parser.add_argument("--grace", type=float, default=30,
+                        help="Seconds a stopping worker lets creates in progress finish")
+    args = parser.parse_args()
+    setup_logging()
+    setup_tracing()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()